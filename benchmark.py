@@ -0,0 +1,747 @@
+#!/usr/bin/env python3
+"""
+MIG Welding Optimizer - Benchmarks
+Times the engines in welding_app.py against their reference implementations.
+
+Usage: python benchmark.py [name ...]   (no name runs everything)
+"""
+
+import asyncio
+import http.client
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import tracemalloc
+import warnings
+
+import numpy as np
+from http.server import HTTPServer
+
+import welding_app as app
+
+# sklearn warns on every ndarray transform after fitting on a DataFrame
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+
+# The app's HI formula gives ~10-20 kJ/mm at the UI's default efficiency, where
+# the demo physics clips every target to a constant. Scaling efficiency puts HI
+# back in the 0.7-1.5 band so the forests learn a real optimum to search for.
+EFFICIENCY = 0.05
+N_SAMPLES = 400
+
+
+def trained_models():
+    """Train on a demo dataset with a non-degenerate response surface."""
+    state, _ = app.train_models(app.generate_demo_data(efficiency=EFFICIENCY, n_samples=N_SAMPLES))
+    return state
+
+
+def timed(fn, *args, repeat=1):
+    """Best wall time of `repeat` runs, plus the last result."""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def peak_memory(fn, *args):
+    """Peak traced allocation (bytes) of one run, plus its result.
+
+    Tracing slows allocation-heavy code, so time with `timed` separately.
+    """
+    tracemalloc.start()
+    result = fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, result
+
+
+def same_result(a, b):
+    return (a['success'] == b['success']
+            and a.get('top5') == b.get('top5')
+            and a['statistics'] == b['statistics'])
+
+
+GRID = {'max_heat_input': 1.2, 'efficiency': EFFICIENCY,
+        'current_min': 70, 'current_max': 150, 'speed_min': 80, 'speed_max': 150}
+FINE_GRID = dict(GRID, current_min=50, current_max=200, speed_min=50, speed_max=300)
+
+
+def bench_optimizer(models):
+    """Per-point loop vs. vectorized grid evaluation across grid sizes."""
+    print('\n== optimizer: loop vs vectorized ==')
+    print(f"{'step':>5} {'points':>8} {'loop s':>9} {'vector s':>9} {'speedup':>8}  same")
+    for step in [20, 10, 5, 2]:
+        params = app.parse_optimize_request(dict(GRID, step=step))
+        t_loop, r_loop = timed(app.optimize_loop, params, models)
+        t_vec, r_vec = timed(app.optimize_vectorized, params, models, repeat=3)
+        points = r_vec['statistics']['total_scanned']
+        print(f'{step:>5} {points:>8} {t_loop:>9.3f} {t_vec:>9.3f} {t_loop / t_vec:>7.0f}x  '
+              f'{same_result(r_loop, r_vec)}')
+
+    # Loop is too slow past this point; show the vectorized engine alone
+    for step in [1]:
+        params = app.parse_optimize_request(dict(FINE_GRID, step=step))
+        t_vec, r_vec = timed(app.optimize_vectorized, params, models, repeat=3)
+        points = r_vec['statistics']['total_scanned']
+        print(f'{step:>5} {points:>8} {"-":>9} {t_vec:>9.3f} {"-":>8}')
+
+
+def bench_chunked(models):
+    """Peak memory of whole-grid vs. chunked evaluation as the grid gets finer."""
+    print('\n== optimizer: vectorized vs chunked peak memory ==')
+    print(f"{'step':>5} {'points':>9} {'vector s':>9} {'vector MB':>10} "
+          f"{'chunked s':>10} {'chunked MB':>11}  same")
+    for step in [2, 1, 0.5, 0.25]:
+        params = app.parse_optimize_request(dict(FINE_GRID, step=step))
+        t_vec, r_vec = timed(app.optimize_vectorized, params, models)
+        t_chk, r_chk = timed(app.optimize_chunked, params, models)
+        m_vec, _ = peak_memory(app.optimize_vectorized, params, models)
+        m_chk, _ = peak_memory(app.optimize_chunked, params, models)
+        points = r_chk['statistics']['total_scanned']
+        print(f'{step:>5} {points:>9} {t_vec:>9.3f} {m_vec / 1e6:>10.1f} '
+              f'{t_chk:>10.3f} {m_chk / 1e6:>11.1f}  {same_result(r_vec, r_chk)}')
+
+
+def bench_parallel(models):
+    """Six-input sweep throughput as the process pool grows."""
+    print('\n== optimizer: parallel six-input sweep ==')
+    sweep = dict(GRID, step=1, voltage_min=20, voltage_max=25, voltage_step=1,
+                 interpass_min=20, interpass_max=80, interpass_step=20,
+                 efficiency_min=0.04, efficiency_max=0.06, efficiency_step=0.01)
+    params = app.parse_optimize_request(sweep)
+    t_vec, r_vec = timed(app.optimize_chunked, params, models)
+    points = r_vec['statistics']['total_scanned']
+    print(f'{points} points, single-process chunked: {t_vec:.2f} s ({points / t_vec:,.0f} pts/s)')
+    print(f"{'workers':>8} {'time s':>8} {'pts/s':>12} {'scaling':>8}  same")
+    for workers in sorted({min(n, app.MAX_WORKERS) for n in (1, 2, 4, app.MAX_WORKERS)}):
+        params['workers'] = workers
+        app.optimize_parallel(params, models)  # warm the pool: fork + model hand-off
+        t_par, r_par = timed(app.optimize_parallel, params, models)
+        print(f'{workers:>8} {t_par:>8.2f} {points / t_par:>12,.0f} {t_vec / t_par:>7.2f}x  '
+              f'{same_result(r_vec, r_par)}')
+
+
+def bench_adaptive(models):
+    """Adaptive coarse-to-fine search vs. the exhaustive scan."""
+    print('\n== optimizer: adaptive vs exhaustive ==')
+    print(f"{'step':>5} {'grid':>8} {'exh evals':>10} {'adapt evals':>12} {'saved':>7} "
+          f"{'exh s':>7} {'adapt s':>8} {'gap MPa':>8}  same optimum")
+    for step in [2, 1, 0.5, 0.25]:
+        params = app.parse_optimize_request(dict(FINE_GRID, step=step))
+        t_exh, r_exh = timed(app.optimize_chunked, params, models)
+        t_ada, r_ada = timed(app.optimize_adaptive, params, models)
+        stats = r_ada['statistics']
+        gap = r_exh['optimal']['Pred_Tensile_MPa'] - r_ada['optimal']['Pred_Tensile_MPa']
+        print(f"{step:>5} {stats['grid_points']:>8} {stats['exhaustive_model_evaluations']:>10} "
+              f"{stats['model_evaluations']:>12} "
+              f"{stats['evaluations_saved'] / stats['exhaustive_model_evaluations']:>6.1%} "
+              f"{t_exh:>7.2f} {t_ada:>8.2f} {gap:>8.3f}  {r_exh['optimal'] == r_ada['optimal']}")
+
+
+def bench_evolution(models):
+    """Continuous differential evolution vs. ever finer exhaustive grids."""
+    print('\n== optimizer: differential evolution vs grid ==')
+    print(f"{'search':>12} {'evals':>9} {'time s':>7} {'tensile MPa':>12}")
+    for step in [2, 1, 0.5, 0.25]:
+        params = app.parse_optimize_request(dict(FINE_GRID, step=step))
+        t_grid, r_grid = timed(app.optimize_chunked, params, models)
+        evals = r_grid['statistics']['total_scanned'] - r_grid['statistics']['rejected_hi']
+        print(f"{'grid ' + str(step):>12} {evals:>9} {t_grid:>7.2f} "
+              f"{r_grid['optimal']['Pred_Tensile_MPa']:>12.3f}")
+    for seed in [1, 2, 3]:
+        params = app.parse_optimize_request(dict(FINE_GRID, seed=seed))
+        t_de, r_de = timed(app.optimize_evolution, params, models)
+        print(f"{'DE seed ' + str(seed):>12} {r_de['statistics']['model_evaluations']:>9} {t_de:>7.2f} "
+              f"{r_de['optimal']['Pred_Tensile_MPa']:>12.3f}")
+
+
+def bench_pareto(models):
+    """Non-dominated sort time on synthetic and real forest objectives."""
+    print('\n== pareto: non-dominated sort ==')
+    print(f"{'objectives':>22} {'rows':>9} {'front':>7} {'sort s':>8}")
+    rng = np.random.default_rng(0)
+    for n in [10_000, 100_000, 1_000_000]:
+        x = rng.random((n, 2))
+        cases = {
+            'uniform random': rng.random((n, 3)),
+            'anti-correlated': np.column_stack([x, 2 - x.sum(axis=1) + 0.1 * rng.random(n)])
+        }
+        for name, obj in cases.items():
+            t_sort, front = timed(app.pareto_front, obj)
+            print(f'{name:>22} {n:>9} {len(front):>7} {t_sort:>8.3f}')
+
+    params = app.parse_optimize_request(dict(FINE_GRID, step=0.25))
+    scored = app.collect_grid(params, models)
+    obj = np.column_stack([scored['tensile'], -np.abs(scored['pen'] - 3.5), params['max_hi'] - scored['hi']])
+    t_sort, front = timed(app.pareto_front, obj)
+    print(f"{'forest grid step 0.25':>22} {len(obj):>9} {len(front):>7} {t_sort:>8.3f}")
+
+
+def bench_cube(models):
+    """Optimize answered from the precomputed prediction cube vs. scanning the forests."""
+    print('\n== optimizer: prediction cube vs model scan ==')
+    t_build, cube = timed(app.build_prediction_cube, models, {'efficiency': EFFICIENCY})
+    summary = app.cube_summary(cube)
+    print(f"cube {summary['shape']}: {summary['points']} points, "
+          f"{summary['bytes'] / 1e6:.1f} MB, built in {t_build:.2f} s")
+    cubed = dict(models, cube=cube)
+    print(f"{'step':>5} {'points':>9} {'model ms':>9} {'cube ms':>8} {'speedup':>8}  same ranking")
+    for step in [5, 2, 1]:
+        data = dict(FINE_GRID, step=step)
+        t_mod, r_mod = timed(app.run_optimizer, data, models, repeat=3)
+        t_cube, r_cube = timed(app.run_optimizer, data, cubed, repeat=3)
+        # Cube predictions are float32, so compare the ranked grid points
+        key = [(r['Current_A'], r['Speed_mm_min'], r['Filler_Type']) for r in r_mod['top5']]
+        same = (r_cube.get('source') == 'cube' and r_mod['statistics'] == r_cube['statistics']
+                and key == [(r['Current_A'], r['Speed_mm_min'], r['Filler_Type']) for r in r_cube['top5']])
+        print(f"{step:>5} {r_cube['statistics']['total_scanned']:>9} {t_mod * 1e3:>9.1f} "
+              f"{t_cube * 1e3:>8.1f} {t_mod / t_cube:>7.0f}x  {same}")
+
+
+def bench_batch(models):
+    """Per-row latency of /api/predict-style single calls vs. predict_rows batches."""
+    print('\n== predict: single vs batch ==')
+    rng = np.random.default_rng(0)
+    n_single = 200
+    rows = [{'current': c, 'speed': s, 'efficiency': EFFICIENCY}
+            for c, s in zip(rng.uniform(70, 150, n_single), rng.uniform(80, 150, n_single))]
+    t0 = time.perf_counter()
+    for row in rows:
+        app.predict_rows(app.pd.DataFrame([row]), models)
+    per_row = (time.perf_counter() - t0) / n_single
+    print(f'single-row calls: {per_row * 1e6:>9.1f} us/row')
+    print(f"{'rows':>8} {'time ms':>9} {'us/row':>9} {'speedup':>8}")
+    for n in [100, 1_000, 10_000, 100_000]:
+        body = app.json.dumps({'current': rng.uniform(70, 150, n).tolist(),
+                               'speed': rng.uniform(80, 150, n).tolist(),
+                               'efficiency': [EFFICIENCY] * n}).encode()
+        t_batch, _ = timed(lambda: app.predict_rows(app.parse_batch(body), models), repeat=3)
+        print(f'{n:>8} {t_batch * 1e3:>9.1f} {t_batch / n * 1e6:>9.1f} {per_row / (t_batch / n):>7.0f}x')
+
+
+def bench_flat(models):
+    """sklearn forest predict vs. the flat-array engine, single rows and batches."""
+    print('\n== predict: sklearn vs flat forest engine ==')
+    sk_models = dict(models, flat=None)
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.uniform(70, 150, 5000), rng.uniform(20, 26, 5000), rng.uniform(80, 150, 5000),
+                         rng.integers(0, 2, 5000), rng.uniform(20, 80, 5000), rng.uniform(0.5, 1.5, 5000)])
+    flat = models['flat']
+    scaled = (X - flat['mean']) / flat['scale']
+
+    def engine_predict(rows):
+        return flat['tensile'].predict(rows), flat['penetration'].predict(rows)
+
+    def sklearn_predict(rows):
+        return models['tensile_model'].predict(rows), models['penetration_model'].predict(rows)
+
+    latencies = {'sklearn': [], 'flat': []}
+    for i in range(200):
+        for name, engine_models in [('sklearn', sk_models), ('flat', models)]:
+            t0 = time.perf_counter()
+            app.predict_batch(X[i:i + 1], engine_models)
+            latencies[name].append(time.perf_counter() - t0)
+    p50 = {name: np.percentile(values, 50) for name, values in latencies.items()}
+    p99 = {name: np.percentile(values, 99) for name, values in latencies.items()}
+    print(f"single row (scale + 2 forests): sklearn p50 {p50['sklearn'] * 1e3:.2f} ms "
+          f"p99 {p99['sklearn'] * 1e3:.2f} ms | flat p50 {p50['flat'] * 1e3:.3f} ms "
+          f"p99 {p99['flat'] * 1e3:.3f} ms | {p50['sklearn'] / p50['flat']:.0f}x")
+
+    print(f"{'rows':>6} {'sklearn ms':>11} {'flat ms':>8} {'ratio':>6}  bit-identical")
+    for n in [1, 10, 100, 256, 1000, 5000]:
+        t_sk, r_sk = timed(sklearn_predict, scaled[:n], repeat=3)
+        t_fl, r_fl = timed(engine_predict, scaled[:n], repeat=3)
+        same = all(np.array_equal(a, b) for a, b in zip(r_sk, r_fl))
+        print(f'{n:>6} {t_sk * 1e3:>11.2f} {t_fl * 1e3:>8.2f} {t_sk / t_fl:>5.1f}x  {same}')
+
+
+def bench_multi(models):
+    """Two single-target forests vs. one multi-output forest: accuracy, training and latency."""
+    print('\n== model: separate vs multi-output forest ==')
+    print(f"{'samples':>8} {'mode':>9} {'R2 tensile':>11} {'R2 pen':>7} {'train s':>8} "
+          f"{'1 row ms':>9} {'grid s':>7}")
+    grid = app.parse_optimize_request(dict(FINE_GRID, step=1))
+    row = np.array([[110, 22, 110, 0, 50, 0.9]])
+    for n_samples in [80, N_SAMPLES, 2000]:
+        data = app.generate_demo_data(efficiency=EFFICIENCY, n_samples=n_samples)
+        for mode in ['separate', 'multi']:
+            t_train, (state, cv) = timed(app.train_models, data, app.INFERENCE_ENGINE, mode)
+            t_row, _ = timed(app.predict_batch, row, state, repeat=50)
+            t_grid, _ = timed(app.optimize_vectorized, grid, state)
+            print(f"{n_samples:>8} {mode:>9} {cv['tensile_mean']:>11.4f} {cv['pen_mean']:>7.4f} "
+                  f"{t_train:>8.2f} {t_row * 1e3:>9.3f} {t_grid:>7.2f}")
+
+
+def bench_training(models):
+    """Training wall time as fits and CV folds spread over more threads."""
+    print(f'\n== training: serial vs parallel ({os.cpu_count()} cores, budget {app.TRAINING_CORES}) ==')
+    print(f"{'samples':>8} {'n_jobs':>7} {'train s':>8} {'speedup':>8}  same CV")
+    for n_samples in [2000, 5000]:
+        data = app.generate_demo_data(efficiency=EFFICIENCY, n_samples=n_samples)
+        t_serial, (_, cv_serial) = timed(app.train_models, data)
+        print(f'{n_samples:>8} {1:>7} {t_serial:>8.2f} {1:>7.2f}x')
+        for n_jobs in sorted({2, 4, os.cpu_count() or 1} - {1}):
+            t_par, (_, cv_par) = timed(app.train_models, data, app.INFERENCE_ENGINE, app.MODEL_MODE,
+                                       app._no_progress, n_jobs)
+            print(f'{n_samples:>8} {n_jobs:>7} {t_par:>8.2f} {t_serial / t_par:>7.2f}x  {cv_par == cv_serial}')
+
+
+def bench_incremental(models):
+    """Folding a shift of new welds in: warm-start trees vs. full retrain."""
+    print('\n== training: incremental append vs full retrain ==')
+    print(f"{'base':>6} {'new':>5} {'mode':>12} {'time s':>7} {'trees':>6} {'holdout R2 t':>13} {'R2 pen':>7}")
+    for n_base, n_new in [(2000, 200), (5000, 200)]:
+        records = app.generate_demo_data(efficiency=EFFICIENCY, n_samples=n_base + n_new + 1000)
+        dataset, holdout = records[:n_base + n_new], records[n_base + n_new:]
+        X_hold, t_hold, p_hold = app._prepare(holdout)
+        base, _ = app.train_models(dataset[:n_base], validation='oob')
+        runs = {
+            'incremental': lambda: app.update_models(base, dataset, n_new)[0],
+            'full': lambda: app.train_models(dataset, validation='oob')[0]
+        }
+        for mode, run in runs.items():
+            t_run, state = timed(run)
+            pred_t, pred_p = app.predict_batch(X_hold.to_numpy(dtype=float), state)
+            forest = state['joint_model'] or state['tensile_model']
+            print(f'{n_base:>6} {n_new:>5} {mode:>12} {t_run:>7.2f} {len(forest.estimators_):>6} '
+                  f'{app.r2_score(t_hold, pred_t):>13.4f} {app.r2_score(p_hold, pred_p):>7.4f}')
+
+
+def bench_dataset(models):
+    """Server-side dataset: parsed JSON records vs. typed columns."""
+    print('\n== dataset: list of dicts vs columnar ==')
+    print(f"{'rows':>7} {'dicts MB':>9} {'columns MB':>11} {'ratio':>6} {'ingest ms':>10} "
+          f"{'append ms':>10} {'prepare ms':>11} {'list ms':>8}")
+    for n_samples in [10_000, 100_000]:
+        body = app.json.dumps(app.generate_demo_data(efficiency=EFFICIENCY, n_samples=n_samples))
+        dict_bytes, records = peak_memory(app.json.loads, body)
+        t_ingest, dataset = timed(app.WeldDataset.from_records, records)
+        # A re-sent shift: the last 10% again, all of it dropped as duplicates
+        resent = app.WeldDataset.from_records(records[-n_samples // 10:])
+        t_append, (_, added) = timed(dataset.append, resent)
+        assert added == 0
+        t_cols, _ = timed(app._prepare, dataset)
+        t_list, _ = timed(lambda: app.pd.DataFrame(records))
+        print(f'{n_samples:>7} {dict_bytes / 1e6:>9.1f} {dataset.nbytes / 1e6:>11.2f} '
+              f'{dict_bytes / dataset.nbytes:>5.0f}x {t_ingest * 1e3:>10.1f} {t_append * 1e3:>10.1f} '
+              f'{t_cols * 1e3:>11.2f} {t_list * 1e3:>8.1f}')
+
+
+def bench_upload(models):
+    """CSV ingest: one JSON body of records vs. the streamed /api/upload-csv path."""
+    print('\n== upload: JSON body vs streamed CSV (in memory / to a store) ==')
+    print(f"{'rows':>8} {'CSV MB':>7} {'json peak MB':>13} {'json s':>7} {'stream peak MB':>15} "
+          f"{'of which data':>14} {'stream s':>9} {'disk peak MB':>13} {'disk s':>7}")
+    for n_samples in [100_000, 500_000]:
+        records = app.generate_demo_data(efficiency=EFFICIENCY, n_samples=n_samples)
+        body = app.json.dumps({'data': records}).encode('utf-8')
+        del records
+
+        def from_json():
+            return app.as_dataset(app.json.loads(body)['data'])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'welds.csv')
+            app.pd.DataFrame(from_json().records()).to_csv(path, index=False)
+            size = os.path.getsize(path)
+
+            def streamed(target=None):
+                if target is not None:
+                    shutil.rmtree(target, ignore_errors=True)
+                with open(path, 'rb', buffering=0) as f:
+                    return app.read_csv_dataset(app.io.BufferedReader(app.BodyReader(f, size)), path=target)[0]
+
+            def to_disk():
+                return streamed(os.path.join(tmp, 'dataset'))
+
+            # The JSON path also holds the whole body, which the handler reads first
+            json_peak, _ = peak_memory(from_json)
+            stream_peak, dataset = peak_memory(streamed)
+            disk_peak, _ = peak_memory(to_disk)
+            t_json, _ = timed(from_json)
+            t_stream, _ = timed(streamed)
+            t_disk, _ = timed(to_disk)
+        print(f'{n_samples:>8} {size / 1e6:>7.1f} {(json_peak + len(body)) / 1e6:>13.1f} {t_json:>7.2f} '
+              f'{stream_peak / 1e6:>15.1f} {dataset.nbytes / 1e6:>14.1f} {t_stream:>9.2f} '
+              f'{disk_peak / 1e6:>13.1f} {t_disk:>7.2f}')
+
+
+def bench_outofcore(models):
+    """Out-of-core training under memory ceilings vs. in-memory, same held-out welds."""
+    print('\n== training: out-of-core vs in-memory ==')
+    print(f"{'mode':>14} {'rounds':>7} {'rows/round':>11} {'peak MB':>8} {'time s':>7} "
+          f"{'R2 t':>7} {'R2 pen':>7} {'dR2 t':>7} {'dR2 pen':>8}")
+    records = app.generate_demo_data(efficiency=EFFICIENCY, n_samples=25000)
+    X_hold, t_hold, p_hold = app._prepare(records[20000:])
+
+    def holdout_r2(state):
+        pred_t, pred_p = app.predict_batch(X_hold.to_numpy(dtype=float), state)
+        return app.r2_score(t_hold, pred_t), app.r2_score(p_hold, pred_p)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.as_dataset(records[:20000]).save(os.path.join(tmp, 'dataset'))
+        dataset = app.WeldDataset.load(os.path.join(tmp, 'dataset'))  # memory-mapped
+        t_full, (full, _) = timed(app.train_models, dataset, app.INFERENCE_ENGINE, app.MODEL_MODE,
+                                  app._no_progress, 1, 'oob')
+        peak_full, _ = peak_memory(app.train_models, dataset, app.INFERENCE_ENGINE, app.MODEL_MODE,
+                                   app._no_progress, 1, 'oob')
+        r2_full = holdout_r2(full)
+        print(f"{'in-memory':>14} {1:>7} {len(dataset):>11} {peak_full / 1e6:>8.1f} {t_full:>7.2f} "
+              f'{r2_full[0]:>7.4f} {r2_full[1]:>7.4f}')
+        for memory_mb in [200, 50, 10]:
+            plan = app.out_of_core_plan(len(dataset), memory_mb)
+            t_ooc, (state, _) = timed(app.train_out_of_core, dataset, memory_mb)
+            peak_ooc, _ = peak_memory(app.train_out_of_core, dataset, memory_mb)
+            r2 = holdout_r2(state)
+            print(f"{f'ooc {memory_mb} MB':>14} {plan['rounds']:>7} {plan['rows_per_round']:>11} "
+                  f'{peak_ooc / 1e6:>8.1f} {t_ooc:>7.2f} {r2[0]:>7.4f} {r2[1]:>7.4f} '
+                  f'{r2[0] - r2_full[0]:>+7.4f} {r2[1] - r2_full[1]:>+8.4f}')
+
+
+class QuietHandler(app.RequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _post(base, path, body):
+    request = urllib.request.Request(base + path, data=app.json.dumps(body).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return app.json.loads(response.read())
+
+
+def bench_serving(models):
+    """Predict latency while one slow /api/optimize runs, per server type."""
+    print('\n== serving: predict latency during a slow optimize ==')
+    print(f"{'server':>8} {'optimize':>9} {'predicts':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'opt s':>6}")
+    app.swap_models(models)
+    slow = {'mode': 'loop', 'step': 1, 'max_heat_input': 100}  # ~17k points, one predict each
+    servers = {
+        'single': lambda: HTTPServer(('127.0.0.1', 0), QuietHandler),
+        'pooled': lambda: app.PooledHTTPServer(('127.0.0.1', 0), QuietHandler)
+    }
+    for name, make in servers.items():
+        server = make()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+        for busy in (False, True):
+            app.RESULT_CACHE.clear()
+            done = threading.Event()
+            opt = {}
+
+            def optimize():
+                t0 = time.perf_counter()
+                _post(base, '/api/optimize', slow)
+                opt['s'] = time.perf_counter() - t0
+                done.set()
+
+            def client(seed, latencies):
+                rng = np.random.default_rng(seed)
+                while not done.is_set():
+                    t0 = time.perf_counter()
+                    # Distinct inputs, so every request misses the result cache
+                    _post(base, '/api/predict', {'current': float(rng.uniform(80, 150))})
+                    latencies.append(time.perf_counter() - t0)
+                    time.sleep(0.02)  # operators, not a flood
+
+            latencies = [[] for _ in range(4)]
+            clients = [threading.Thread(target=client, args=(i, latencies[i])) for i in range(4)]
+            if busy:
+                threading.Thread(target=optimize).start()
+                time.sleep(0.1)
+            else:
+                threading.Timer(3.0, done.set).start()
+            for c in clients:
+                c.start()
+            for c in clients:
+                c.join()
+            lat = np.concatenate([np.asarray(l) for l in latencies]) * 1e3
+            print(f"{name:>8} {'running' if busy else 'idle':>9} {len(lat):>9} {np.percentile(lat, 50):>8.1f} "
+                  f"{np.percentile(lat, 99):>8.1f} {lat.max():>8.1f} {opt.get('s', 0):>6.2f}")
+        server.shutdown()
+        server.server_close()
+
+    # Overload: more simultaneous requests than threads plus queue slots
+    server = app.PooledHTTPServer(('127.0.0.1', 0), QuietHandler, threads=2, queue_size=4)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    codes = []
+
+    def burst(i):
+        try:
+            _post(base, '/api/optimize', dict(slow, step=5, current_min=80 + i % 10))
+            codes.append(200)
+        except urllib.error.HTTPError as e:
+            codes.append(e.code)
+
+    burst_threads = [threading.Thread(target=burst, args=(i,)) for i in range(40)]
+    for t in burst_threads:
+        t.start()
+    for t in burst_threads:
+        t.join()
+    server.shutdown()
+    server.server_close()
+    print(f'burst of 40 on 2 threads + 4 queued: {codes.count(200)} served, {codes.count(503)} got 503 '
+          f'({server.rejected} rejected)')
+
+
+def _predict_load(base, seconds, seed):
+    """One client: back-to-back uncached predicts for `seconds`; returns latencies."""
+    rng = np.random.default_rng(seed)
+    latencies = []
+    stop = time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        t0 = time.perf_counter()
+        _post(base, '/api/predict', {'current': float(rng.uniform(80, 150))})
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def _memory_kb(pid):
+    """(RSS, PSS) in kB; PSS splits shared pages between the processes using them."""
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        fields = dict(line.split(':', 1) for line in f if ':' in line)
+    return int(fields['Rss'].split()[0]), int(fields['Pss'].split()[0])
+
+
+def bench_prefork(models):
+    """Predict throughput and memory: one process vs pre-forked workers."""
+    print(f'\n== serving: pre-forked workers ({os.cpu_count()} cores) ==')
+    print(f"{'processes':>9} {'clients':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'RSS MB/worker':>14} {'PSS MB/worker':>14}")
+    from concurrent.futures import ProcessPoolExecutor
+    with tempfile.TemporaryDirectory() as tmp:
+        app.save_models(models, tmp)
+        with open(os.path.join(tmp, 'LATEST'), 'w') as f:
+            f.write(models['version'])
+        for processes in sorted({1, 2, 4, os.cpu_count() or 1}):
+            with socket.socket() as s:
+                s.bind(('127.0.0.1', 0))
+                port = s.getsockname()[1]
+            code = (f'import welding_app as app; '
+                    f'app.run_server({port}, model_dir={tmp!r}, processes={processes}, open_browser=False)')
+            server = subprocess.Popen([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            base = f'http://127.0.0.1:{port}'
+            for _ in range(200):
+                try:
+                    urllib.request.urlopen(base + '/api/check-model').read()
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            clients = 2 * processes
+            with ProcessPoolExecutor(clients) as pool:
+                runs = [pool.submit(_predict_load, base, 3.0, seed) for seed in range(clients)]
+                lat = np.concatenate([np.asarray(run.result()) for run in runs]) * 1e3
+            pids = [int(pid) for pid in subprocess.run(['pgrep', '-P', str(server.pid)], capture_output=True,
+                                                         text=True).stdout.split()] or [server.pid]
+            rss, pss = np.mean([_memory_kb(pid) for pid in pids], axis=0) / 1024
+            server.send_signal(2)
+            server.wait()
+            print(f'{processes:>9} {clients:>8} {len(lat) / 3.0:>8.0f} {np.percentile(lat, 50):>8.1f} '
+                  f'{np.percentile(lat, 99):>8.1f} {rss:>14.1f} {pss:>14.1f}')
+
+
+def _rss_kb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+
+
+def _idle_connections(port, n):
+    """n keep-alive connections that each make one request and then sit idle."""
+    request = b'GET /api/check-model HTTP/1.1\r\nHost: bench\r\n\r\n'
+    conns = []
+    for _ in range(n):
+        conn = socket.create_connection(('127.0.0.1', port))
+        conn.sendall(request)
+        conns.append(conn)
+    for conn in conns:
+        conn.settimeout(5)
+        conn.recv(65536)
+    return conns
+
+
+async def _until_connections_closed(server):
+    server.close()
+    while len(asyncio.all_tasks()) > 1:
+        await asyncio.sleep(0.05)
+
+
+def bench_asyncio(models):
+    """Idle keep-alive connections: memory per connection and predict latency beside them."""
+    print('\n== serving: asyncio server with idle keep-alive connections ==')
+    print(f"{'server':>8} {'idle conns':>11} {'KB/conn':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    app.swap_models(models)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    server = asyncio.run_coroutine_threadsafe(app.serve_async('127.0.0.1', 0), loop).result()
+    port = server.sockets[0].getsockname()[1]
+    rng = np.random.default_rng(0)
+    for n in [0, 1000, min(5000, hard // 2 - 100)]:
+        rss0 = _rss_kb()
+        idle = _idle_connections(port, n)
+        per_conn = (_rss_kb() - rss0) / n if n else 0.0
+        client = http.client.HTTPConnection('127.0.0.1', port)
+        lat = []
+        for _ in range(300):
+            body = app.json.dumps({'current': float(rng.uniform(80, 150))})
+            t0 = time.perf_counter()
+            client.request('POST', '/api/predict', body, {'Content-Type': 'application/json'})
+            assert app.json.loads(client.getresponse().read())['success']
+            lat.append(time.perf_counter() - t0)
+        client.close()
+        lat = np.asarray(lat) * 1e3
+        print(f"{'asyncio':>8} {n:>11} {per_conn:>8.1f} {np.percentile(lat, 50):>8.2f} {np.percentile(lat, 99):>8.2f}")
+        for conn in idle:
+            conn.close()
+    asyncio.run_coroutine_threadsafe(_until_connections_closed(server), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+    # The thread pool serves one connection per thread, so idle clients that
+    # connected but have not sent a request yet starve it
+    pooled = app.PooledHTTPServer(('127.0.0.1', 0), QuietHandler)
+    pooled.handle_error = lambda request, client_address: None  # the timed-out client hangs up
+    threading.Thread(target=pooled.serve_forever, daemon=True).start()
+    parked = [socket.create_connection(pooled.server_address) for _ in range(app.SERVER_THREADS)]
+    try:
+        urllib.request.urlopen(f'http://127.0.0.1:{pooled.server_address[1]}/api/check-model', timeout=2).read()
+        outcome = 'served'
+    except OSError:
+        outcome = 'timed out after 2 s'
+    print(f'pooled threads with {len(parked)} parked connections: check-model {outcome}')
+    for conn in parked:
+        conn.close()
+    pooled.shutdown()
+    pooled.server_close()
+    resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+
+def bench_http(models):
+    """Page delivery (bytes per load), and API latency per connection model beside idle clients."""
+    print('\n== serving: page encoding, revalidation and connections ==')
+    app.swap_models(models)
+    server = app.PooledHTTPServer(('127.0.0.1', 0), QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    print(f"{'page load':>24} {'status':>7} {'bytes':>8} {'ms':>7}")
+    etag = app.UI_PAGE['gzip'][1]
+    cases = [('uncompressed', {}), ('gzip', {'Accept-Encoding': 'gzip'}),
+             ('revalidate (304)', {'Accept-Encoding': 'gzip', 'If-None-Match': etag})]
+    if 'br' in app.UI_PAGE:
+        cases.insert(2, ('brotli', {'Accept-Encoding': 'br, gzip'}))
+    for label, headers in cases:
+        client = http.client.HTTPConnection('127.0.0.1', port)
+        t0 = time.perf_counter()
+        for _ in range(50):
+            client.request('GET', '/', headers=headers)
+            response = client.getresponse()
+            body = response.read()
+        elapsed = (time.perf_counter() - t0) / 50
+        client.close()
+        print(f'{label:>24} {response.status:>7} {len(body):>8} {elapsed * 1e3:>7.2f}')
+
+    # The threaded servers close every connection after one response; the
+    # asyncio server keeps them open. Both with 8 idle clients connected, as
+    # a couple of browser tabs would leave.
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    async_server = asyncio.run_coroutine_threadsafe(app.serve_async('127.0.0.1', 0), loop).result()
+    print(f"{'predict, 8 idle clients':>24} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    rng = np.random.default_rng(0)
+    for label, target in [('pooled, HTTP/1.0', port),
+                          ('asyncio, keep-alive', async_server.sockets[0].getsockname()[1])]:
+        idle = _idle_connections(target, app.SERVER_THREADS)
+        client = http.client.HTTPConnection('127.0.0.1', target)
+        lat = []
+        for _ in range(500):
+            body = app.json.dumps({'current': float(rng.uniform(80, 150))})
+            t0 = time.perf_counter()
+            client.request('POST', '/api/predict', body, {'Content-Type': 'application/json'})
+            assert app.json.loads(client.getresponse().read())['success']
+            lat.append(time.perf_counter() - t0)
+        client.close()
+        for conn in idle:
+            conn.close()
+        lat = np.asarray(lat) * 1e3
+        print(f'{label:>24} {np.percentile(lat, 50):>8.2f} {np.percentile(lat, 99):>8.2f} {lat.max():>8.2f}')
+    asyncio.run_coroutine_threadsafe(_until_connections_closed(async_server), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    server.shutdown()
+    server.server_close()
+
+
+def bench_json(models):
+    """Response encoding: stdlib json vs orjson, list-of-dicts vs columnar bodies."""
+    print('\n== json: response encoding ==')
+    print(f"{'response':>26} {'format':>8} {'encoder':>8} {'bytes':>10} {'encode ms':>10}")
+    app.swap_models(models)
+    grid = dict(FINE_GRID, step=0.25)
+    demo = app.generate_demo_data(efficiency=EFFICIENCY, n_samples=20_000)
+    batch = {'current': np.linspace(80, 150, 100_000), 'speed': np.linspace(80, 200, 100_000)}
+    batch = app.predict_rows(app.parse_batch(app.json.dumps({k: v.tolist() for k, v in batch.items()}).encode(),
+                                             'application/json'), models)
+    optimized = app.run_optimizer(FINE_GRID, models)
+    cases = [
+        ('optimize', 'rows', optimized),
+        ('optimize', 'columns', dict(optimized, top5=app.records_to_columns(optimized['top5']))),
+        ('pareto step 0.25', 'rows', app.run_pareto(grid, models)),
+        ('pareto step 0.25', 'columns', app.run_pareto(dict(grid, columnar=True), models)),
+        ('generate-demo 80', 'rows', {'data': demo[:80]}),
+        ('generate-demo 80', 'columns', {'columns': app.records_to_columns(demo[:80])}),
+        ('generate-demo 20k', 'rows', {'data': demo}),
+        ('generate-demo 20k', 'columns', {'columns': app.records_to_columns(demo)}),
+        ('predict-batch 100k', 'columns', batch),
+    ]
+    # Before this encoder layer: json.dumps with default separators, arrays as lists
+    old = lambda data: app.json.dumps(data, default=app._json_default).encode('utf-8')
+    encoders = [('old', old)] + [(name, app.JSON_ENCODERS[name]) for name in app.JSON_ENCODERS]
+    for response, fmt, data in cases:
+        for name, encode in encoders:
+            if name == 'old' and fmt == 'columns' and response != 'predict-batch 100k':
+                continue  # those responses were only ever lists of dicts
+            t, body = timed(encode, data, repeat=5)
+            print(f'{response:>26} {fmt:>8} {name:>8} {len(body):>10} {t * 1e3:>10.2f}')
+
+
+BENCHMARKS = {
+    'optimizer': bench_optimizer,
+    'chunked': bench_chunked,
+    'parallel': bench_parallel,
+    'adaptive': bench_adaptive,
+    'evolution': bench_evolution,
+    'pareto': bench_pareto,
+    'cube': bench_cube,
+    'batch': bench_batch,
+    'flat': bench_flat,
+    'multi': bench_multi,
+    'training': bench_training,
+    'incremental': bench_incremental,
+    'dataset': bench_dataset,
+    'upload': bench_upload,
+    'outofcore': bench_outofcore,
+    'serving': bench_serving,
+    'prefork': bench_prefork,
+    'asyncio': bench_asyncio,
+    'http': bench_http,
+    'json': bench_json,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    models = trained_models()
+    for name in names:
+        BENCHMARKS[name](models)
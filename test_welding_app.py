@@ -0,0 +1,453 @@
+"""Tests for welding_app.
+
+Run with `python -m pytest -q`.
+"""
+import asyncio
+import gzip
+import http.client
+import io
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import welding_app as app
+
+# sklearn warns on every ndarray transform after fitting on a DataFrame
+pytestmark = pytest.mark.filterwarnings('ignore:X does not have valid feature names')
+
+
+# A small grid that still has rows rejected for heat input and for penetration
+GRID = {
+    'max_heat_input': 1.2, 'plate_thickness': 3.0, 'efficiency': 0.05,
+    'current_min': 80, 'current_max': 200, 'current_step': 10,
+    'speed_min': 60, 'speed_max': 240, 'speed_step': 20,
+    'voltage_min': 20, 'voltage_max': 24, 'voltage_step': 2
+}
+
+
+@pytest.fixture(scope='module', params=['separate', 'multi'])
+def state(request):
+    records = app.generate_demo_data(efficiency=0.05, n_samples=300)
+    state, _ = app.train_models(records, engine='flat', model_mode=request.param)
+    return state
+
+
+def _optimize(mode, models, **extra):
+    return app.run_optimizer(dict(GRID, mode=mode, use_cube=False, **extra), models)
+
+
+def test_exhaustive_optimizers_agree(state):
+    expected = _optimize('loop', state)
+    assert expected['success']
+    assert expected['statistics']['rejected_hi'] and expected['statistics']['rejected_pen']
+    for mode, extra in [('vectorized', {}), ('chunked', {'chunk_size': 7}), ('parallel', {'workers': 2})]:
+        assert _optimize(mode, state, **extra) == expected, mode
+
+
+def test_grid_axis_steps():
+    assert np.array_equal(app.grid_axis(80, 150, 5), np.arange(80, 151, 5))
+    assert app.grid_axis(1.0, 2.0, 0.1).tolist() == [1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.7, 1.8, 1.9, 2.0]
+    with pytest.raises(ValueError):
+        app.grid_axis(80, 150, 0)
+
+
+def _brute_force_front(obj):
+    """Non-dominated rows by pairwise comparison."""
+    return np.array([i for i, row in enumerate(obj)
+                     if not ((obj >= row).all(axis=1) & (obj > row).any(axis=1)).any()], dtype=np.intp)
+
+
+@pytest.mark.parametrize('values', ['ties', 'continuous'])
+def test_pareto_front_matches_brute_force(values):
+    rng = np.random.default_rng(7)
+    if values == 'ties':
+        obj = rng.integers(0, 6, size=(800, 3)).astype(float)  # many equal values and equal rows
+    else:
+        obj = rng.normal(size=(800, 3))
+    expected = _brute_force_front(obj)
+    for block in (app.PARETO_BLOCK, 16):
+        front = app.pareto_front(obj, block=block)
+        # Equal rows are all on the front or all off it; the front keeps one of them
+        assert np.array_equal(front, np.sort(front))
+        assert np.array_equal(np.unique(obj[front], axis=0), np.unique(obj[expected], axis=0))
+        assert len(front) == len(np.unique(obj[expected], axis=0))
+
+
+def test_cube_matches_models(state):
+    spec = {'current_min': 60, 'current_max': 200, 'current_step': 10,
+            'speed_min': 40, 'speed_max': 260, 'speed_step': 20,
+            'voltage_min': 20, 'voltage_max': 24, 'voltage_step': 2,
+            'interpass_min': 25, 'interpass_max': 25, 'interpass_step': 25, 'efficiency': 0.05}
+    models = dict(state, cube=app.build_prediction_cube(state, spec))
+    from_cube = app.run_optimizer(dict(GRID, mode='vectorized'), models)
+    from_models = _optimize('vectorized', state)
+    assert from_cube['source'] == 'cube'
+    assert from_cube['statistics'] == from_models['statistics']
+    assert len(from_cube['top5']) == len(from_models['top5'])
+    for cube_row, model_row in zip(from_cube['top5'], from_models['top5']):
+        for key, value in model_row.items():
+            if key.startswith('Pred_'):
+                # The cube stores float32 predictions
+                assert cube_row[key] == float(np.float32(value)), key
+            else:
+                assert cube_row[key] == value, key
+
+
+def test_result_cache_evicts_least_recent_and_expires():
+    cache = app.ResultCache(maxsize=2, ttl=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)  # evicts b, the least recently used
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    assert cache.stats()['evictions'] == 1
+
+    cache = app.ResultCache(maxsize=2, ttl=0)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+
+
+def test_cache_key_normalises_numbers_and_order():
+    assert (app.cache_key('optimize', 'v1', {'step': 5, 'current_min': 80})
+            == app.cache_key('optimize', 'v1', {'current_min': 80.0, 'step': 5.0}))
+    assert app.cache_key('optimize', 'v1', {'step': 5}) != app.cache_key('optimize', 'v2', {'step': 5})
+
+
+def _sklearn_only(state):
+    return dict(state, flat=None)
+
+
+def _features(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.uniform(50, 200, n), rng.uniform(18, 28, n), rng.uniform(50, 300, n),
+        rng.integers(0, len(app.FILLERS), n), rng.uniform(20, 100, n), rng.uniform(0.5, 0.9, n)
+    ])
+
+
+def test_flat_engine_is_bit_identical_to_sklearn(state):
+    X = _features(app.FLAT_MAX_ROWS)
+    flat_t, flat_p = app.predict_batch(X, state)
+    ref_t, ref_p = app.predict_batch(X, _sklearn_only(state))
+    assert np.array_equal(flat_t, ref_t)
+    assert np.array_equal(flat_p, ref_p)
+
+
+def test_flat_forest_matches_forest_predict(state):
+    X = state['scaler'].transform(_features(500, seed=1))
+    for key in ('tensile', 'penetration', 'joint'):
+        if key in state['flat']:
+            forest = state[f'{key}_model']
+            assert np.array_equal(state['flat'][key].predict(X, block=64), forest.predict(X))
+
+
+def _forest_key(state):
+    return 'joint_model' if state['joint_model'] is not None else 'tensile_model'
+
+
+def test_update_models_grows_copies_of_the_forests(state):
+    new = app.WeldDataset.from_records(app.generate_demo_data(efficiency=0.04, n_samples=50))
+    dataset, n_new = state['training_data'].append(new)
+    n_trees = len(state[_forest_key(state)].estimators_)
+    updated, report = app.update_models(state, dataset, n_new)
+    assert report['n_trees'] == len(updated[_forest_key(state)].estimators_) == n_trees + app.INCREMENTAL_TREES
+    assert len(state[_forest_key(state)].estimators_) == n_trees  # the served models are untouched
+    assert updated['version'] != state['version']
+    X = _features(20)
+    assert np.array_equal(app.predict_batch(X, updated)[0], app.predict_batch(X, _sklearn_only(updated))[0])
+
+
+def test_saved_models_predict_the_same(state, tmp_path):
+    app.save_models(state, str(tmp_path))
+    loaded = app.load_models(str(tmp_path), state['version'])
+    assert loaded['version'] == state['version']
+    X = _features(50)
+    for models in (loaded, _sklearn_only(loaded)):
+        for got, expected in zip(app.predict_batch(X, models), app.predict_batch(X, state)):
+            assert np.array_equal(got, expected)
+
+
+def test_registry_promotes_and_rolls_back(state):
+    registry = app.ModelRegistry({'version': None})
+    for version in ('a', 'b'):
+        registry.register(dict(state, version=version))
+    assert registry.promote('a') is None
+    assert registry.promote('b') == 'a'
+    assert registry.rollback() == 'b'
+    assert registry.active['version'] == 'a'
+    with pytest.raises(ValueError):
+        registry.rollback()
+    with pytest.raises(ValueError):
+        registry.promote('missing')
+
+
+def test_dataset_drops_duplicate_rows():
+    records = app.generate_demo_data(efficiency=0.05, n_samples=30)
+    dataset = app.WeldDataset.from_records(records + records[:10])
+    assert len(dataset) == 30
+    assert dataset.digest() == app.WeldDataset.from_records(records).digest()
+    extended, added = dataset.append(app.WeldDataset.from_records(records[20:] + records[:5]
+                                                                  + app.generate_demo_data(n_samples=3)))
+    assert (len(extended), added) == (33, 3)
+    assert len(dataset) == 30  # never modified in place
+
+
+def _csv(records):
+    return pd.DataFrame(records).to_csv(index=False).encode('utf-8')
+
+
+def test_csv_upload_matches_records():
+    records = app.generate_demo_data(efficiency=0.05, n_samples=120)
+    dataset, rows = app.read_csv_dataset(io.BytesIO(_csv(records + records[:7])), chunk_rows=50)
+    assert rows == 127
+    assert dataset.digest() == app.WeldDataset.from_records(records).digest()
+
+
+@pytest.mark.parametrize('column, value, error', [
+    ('Filler_Type', 'ER999', "Row 7: unknown filler type 'ER999'"),
+    ('Current_A', 'abc', "Row 7: Current_A is not a number ('abc')")
+])
+def test_csv_upload_names_the_bad_row(column, value, error):
+    records = app.generate_demo_data(n_samples=10)
+    records[6] = dict(records[6], **{column: value})
+    with pytest.raises(ValueError, match=re.escape(error)):
+        app.read_csv_dataset(io.BytesIO(_csv(records)), chunk_rows=4)
+
+
+def test_out_of_core_training_pools_every_round(tmp_path):
+    path = str(tmp_path / 'dataset')
+    app.WeldDataset.from_records(app.generate_demo_data(efficiency=0.05, n_samples=2000)).save(path)
+    dataset = app.WeldDataset.load(path)
+    assert dataset.on_disk
+    plan = app.out_of_core_plan(len(dataset), 2, n_estimators=20)
+    assert plan['rounds'] > 1 and plan['rows_per_round'] < len(dataset)
+    state, scores = app.train_out_of_core(dataset, memory_mb=2, n_estimators=20)
+    assert len(state[_forest_key(state)].estimators_) == 20
+    assert scores['method'] == 'holdout'
+    X = _features(20)
+    assert np.array_equal(app.predict_batch(X, state)[0], app.predict_batch(X, _sklearn_only(state))[0])
+
+
+def test_page_encoding_follows_accept_encoding():
+    page = app.encode_page('<html>' + 'weld ' * 200 + '</html>')
+    assert gzip.decompress(page['gzip'][0]) == page['identity'][0]
+    assert app.pick_encoding('gzip, deflate', page) == 'gzip'
+    assert app.pick_encoding('gzip;q=0, identity', page) == 'identity'
+    assert app.pick_encoding('*', page) in page
+    assert app.pick_encoding('', page) == 'identity'
+
+
+def test_json_encoders_agree_on_numpy_values():
+    data = {'scalar': np.float32(100.1), 'ints': np.arange(3), 'floats': np.array([0.1, 2.5], dtype=np.float32),
+            'count': np.int64(5), 'plain': [1.5, 'x', None]}
+    expected = {'scalar': 100.1, 'ints': [0, 1, 2], 'floats': [0.1, 2.5], 'count': 5, 'plain': [1.5, 'x', None]}
+    for name, dumps in app.JSON_ENCODERS.items():
+        assert json.loads(dumps(data)) == expected, name
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """A fresh REGISTRY and result cache, restored afterwards."""
+    monkeypatch.setattr(app, 'REGISTRY', app.ModelRegistry({'version': None}))
+    monkeypatch.setattr(app, 'RESULT_CACHE', app.ResultCache())
+    return app.REGISTRY
+
+
+@pytest.fixture
+def model_store(registry, tmp_path, monkeypatch):
+    """A model store in tmp_path, used by the fresh registry."""
+    monkeypatch.setitem(app.STORE, 'dir', str(tmp_path))
+    return str(tmp_path)
+
+
+def test_rollback_history_is_shared_through_the_store(state, model_store):
+    for version in ('a', 'b'):
+        app.save_models(dict(state, version=version), model_store)
+    worker, other_worker = app.ModelRegistry({'version': None}), app.ModelRegistry({'version': None})
+    worker.promote('a')
+    worker.promote('b')
+    other_worker.rollback()  # steps back through the history worker wrote
+    assert other_worker.active['version'] == 'a'
+    with pytest.raises(ValueError):
+        worker.rollback()
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_evolution_reports_the_settings_it_scored(state, seed):
+    # The default continuous ranges, where repaired speeds fall between grid points
+    request = {'max_heat_input': 1.0, 'efficiency': 0.05, 'voltage_min': 20, 'voltage_max': 26}
+    response = app.run_optimizer(dict(request, mode='evolution', seed=seed), state)
+    assert response['success']
+    for row in response['top5']:
+        hi = row['Voltage_V'] * row['Current_A'] * request['efficiency'] / row['Speed_mm_min']
+        assert row['Heat_Input_kJ_mm'] == hi <= request['max_heat_input']
+        features = [[row['Current_A'], row['Voltage_V'], row['Speed_mm_min'],
+                     app.FILLERS.index(row['Filler_Type']), 25, hi]]
+        tensile, pen = app.predict_batch(np.array(features), state)
+        assert (row['Pred_Tensile_MPa'], row['Pred_Penetration_mm']) == (tensile[0], pen[0])
+        assert pen[0] >= app.MIN_PENETRATION_MM
+
+
+def test_optimizer_workers_are_capped():
+    assert app.parse_optimize_request({'workers': 10 ** 6})['workers'] == app.MAX_WORKERS
+
+
+def _small_state(n_samples):
+    state, _ = app.train_models(app.generate_demo_data(efficiency=0.05, n_samples=n_samples))
+    return state
+
+
+def test_store_keeps_the_active_version_and_rollback_history(model_store):
+    versions = []
+    for n_samples in range(40, 43 + app.ROLLBACK_DEPTH):
+        state = _small_state(n_samples)
+        app.swap_models(state)
+        versions.append(state['version'])
+    kept = versions[-app.ROLLBACK_DEPTH - 1:]
+    assert {name for name in os.listdir(model_store)
+            if os.path.isfile(os.path.join(model_store, name, 'meta.json'))} == set(kept)
+    for version in reversed(kept[:-1]):
+        app.REGISTRY.rollback()
+        assert app.REGISTRY.active['version'] == version
+    with pytest.raises(ValueError):
+        app.REGISTRY.rollback()
+
+
+@pytest.fixture
+def serving(state, registry):
+    """state promoted in a fresh registry, as the handlers see it."""
+    registry.register(state)
+    registry.promote(state['version'])
+    return state
+
+
+def _post(path, data):
+    """Run one POST through RequestHandler's routes; returns the JSON response."""
+    body = json.dumps(data).encode('utf-8')
+    headers = http.client.parse_headers(io.BytesIO(b'Content-Length: %d\r\n\r\n' % len(body)))
+    exchange = app.AsyncExchange('POST', path, headers, body)
+    exchange.do_POST()
+    return json.loads(exchange.wfile.getvalue())
+
+
+def test_evolution_results_are_cached(serving):
+    request = dict(GRID, mode='evolution', population=8, generations=3)
+    first = _post('/api/optimize', request)
+    assert first['success']
+    assert _post('/api/optimize', request) == first
+    assert app.RESULT_CACHE.stats()['hits'] == 1
+
+
+def test_async_server_rejects_bad_content_length():
+    async def exchange(length):
+        server = await app.serve_async('127.0.0.1', 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(b'POST /api/predict HTTP/1.1\r\nContent-Length: %s\r\n\r\n' % length)
+            response = await reader.read()
+            writer.close()
+            return response
+
+    for length in (b'abc', b'-5'):
+        assert asyncio.run(exchange(length)).startswith(b'HTTP/1.1 400')
+
+
+def test_stored_dataset_append_drops_rows_already_stored(tmp_path, monkeypatch):
+    # Many scan chunks and dedup partitions even for a few rows
+    monkeypatch.setattr(app, 'DATASET_SCAN_ROWS', 16)
+    monkeypatch.setattr(app, 'DEDUP_BYTES_PER_ROW', 2 ** 22)
+    records = app.generate_demo_data(efficiency=0.05, n_samples=100)
+    stored = app.WeldDataset.from_records(records[:60])
+    path = str(tmp_path / 'dataset')
+    stored.save(path)
+    # Rows 40-59 are stored already and rows 90-94 come twice
+    new = app.WeldDataset.concat([app.WeldDataset.from_records(records[40:]),
+                                  app.WeldDataset.from_records(records[90:95])])
+    expected, n_new = stored.append(new)
+    assert app.DatasetFiles(path).append(new) == n_new == 40
+    assert app.WeldDataset.load(path).digest() == expected.digest()
+    assert app.DatasetFiles(path).append(new) == 0
+
+
+def test_csv_upload_to_disk_matches_memory(tmp_path):
+    records = app.generate_demo_data(efficiency=0.05, n_samples=120)
+    body = _csv(records + records[:7])
+    in_memory, rows = app.read_csv_dataset(io.BytesIO(body), chunk_rows=50)
+    on_disk, rows_on_disk = app.read_csv_dataset(io.BytesIO(body), chunk_rows=50, path=str(tmp_path / 'upload'))
+    assert on_disk.on_disk
+    assert rows_on_disk == rows
+    assert on_disk.digest() == in_memory.digest()
+
+
+def test_parallel_matches_vectorized_after_update(state):
+    _optimize('parallel', state)  # a pool holding the models before the update
+    added = app.WeldDataset.from_records(app.generate_demo_data(efficiency=0.04, n_samples=100))
+    dataset, n_new = state['training_data'].append(added)
+    updated, _ = app.update_models(state, dataset, n_new)
+    assert _optimize('parallel', updated) == _optimize('vectorized', updated)
+
+
+def test_replaced_pool_finishes_requests_in_flight(state):
+    with app._pooled(state, 1) as first:
+        with app._pooled(dict(state, version='replacement'), 1) as second:
+            assert second is not first
+        assert first.submit(abs, -1).result() == 1
+    assert first not in app._POOL['users']
+
+
+def test_rollback_during_swap_does_not_deadlock(model_store, monkeypatch):
+    monkeypatch.setitem(app.STORE, 'shared', True)  # store_lock() takes the file lock
+    for n_samples in (40, 41):
+        app.swap_models(_small_state(n_samples))
+    save_models = app.save_models
+
+    def slow_save(*args):
+        time.sleep(0.5)  # rollback arrives while the store lock is held
+        return save_models(*args)
+    monkeypatch.setattr(app, 'save_models', slow_save)
+
+    swap = threading.Thread(target=app.swap_models, args=(_small_state(42),), daemon=True)
+    rollback = threading.Thread(target=app.REGISTRY.rollback, daemon=True)
+    swap.start()
+    time.sleep(0.1)
+    rollback.start()
+    swap.join(10)
+    rollback.join(10)
+    assert not swap.is_alive() and not rollback.is_alive()
+
+
+def test_default_models_are_the_active_set(serving):
+    X = _features(10)
+    assert np.array_equal(app.predict_batch(X)[0], app.predict_batch(X, serving)[0])
+    assert app.run_optimizer(dict(GRID, mode='vectorized')) == _optimize('vectorized', serving)
+    assert app.MODELS['version'] is None  # the starting state is never overwritten
+
+
+def test_overloaded_server_turns_clients_away_quickly():
+    server = app.PooledHTTPServer(('127.0.0.1', 0), app.RequestHandler, threads=1, queue_size=1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = server.server_address
+    # One connection occupies the thread and one the queue; the rest never send a request
+    idle = [socket.create_connection(address) for _ in range(42)]
+    try:
+        t0 = time.perf_counter()
+        with socket.create_connection(address) as client:
+            client.sendall(b'GET /api/check-model HTTP/1.0\r\n\r\n')
+            client.settimeout(5)
+            response = b''
+            while chunk := client.recv(65536):
+                response += chunk
+        assert response.startswith(b'HTTP/1.0 503')
+        assert time.perf_counter() - t0 < 0.5
+    finally:
+        for sock in idle:
+            sock.close()
+        server.shutdown()
+        server.server_close()
@@ -8,24 +8,67 @@ import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import cross_val_score, KFold
+from sklearn.base import clone
+from sklearn.metrics import r2_score
+from sklearn.model_selection import KFold
+from http import HTTPStatus
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from types import MappingProxyType
+import asyncio
+import contextlib
+import gzip
+import hashlib
+import http.client
+import copy
+import gc
+import itertools
+import joblib
 import json
+import multiprocessing
+import os
+import pickle
+import queue
+import selectors
+import shutil
+import signal
+import socket
+import sys
 import urllib.parse
+import uuid
 import io
 import webbrowser
 import threading
 import time
+import traceback
+
+try:
+    import brotli  # optional: the UI page is also offered brotli-compressed
+except ImportError:
+    brotli = None
+
+try:
+    import orjson  # optional: faster response encoding, NumPy arrays without tolist()
+except ImportError:
+    orjson = None
 
 # ============================================
 # GLOBAL MODEL STORAGE
 # ============================================
+# The untrained starting state. The set being served is REGISTRY.active,
+# replaced in one assignment; functions taking models=None read it once.
 MODELS = {
     'tensile_model': None,
     'penetration_model': None,
+    'joint_model': None,
     'scaler': None,
+    'target_scaler': None,
     'trained': False,
-    'training_data': None
+    'training_data': None,
+    'cube': None,
+    'version': None,
+    'flat': None
 }
 
 # ============================================
@@ -588,6 +631,14 @@ HTML_TEMPLATE = '''
                         <button class="btn btn-secondary" onclick="downloadTemplate()">
                             📥 Download Template
                         </button>
+                        <label style="display: flex; align-items: center; gap: 8px; color: #a0a0a0;">
+                            <input type="checkbox" id="precompute-cube">
+                            Precompute optimizer cube (slower training, instant optimization)
+                        </label>
+                        <select id="model-mode" title="Model layout">
+                            <option value="separate">Separate forests per target</option>
+                            <option value="multi">Joint multi-output forest (faster)</option>
+                        </select>
                     </div>
                 </div>
 
@@ -836,19 +887,40 @@ HTML_TEMPLATE = '''
                     </div>
                 </div>
 
-                <div class="form-group" style="margin-top: 20px;">
-                    <label>Search Step Size</label>
-                    <input type="number" id="opt-step" value="2" min="1" max="10">
-                    <span class="help-text">Smaller = more precise but slower (1-10)</span>
+                <div class="grid-2" style="margin-top: 20px;">
+                    <div class="form-group">
+                        <label>Search Step Size</label>
+                        <input type="number" id="opt-step" value="2" min="0.1" max="10" step="0.1">
+                        <span class="help-text">Smaller = more precise but slower (0.1-10)</span>
+                    </div>
+                    <div class="form-group">
+                        <label>Search Mode</label>
+                        <select id="opt-mode">
+                            <option value="vectorized">Exhaustive (Full Grid)</option>
+                            <option value="adaptive">Adaptive (Coarse-to-Fine)</option>
+                            <option value="evolution">Evolution (Continuous)</option>
+                        </select>
+                        <span class="help-text">Adaptive scores far fewer points on fine grids</span>
+                    </div>
                 </div>
 
                 <div class="action-bar">
                     <button class="btn btn-primary" onclick="runOptimization()" style="font-size: 1.2rem; padding: 18px 40px;">
                         🚀 RUN OPTIMIZATION
                     </button>
+                    <button class="btn btn-secondary" onclick="runPareto()" style="font-size: 1.2rem; padding: 18px 40px;">
+                        📈 TRADE-OFF FRONT
+                    </button>
                 </div>
             </div>
 
+            <!-- Pareto Front -->
+            <div id="pareto-results" class="panel hidden">
+                <h3>📈 Tensile vs. Heat Input Safety Trade-off</h3>
+                <p class="help-text" id="pareto-summary"></p>
+                <svg id="pareto-chart" viewBox="0 0 600 320" style="width: 100%; background: rgba(0,0,0,0.2); border-radius: 8px;"></svg>
+            </div>
+
             <!-- Optimization Results -->
             <div id="optimization-results" class="hidden">
                 <div class="optimal-highlight">
@@ -953,6 +1025,7 @@ HTML_TEMPLATE = '''
     <script>
         // Global state
         let trainingData = [];
+        let serverSamples = 0;  // rows of an uploaded CSV, held by the server
         let lastPrediction = null;
         let lastOptimization = null;
 
@@ -998,6 +1071,7 @@ HTML_TEMPLATE = '''
                 showLoading(false);
                 if (data.success) {
                     trainingData = data.data;
+                    serverSamples = 0;
                     displayDataPreview();
                     log(`Generated ${data.count} demo samples`, 'success');
                 }
@@ -1032,9 +1106,13 @@ HTML_TEMPLATE = '''
                 return;
             }
             
-            trainingData.push(entry);
-            displayDataPreview();
-            log(`Added manual entry. Total: ${trainingData.length} samples`, 'success');
+            if (serverSamples) {
+                appendToServer(entry);
+            } else {
+                trainingData.push(entry);
+                displayDataPreview();
+                log(`Added manual entry. Total: ${trainingData.length} samples`, 'success');
+            }
             
             // Clear form
             ['m-current', 'm-voltage', 'm-speed', 'm-tensile', 'm-pen'].forEach(id => {
@@ -1046,39 +1124,37 @@ HTML_TEMPLATE = '''
             const file = input.files[0];
             if (!file) return;
             
-            const reader = new FileReader();
-            reader.onload = function(e) {
-                const text = e.target.result;
-                const rows = text.split('\\n').filter(r => r.trim());
-                const headers = rows[0].split(',').map(h => h.trim());
-                
-                // Parse CSV
-                trainingData = [];
-                for (let i = 1; i < rows.length; i++) {
-                    const cols = rows[i].split(',');
-                    if (cols.length >= 7) {
-                        trainingData.push({
-                            Current_A: parseFloat(cols[0]),
-                            Voltage_V: parseFloat(cols[1]),
-                            Travel_Speed_mm_min: parseFloat(cols[2]),
-                            Filler_Type: cols[3].trim(),
-                            Interpass_Temp_C: parseFloat(cols[4]),
-                            Heat_Input_kJ_mm: parseFloat(cols[5]),
-                            Tensile_Strength_MPa: parseFloat(cols[6]),
-                            Penetration_Depth_mm: parseFloat(cols[7])
-                        });
-                    }
+            // The server parses the file as it streams in; only a preview comes back
+            showLoading(true);
+            log(`Uploading ${file.name} (${(file.size / 1e6).toFixed(1)} MB)...`, 'info');
+            fetch('/api/upload-csv', {
+                method: 'POST',
+                headers: {'Content-Type': 'text/csv'},
+                body: file
+            })
+            .then(r => r.json())
+            .then(data => {
+                showLoading(false);
+                input.value = '';
+                if (data.success) {
+                    trainingData = data.preview;
+                    serverSamples = data.n_samples;
+                    displayDataPreview();
+                    log(`Loaded ${data.n_samples} samples from CSV` +
+                        (data.duplicates ? ` (${data.duplicates} duplicates dropped)` : ''), 'success');
+                } else {
+                    log('Upload failed: ' + data.error, 'error');
                 }
-                
-                displayDataPreview();
-                log(`Loaded ${trainingData.length} samples from CSV`, 'success');
-            };
-            reader.readAsText(file);
+            })
+            .catch(err => {
+                showLoading(false);
+                log('Error: ' + err.message, 'error');
+            });
         }
 
         function displayDataPreview() {
             document.getElementById('data-preview-section').classList.remove('hidden');
-            document.getElementById('data-count').textContent = trainingData.length;
+            document.getElementById('data-count').textContent = serverSamples || trainingData.length;
             
             const tbody = document.querySelector('#preview-table tbody');
             tbody.innerHTML = '';
@@ -1098,39 +1174,95 @@ HTML_TEMPLATE = '''
             });
         }
 
+        function appendToServer(entry) {
+            fetch('/api/append-data', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({data: [entry], retrain: 'none'})
+            })
+            .then(r => r.json())
+            .then(data => {
+                if (data.success) {
+                    serverSamples = data.n_samples;
+                    displayDataPreview();
+                    log(`Added manual entry. Total: ${serverSamples} samples`, 'success');
+                } else {
+                    log('Error: ' + data.error, 'error');
+                }
+            });
+        }
+
         function trainModel() {
-            if (trainingData.length < 5) {
+            if ((serverSamples || trainingData.length) < 5) {
                 alert('Need at least 5 samples to train');
                 return;
             }
             
-            showLoading(true);
-            log('Training Random Forest models...', 'info');
+            log('Training Random Forest models in the background...', 'info');
             
             fetch('/api/train-model', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({data: trainingData})
+                body: JSON.stringify({
+                    data: serverSamples ? undefined : trainingData,
+                    use_dataset: serverSamples > 0,
+                    precompute_cube: document.getElementById('precompute-cube').checked,
+                    model_mode: document.getElementById('model-mode').value,
+                    background: true
+                })
             })
             .then(r => r.json())
             .then(data => {
-                showLoading(false);
                 if (data.success) {
-                    document.getElementById('training-results').classList.remove('hidden');
-                    document.getElementById('cv-tensile').textContent = data.cv_scores.tensile_mean.toFixed(3);
-                    document.getElementById('cv-pen').textContent = data.cv_scores.pen_mean.toFixed(3);
-                    document.getElementById('train-samples').textContent = data.n_samples;
-                    log(`Model trained! Tensile R²: ${data.cv_scores.tensile_mean.toFixed(3)}, Penetration R²: ${data.cv_scores.pen_mean.toFixed(3)}`, 'success');
+                    pollTrainingJob(data.job_id, null);
                 } else {
                     log('Training failed: ' + data.error, 'error');
                 }
             })
             .catch(err => {
-                showLoading(false);
                 log('Error: ' + err.message, 'error');
             });
         }
 
+        function pollTrainingJob(jobId, lastPhase) {
+            fetch('/api/jobs/' + jobId)
+            .then(r => r.json())
+            .then(data => {
+                if (!data.success) {
+                    log('Training failed: ' + data.error, 'error');
+                    return;
+                }
+                const job = data.job;
+                if (job.status === 'done') {
+                    showTrainingResults(job.result);
+                } else if (job.status === 'failed') {
+                    log('Training failed: ' + job.error, 'error');
+                } else {
+                    let phase = job.phase;
+                    if (phase === 'cross-validation') {
+                        phase += ` ${job.progress.cv_folds_done}/${job.progress.cv_folds_total}`;
+                    } else if (phase === 'fitting' && job.progress.rounds) {
+                        phase += ` round ${job.progress.round}/${job.progress.rounds}`;
+                    }
+                    if (phase !== lastPhase) {
+                        log(`Training: ${phase} (${job.elapsed_s.toFixed(1)}s)`, 'info');
+                    }
+                    setTimeout(() => pollTrainingJob(jobId, phase), 500);
+                }
+            })
+            .catch(err => {
+                log('Error: ' + err.message, 'error');
+            });
+        }
+
+        function showTrainingResults(data) {
+            document.getElementById('training-results').classList.remove('hidden');
+            document.getElementById('cv-tensile').textContent = data.cv_scores.tensile_mean.toFixed(3);
+            document.getElementById('cv-pen').textContent = data.cv_scores.pen_mean.toFixed(3);
+            document.getElementById('train-samples').textContent = data.n_samples;
+            log(`Model trained in ${data.train_s.toFixed(1)}s! Tensile R²: ${data.cv_scores.tensile_mean.toFixed(3)}, Penetration R²: ${data.cv_scores.pen_mean.toFixed(3)} (${data.validation === 'oob' ? 'out-of-bag' : '3-fold CV'})`, 'success');
+        }
+
         function downloadTemplate() {
             const csv = `Current_A,Voltage_V,Travel_Speed_mm_min,Filler_Type,Interpass_Temp_C,Heat_Input_kJ_mm,Tensile_Strength_MPa,Penetration_Depth_mm
 90,22,100,ER309L,25,1.19,520,2.8
@@ -1347,8 +1479,8 @@ HTML_TEMPLATE = '''
         // ==========================================
         // TAB 3: OPTIMIZATION
         // ==========================================
-        function runOptimization() {
-            const config = {
+        function getOptimizationConfig() {
+            return {
                 max_heat_input: parseFloat(document.getElementById('opt-max-hi').value),
                 plate_thickness: parseFloat(document.getElementById('opt-thickness').value),
                 filler_preference: document.getElementById('opt-filler').value,
@@ -1356,11 +1488,16 @@ HTML_TEMPLATE = '''
                 current_max: parseInt(document.getElementById('opt-curr-max').value),
                 speed_min: parseInt(document.getElementById('opt-spd-min').value),
                 speed_max: parseInt(document.getElementById('opt-spd-max').value),
-                step: parseInt(document.getElementById('opt-step').value),
+                step: parseFloat(document.getElementById('opt-step').value),
+                mode: document.getElementById('opt-mode').value,
                 voltage: 22,
                 efficiency: 0.6,
                 interpass_temp: 25
             };
+        }
+
+        function runOptimization() {
+            const config = getOptimizationConfig();
             
             showLoading(true);
             log('Starting optimization search...', 'info');
@@ -1437,6 +1574,58 @@ HTML_TEMPLATE = '''
             document.getElementById('optimization-results').scrollIntoView({behavior: 'smooth'});
         }
 
+        function runPareto() {
+            showLoading(true);
+            log('Computing trade-off front...', 'info');
+            
+            fetch('/api/pareto', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify(getOptimizationConfig())
+            })
+            .then(r => r.json())
+            .then(data => {
+                showLoading(false);
+                if (data.success) {
+                    displayPareto(data);
+                    log(`Trade-off front: ${data.front.length} non-dominated settings from ${data.statistics.evaluated.toLocaleString()} candidates`, 'success');
+                } else {
+                    log('Trade-off front failed: ' + data.error, 'error');
+                }
+            })
+            .catch(err => {
+                showLoading(false);
+                log('Error: ' + err.message, 'error');
+            });
+        }
+
+        function displayPareto(data) {
+            document.getElementById('pareto-results').classList.remove('hidden');
+            document.getElementById('pareto-summary').textContent =
+                `${data.front.length} non-dominated settings. Green = penetration inside ` +
+                `${data.window.pen_min}-${data.window.pen_max} mm window, orange = outside.`;
+            
+            const W = 600, H = 320, pad = 45;
+            const xs = data.front.map(p => p.Safety_Margin_HI);
+            const ys = data.front.map(p => p.Pred_Tensile_MPa);
+            const xMin = Math.min(...xs), xMax = Math.max(...xs) || 1;
+            const yMin = Math.min(...ys), yMax = Math.max(...ys);
+            const sx = x => pad + (x - xMin) / ((xMax - xMin) || 1) * (W - 2 * pad);
+            const sy = y => H - pad - (y - yMin) / ((yMax - yMin) || 1) * (H - 2 * pad);
+            
+            let svg = `<line x1="${pad}" y1="${H - pad}" x2="${W - pad}" y2="${H - pad}" stroke="#888"/>`;
+            svg += `<line x1="${pad}" y1="${pad}" x2="${pad}" y2="${H - pad}" stroke="#888"/>`;
+            svg += `<text x="${W / 2}" y="${H - 10}" fill="#aaa" font-size="12" text-anchor="middle">HI safety margin (kJ/mm) ${xMin.toFixed(3)} - ${xMax.toFixed(3)}</text>`;
+            svg += `<text x="12" y="${H / 2}" fill="#aaa" font-size="12" text-anchor="middle" transform="rotate(-90 12 ${H / 2})">Tensile (MPa) ${yMin.toFixed(0)} - ${yMax.toFixed(0)}</text>`;
+            data.front.forEach(p => {
+                const color = p.Pen_Deviation_mm === 0 ? '#27ae60' : '#f39c12';
+                svg += `<circle cx="${sx(p.Safety_Margin_HI)}" cy="${sy(p.Pred_Tensile_MPa)}" r="3" fill="${color}">` +
+                       `<title>${p.Current_A} A, ${p.Speed_mm_min} mm/min, ${p.Filler_Type}: ` +
+                       `${p.Pred_Tensile_MPa.toFixed(1)} MPa, ${p.Pred_Penetration_mm.toFixed(2)} mm</title></circle>`;
+            });
+            document.getElementById('pareto-chart').innerHTML = svg;
+        }
+
         // Initialize
         updateRealtimeHI();
     </script>
@@ -1445,296 +1634,3359 @@ HTML_TEMPLATE = '''
 '''
 
 # ============================================
-# HTTP REQUEST HANDLER
+# UI PAYLOAD
 # ============================================
-class RequestHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        """Handle GET requests."""
-        if self.path == '/' or self.path == '/index.html':
-            self.send_html(HTML_TEMPLATE)
-        elif self.path == '/api/check-model':
-            self.send_json({
-                'trained': MODELS['trained'],
-                'n_samples': len(MODELS['training_data']) if MODELS['training_data'] else 0
-            })
-        else:
-            self.send_error(404)
-    
-    def do_POST(self):
-        """Handle POST requests."""
-        content_length = int(self.headers.get('Content-Length', 0))
-        post_data = self.rfile.read(content_length)
-        
-        try:
-            data = json.loads(post_data.decode('utf-8'))
-        except:
-            data = {}
-        
-        if self.path == '/api/generate-demo':
-            self.handle_generate_demo(data)
-        elif self.path == '/api/train-model':
-            self.handle_train_model(data)
-        elif self.path == '/api/predict':
-            self.handle_predict(data)
-        elif self.path == '/api/optimize':
-            self.handle_optimize(data)
-        else:
-            self.send_error(404)
-    
-    def send_html(self, content):
-        self.send_response(200)
-        self.send_header('Content-Type', 'text/html')
-        self.end_headers()
-        self.wfile.write(content.encode('utf-8'))
-    
-    def send_json(self, data):
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
-    
-    def handle_generate_demo(self, data):
-        """Generate synthetic welding data."""
-        n_samples = 80
-        voltage = data.get('voltage', 22)
-        efficiency = data.get('efficiency', 0.6)
-        
-        np.random.seed(42)
-        
-        samples = []
-        for _ in range(n_samples):
-            curr = np.random.uniform(80, 140)
-            volt = np.random.uniform(20, 26)
-            speed = np.random.uniform(80, 140)
-            filler = 'ER309L' if np.random.random() < 0.6 else 'ER316L'
-            temp = np.random.uniform(20, 80)
-            
-            hi = (volt * curr * efficiency) / speed
-            
-            # Physics-based targets
-            optimal_hi = 0.9
-            tensile = 580 - 80 * ((hi - optimal_hi) ** 2)
-            tensile += 20 if filler == 'ER309L' else 0
-            tensile -= 0.15 * temp
-            tensile += np.random.normal(0, 15)
-            tensile = np.clip(tensile, 400, 650)
-            
-            pen = 1.0 + 2.0 * hi + np.random.normal(0, 0.2)
-            pen = np.clip(pen, 1.5, 5.0)
-            
-            samples.append({
-                'Current_A': round(curr, 1),
-                'Voltage_V': round(volt, 1),
-                'Travel_Speed_mm_min': round(speed, 1),
-                'Filler_Type': filler,
-                'Interpass_Temp_C': round(temp, 1),
-                'Heat_Input_kJ_mm': round(hi, 3),
-                'Tensile_Strength_MPa': round(tensile, 1),
-                'Penetration_Depth_mm': round(pen, 2)
-            })
-        
-        self.send_json({'success': True, 'data': samples, 'count': len(samples)})
-    
-    def handle_train_model(self, data):
-        """Train Random Forest models."""
-        training_data = data.get('data', [])
-        
-        if len(training_data) < 5:
-            self.send_json({'success': False, 'error': 'Need at least 5 samples'})
-            return
-        
-        try:
-            # Prepare data
-            df = pd.DataFrame(training_data)
-            df['Filler_Code'] = (df['Filler_Type'] == 'ER316L').astype(int)
-            
-            features = ['Current_A', 'Voltage_V', 'Travel_Speed_mm_min', 
-                       'Filler_Code', 'Interpass_Temp_C', 'Heat_Input_kJ_mm']
-            X = df[features]
-            y_tensile = df['Tensile_Strength_MPa']
-            y_pen = df['Penetration_Depth_mm']
-            
-            # Scaling
-            scaler = StandardScaler()
-            X_scaled = scaler.fit_transform(X)
-            
-            # Train Models
-            tensile_model = RandomForestRegressor(n_estimators=100, random_state=42)
-            pen_model = RandomForestRegressor(n_estimators=100, random_state=42)
-            
-            tensile_model.fit(X_scaled, y_tensile)
-            pen_model.fit(X_scaled, y_pen)
-            
-            # Cross Validation
-            cv = KFold(n_splits=3, shuffle=True, random_state=42)
-            cv_tensile = cross_val_score(tensile_model, X_scaled, y_tensile, cv=cv, scoring='r2')
-            cv_pen = cross_val_score(pen_model, X_scaled, y_pen, cv=cv, scoring='r2')
-            
-            # Save Global State
-            MODELS['tensile_model'] = tensile_model
-            MODELS['penetration_model'] = pen_model
-            MODELS['scaler'] = scaler
-            MODELS['trained'] = True
-            MODELS['training_data'] = training_data
-            
-            self.send_json({
-                'success': True,
-                'n_samples': len(df),
-                'cv_scores': {
-                    'tensile_mean': float(cv_tensile.mean()),
-                    'pen_mean': float(cv_pen.mean())
-                }
-            })
-        except Exception as e:
-            self.send_json({'success': False, 'error': str(e)})
+# The page cannot change while the server runs, so it is encoded and
+# compressed once. Each encoding has its own ETag, so browsers revalidate
+# with If-None-Match and get a bodiless 304 instead of the page.
+def encode_page(html):
+    """{content-coding: (body, etag)} for identity, gzip and, if installed, br."""
+    raw = html.encode('utf-8')
+    tag = hashlib.sha1(raw).hexdigest()[:16]
+    page = {'identity': (raw, f'"{tag}"'),
+            'gzip': (gzip.compress(raw, compresslevel=9, mtime=0), f'"{tag}-gzip"')}
+    if brotli is not None:
+        page['br'] = (brotli.compress(raw, quality=11), f'"{tag}-br"')
+    return page
 
-    def handle_predict(self, data):
-        """Predict outcomes based on parameters."""
-        if not MODELS['trained']:
-            self.send_json({'success': False, 'error': 'No trained model found'})
-            return
 
-        try:
-            # Extract inputs
-            current = float(data.get('current', 120))
-            voltage = float(data.get('voltage', 22))
-            speed = float(data.get('speed', 110))
-            filler = data.get('filler', 'ER309L')
-            interpass = float(data.get('interpass', 25))
-            efficiency = float(data.get('efficiency', 0.6))
-            
-            # Calculate Heat Input
-            hi = (voltage * current * efficiency) / speed
-            
-            # Prepare feature vector
-            filler_code = 1 if filler == 'ER316L' else 0
-            features = np.array([[current, voltage, speed, filler_code, interpass, hi]])
-            
-            # Scale
-            features_scaled = MODELS['scaler'].transform(features)
-            
-            # Predict
-            tensile = float(MODELS['tensile_model'].predict(features_scaled)[0])
-            pen = float(MODELS['penetration_model'].predict(features_scaled)[0])
-            
-            self.send_json({
-                'success': True,
-                'prediction': {
-                    'tensile': tensile,
-                    'penetration': pen
-                },
-                'heat_input': hi
-            })
-        except Exception as e:
-            self.send_json({'success': False, 'error': str(e)})
+def pick_encoding(accept_encoding, available):
+    """The best of br, gzip and identity that an Accept-Encoding header allows."""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    for coding in ('br', 'gzip'):
+        if coding in available and accepted.get(coding, accepted.get('*', 0.0)) > 0:
+            return coding
+    return 'identity'
 
-    def handle_optimize(self, data):
-        """Find optimal parameters."""
-        if not MODELS['trained']:
-            self.send_json({'success': False, 'error': 'No trained model found'})
-            return
 
+UI_PAGE = encode_page(HTML_TEMPLATE)
+
+# ============================================
+# DATA GENERATION & TRAINING
+# ============================================
+FEATURES = ['Current_A', 'Voltage_V', 'Travel_Speed_mm_min',
+            'Filler_Code', 'Interpass_Temp_C', 'Heat_Input_kJ_mm']
+FILLERS = ['ER309L', 'ER316L']  # list index == Filler_Code
+# Columns every weld record must carry (the CSV template's header)
+RECORD_COLUMNS = ['Current_A', 'Voltage_V', 'Travel_Speed_mm_min', 'Filler_Type', 'Interpass_Temp_C',
+                  'Heat_Input_kJ_mm', 'Tensile_Strength_MPa', 'Penetration_Depth_mm']
+INFERENCE_ENGINE = 'flat'  # 'flat' (compiled node arrays) or 'sklearn'
+MODEL_MODE = 'separate'  # 'separate' (one forest per target) or 'multi' (one joint forest)
+# 'kfold' refits 3 extra forests per target; 'oob' scores the final forests
+# on their out-of-bag rows; 'auto' picks oob from OOB_MIN_SAMPLES rows up
+VALIDATION = 'auto'
+OOB_MIN_SAMPLES = 1000
+# Incremental updates (/api/append-data): extra trees per forest, fitted on
+# the newest INCREMENTAL_WINDOW rows; past MAX_TREES a full retrain runs
+INCREMENTAL_TREES = 20
+INCREMENTAL_WINDOW = 500
+MAX_TREES = 300
+# Core budget for training; one core is left free for serving requests
+TRAINING_CORES = max(1, (os.cpu_count() or 1) - 1)
+# Out-of-core training (train_out_of_core): default memory ceiling, and the
+# measured costs it is planned with. A round holds ~OOC_WORK_BYTES_PER_ROW per
+# sampled row; a fully grown tree has ~OOC_NODES_PER_ROW nodes per row it saw.
+OUT_OF_CORE_MEMORY_MB = 256
+OOC_WORK_BYTES_PER_ROW = 200
+OOC_NODES_PER_ROW = 1.3
+OOC_MIN_ROWS = 100
+OOC_HOLDOUT_ROWS = 20000
+
+
+def generate_demo_data(voltage=22, efficiency=0.6, n_samples=80):
+    """Generate synthetic welding data."""
+    np.random.seed(42)
+
+    samples = []
+    for _ in range(n_samples):
+        curr = np.random.uniform(80, 140)
+        volt = np.random.uniform(20, 26)
+        speed = np.random.uniform(80, 140)
+        filler = 'ER309L' if np.random.random() < 0.6 else 'ER316L'
+        temp = np.random.uniform(20, 80)
+
+        hi = (volt * curr * efficiency) / speed
+
+        # Physics-based targets
+        optimal_hi = 0.9
+        tensile = 580 - 80 * ((hi - optimal_hi) ** 2)
+        tensile += 20 if filler == 'ER309L' else 0
+        tensile -= 0.15 * temp
+        tensile += np.random.normal(0, 15)
+        tensile = np.clip(tensile, 400, 650)
+
+        pen = 1.0 + 2.0 * hi + np.random.normal(0, 0.2)
+        pen = np.clip(pen, 1.5, 5.0)
+
+        samples.append({
+            'Current_A': round(curr, 1),
+            'Voltage_V': round(volt, 1),
+            'Travel_Speed_mm_min': round(speed, 1),
+            'Filler_Type': filler,
+            'Interpass_Temp_C': round(temp, 1),
+            'Heat_Input_kJ_mm': round(hi, 3),
+            'Tensile_Strength_MPa': round(tensile, 1),
+            'Penetration_Depth_mm': round(pen, 2)
+        })
+
+    return samples
+
+
+def _no_progress(phase, **info):
+    pass
+
+
+def _fold_r2(model, X, Y, train, test):
+    """R^2 of each target column on one CV fold, as cross_val_score scores it."""
+    pred = model.fit(X[train], Y[train]).predict(X[test])
+    return r2_score(Y[test], pred, multioutput='raw_values')
+
+
+def check_records(records):
+    """Raise ValueError unless every record has all RECORD_COLUMNS."""
+    for i, record in enumerate(records):
+        missing = [column for column in RECORD_COLUMNS if column not in record]
+        if missing:
+            raise ValueError(f"Record {i} is missing {', '.join(missing)}")
+
+
+class WeldDataset:
+    """Weld records as typed columns: float32 numbers, Filler_Type as a uint8 code.
+
+    Rows are unique; appending drops exact duplicates. A dataset is never
+    modified in place, so trained model sets can share it safely.
+    """
+
+    NUMERIC = [column for column in RECORD_COLUMNS if column != 'Filler_Type']
+
+    def __init__(self, columns=None):
+        if columns is None:
+            columns = {column: np.empty(0, dtype=np.float32) for column in self.NUMERIC}
+            columns['Filler_Code'] = np.empty(0, dtype=np.uint8)
+        self.columns = columns
+
+    @classmethod
+    def from_records(cls, records):
+        """Columns from a list of record dicts, with duplicate rows dropped."""
+        check_records(records)
+        codes = {name: code for code, name in enumerate(FILLERS)}
         try:
-            # Constraints & Ranges
-            max_hi = float(data.get('max_heat_input', 1.2))
-            target_pen = float(data.get('plate_thickness', 3.0)) # Usually target >= thickness
-            filler_pref = data.get('filler_preference', 'both')
-            
-            curr_range = range(data.get('current_min', 80), data.get('current_max', 150) + 1, data.get('step', 5))
-            speed_range = range(data.get('speed_min', 80), data.get('speed_max', 200) + 1, data.get('step', 5))
-            
-            fillers = []
-            if filler_pref in ['both', 'ER309L']: fillers.append('ER309L')
-            if filler_pref in ['both', 'ER316L']: fillers.append('ER316L')
-            
-            voltage = data.get('voltage', 22)
-            interpass = data.get('interpass_temp', 25)
-            efficiency = data.get('efficiency', 0.6)
-            
-            candidates = []
-            total_scanned = 0
-            rejected_hi = 0
-            rejected_pen = 0
-            
-            for curr in curr_range:
-                for spd in speed_range:
-                    for fil in fillers:
-                        total_scanned += 1
-                        
-                        # Calcs
-                        hi = (voltage * curr * efficiency) / spd
-                        
-                        # Constraint 1: Heat Input
-                        if hi > max_hi:
-                            rejected_hi += 1
-                            continue
-                            
-                        # Predict
-                        f_code = 1 if fil == 'ER316L' else 0
-                        feats = np.array([[curr, voltage, spd, f_code, interpass, hi]])
-                        feats_scaled = MODELS['scaler'].transform(feats)
-                        
-                        pred_t = float(MODELS['tensile_model'].predict(feats_scaled)[0])
-                        pred_p = float(MODELS['penetration_model'].predict(feats_scaled)[0])
-                        
-                        # Constraint 2: Penetration (Targeting full penetration, e.g., >= thickness)
-                        # Relaxing it slightly to >= thickness * 0.9 for practical results or strictly >= 3.0
-                        if pred_p < 3.0: # Hard requirement from requirements "Full Penetration (>3mm)"
-                             rejected_pen += 1
-                             continue
-                        
-                        # Score (Maximize Tensile)
-                        candidates.append({
-                            'Current_A': curr,
-                            'Speed_mm_min': spd,
-                            'Filler_Type': fil,
-                            'Heat_Input_kJ_mm': hi,
-                            'Pred_Tensile_MPa': pred_t,
-                            'Pred_Penetration_mm': pred_p,
-                            'Safety_Margin_HI': max_hi - hi
-                        })
-            
-            # Sort by Tensile Strength (Desc)
-            candidates.sort(key=lambda x: x['Pred_Tensile_MPa'], reverse=True)
-            
-            if not candidates:
-                 self.send_json({
-                    'success': False, 
-                    'error': 'No solution found satisfying all constraints. Try relaxing Heat Input limits or Speed ranges.',
-                    'statistics': {
-                        'total_scanned': total_scanned, 
-                        'valid_count': 0,
-                        'rejected_hi': rejected_hi,
-                        'rejected_pen': rejected_pen
-                    }
-                })
-                 return
+            filler = np.array([codes[record['Filler_Type']] for record in records], dtype=np.uint8)
+        except KeyError as e:
+            raise ValueError(f"Unknown filler type {e.args[0]!r}; expected one of {', '.join(FILLERS)}")
+        columns = {column: np.array([record[column] for record in records], dtype=np.float32)
+                   for column in cls.NUMERIC}
+        columns['Filler_Code'] = filler
+        return cls(columns).unique()
 
-            self.send_json({
-                'success': True,
-                'optimal': candidates[0],
-                'top5': candidates[:5],
-                'statistics': {
-                    'total_scanned': total_scanned,
-                    'valid_count': len(candidates),
-                    'rejected_hi': rejected_hi,
-                    'rejected_pen': rejected_pen
-                }
-            })
-            
-        except Exception as e:
-            self.send_json({'success': False, 'error': str(e)})
+    @classmethod
+    def from_frame(cls, df, first_row=0):
+        """Columns from a DataFrame with the CSV template's header (one upload chunk).
 
-def run_server(port=8000):
-    server_address = ('', port)
-    httpd = HTTPServer(server_address, RequestHandler)
-    print(f'Starting MIG Optimizer Server on port {port}...')
-    print(f'Open http://localhost:{port} in your browser')
-    
-    # Auto-open browser
-    webbrowser.open(f'http://localhost:{port}')
-    
+        first_row is the chunk's offset in the file, for error messages. Duplicate
+        rows are kept; unique() drops them once the whole file is in.
+        """
+        missing = [column for column in RECORD_COLUMNS if column not in df]
+        if missing:
+            raise ValueError(f"CSV is missing {', '.join(missing)}")
+        empty = df[RECORD_COLUMNS].isna().any(axis=1).to_numpy()
+        if empty.any():
+            raise ValueError(f'Row {first_row + int(empty.argmax()) + 1} has empty values')
+        filler = pd.Index(FILLERS).get_indexer(df['Filler_Type'].str.strip())
+        if (filler < 0).any():
+            row = int((filler < 0).argmax())
+            raise ValueError(f"Row {first_row + row + 1}: unknown filler type {df['Filler_Type'].iloc[row]!r}; "
+                             f"expected one of {', '.join(FILLERS)}")
+        columns = {}
+        for column in cls.NUMERIC:
+            values = df[column]
+            if values.dtype == object or pd.api.types.is_string_dtype(values):
+                values = pd.to_numeric(values.str.strip(), errors='coerce')
+                if values.isna().any():
+                    row = int(values.isna().to_numpy().argmax())
+                    raise ValueError(f'Row {first_row + row + 1}: {column} is not a number '
+                                     f'({df[column].iloc[row]!r})')
+            columns[column] = values.to_numpy(dtype=np.float32)
+        columns['Filler_Code'] = filler.astype(np.uint8)
+        return cls(columns)
+
+    @classmethod
+    def concat(cls, datasets):
+        """All rows of datasets, in order, duplicates included."""
+        datasets = [cls()] + list(datasets)
+        return cls({column: np.concatenate([d.columns[column] for d in datasets])
+                    for column in datasets[0].columns})
+
+    @classmethod
+    def load(cls, path):
+        """A dataset saved by save(); a directory of columns loads memory-mapped.
+
+        Rows of a mapped dataset are paged in from disk as they are read, so it
+        can be larger than RAM. Older .npz files load into memory.
+        """
+        if path.endswith('.npz'):
+            with np.load(path) as npz:
+                return cls({column: npz[column] for column in npz.files})
+        columns = {name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode='r')
+                   for name in os.listdir(path) if name.endswith('.npy')}
+        # A crash while DatasetFiles.commit rewrote the headers can leave some
+        # columns longer; the rows all columns have are the committed ones
+        n = min(len(values) for values in columns.values())
+        return cls({column: values[:n] for column, values in columns.items()})
+
+    def save(self, path):
+        """Write every column to path/<column>.npy."""
+        os.makedirs(path, exist_ok=True)
+        for column, values in self.columns.items():
+            np.save(os.path.join(path, f'{column}.npy'), values)
+
+    @property
+    def on_disk(self):
+        return any(isinstance(values, np.memmap) for values in self.columns.values())
+
+    def __len__(self):
+        return len(self.columns['Filler_Code'])
+
+    def __getitem__(self, rows):
+        return WeldDataset({column: values[rows] for column, values in self.columns.items()})
+
+    def row_hashes(self):
+        """64-bit hash per row; equal rows hash equal whatever the column order."""
+        frame = pd.DataFrame({column: self.columns[column] for column in self.NUMERIC + ['Filler_Code']},
+                             copy=False)
+        return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+    def _row_keys(self):
+        """One opaque fixed-width key per row, for exact-duplicate detection."""
+        rows = np.column_stack([self.columns[column].view(np.uint32) for column in self.NUMERIC]
+                               + [self.columns['Filler_Code'].astype(np.uint32)])
+        return np.ascontiguousarray(rows).view(np.dtype((np.void, rows.shape[1] * 4))).ravel()
+
+    def unique(self):
+        """The first occurrence of every distinct row, in order.
+
+        Rows are hashed first and only those sharing a hash are compared
+        exactly, which keeps the scratch memory near 8 bytes per row.
+        """
+        hashes = pd.Series(self.row_hashes())
+        candidates = np.flatnonzero(hashes.duplicated(keep=False).to_numpy())
+        if not len(candidates):
+            return self
+        _, first = np.unique(self[candidates]._row_keys(), return_index=True)
+        keep = np.ones(len(self), dtype=bool)
+        keep[candidates] = False
+        keep[candidates[first]] = True
+        return self if keep.all() else self[keep]
+
+    def append(self, other):
+        """(new dataset, rows added): other's rows not already present, in order."""
+        combined = WeldDataset.concat([self, other]).unique()
+        return combined, len(combined) - len(self)
+
+    def records(self):
+        """Rows back as weld-record dicts."""
+        # float32 -> str -> float gives the shortest decimal, so 25.7 stays 25.7
+        values = {column: self.columns[column].astype(str).astype(float).tolist() for column in self.NUMERIC}
+        values['Filler_Type'] = [FILLERS[code] for code in self.columns['Filler_Code']]
+        return [{column: values[column][i] for column in RECORD_COLUMNS} for i in range(len(self))]
+
+    def features(self):
+        """(n, 6) float64 matrix in FEATURES order."""
+        return np.column_stack([self.columns[column].astype(float) for column in FEATURES])
+
+    def target(self, column):
+        return self.columns[column].astype(float)
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self.columns.values())
+
+    def digest(self):
+        h = hashlib.sha1()
+        for column in sorted(self.columns):
+            h.update(column.encode('utf-8'))
+            h.update(np.ascontiguousarray(self.columns[column]).data)  # no copy of mapped columns
+        return h.hexdigest()
+
+    def memory(self):
+        return {'rows': len(self), 'bytes': self.nbytes,
+                'bytes_per_row': self.nbytes / len(self) if len(self) else 0.0, 'on_disk': self.on_disk}
+
+
+def as_dataset(data):
+    return data if isinstance(data, WeldDataset) else WeldDataset.from_records(data)
+
+
+def _prepare(data):
+    """Feature frame and the two targets from a dataset or weld records."""
+    data = as_dataset(data)
+    X = pd.DataFrame(data.features(), columns=FEATURES)
+    return X, data.target('Tensile_Strength_MPa'), data.target('Penetration_Depth_mm')
+
+
+def train_models(training_data, engine=INFERENCE_ENGINE, model_mode=MODEL_MODE, progress=_no_progress,
+                 n_jobs=1, validation=VALIDATION):
+    """Train Random Forest models.
+
+    Returns the new model state and the cross-validation scores.
+    engine='flat' also compiles the forests for predict_batch.
+    model_mode='multi' fits one forest on both targets, standardised so
+    penetration is not drowned out by tensile's larger variance.
+    progress(phase, **info) is called as training moves through its phases.
+    n_jobs threads run the final fits and every CV fold concurrently; tree
+    building releases the GIL, and the threads share one scaled matrix.
+    validation picks k-fold or out-of-bag R^2; cv_scores['method'] says which.
+    """
+    if engine not in ('flat', 'sklearn'):
+        raise ValueError(f'Unknown inference engine: {engine}')
+    if model_mode not in ('separate', 'multi'):
+        raise ValueError(f'Unknown model mode: {model_mode}')
+    training_data = as_dataset(training_data)
+    if validation == 'auto':
+        validation = 'oob' if len(training_data) >= OOB_MIN_SAMPLES else 'kfold'
+    if validation not in ('kfold', 'oob'):
+        raise ValueError(f'Unknown validation method: {validation}')
+    oob = validation == 'oob'
+
+    # Prepare data
+    X, y_tensile, y_pen = _prepare(training_data)
+
+    # Scaling
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    cv = KFold(n_splits=3, shuffle=True, random_state=42)
+    folds = [] if oob else list(cv.split(X_scaled))
+    tensile_model = pen_model = joint_model = target_scaler = None
+
+    # Train Models
+    if model_mode == 'multi':
+        # One forest, one traversal for both targets
+        target_scaler = StandardScaler()
+        Y_scaled = target_scaler.fit_transform(np.column_stack([y_tensile, y_pen]))
+        joint_model = RandomForestRegressor(n_estimators=100, random_state=42, oob_score=oob)
+        targets = [(joint_model, Y_scaled)]
+    else:
+        tensile_model = RandomForestRegressor(n_estimators=100, random_state=42, oob_score=oob)
+        pen_model = RandomForestRegressor(n_estimators=100, random_state=42, oob_score=oob)
+        targets = [(tensile_model, y_tensile), (pen_model, y_pen)]
+
+    # Final fits first, then Cross Validation fold by fold; seeded, so the
+    # scores do not depend on how many run at once
+    # (oob_score only records out-of-bag predictions; the trees are unchanged)
+    folds_total = len(folds) * len(targets)
+    progress('fitting', **({} if oob else {'cv_folds_done': 0, 'cv_folds_total': folds_total}))
+    with ThreadPoolExecutor(max_workers=max(1, n_jobs), thread_name_prefix='fit') as pool:
+        fits = [pool.submit(model.fit, X_scaled, y) for model, y in targets]
+        fold_scores = [[pool.submit(_fold_r2, clone(model), X_scaled, y, train, test) for train, test in folds]
+                       for model, y in targets]
+        # The phase stays 'fitting' until the final forests exist, so its
+        # timing covers them even when folds finish first
+        fits_left, folds_done = len(fits), 0
+        for future in as_completed(fits + [f for per_target in fold_scores for f in per_target]):
+            future.result()
+            if future in fits:
+                fits_left -= 1
+            else:
+                folds_done += 1
+            if not oob and (fits_left == 0 or future not in fits):
+                progress('fitting' if fits_left else 'cross-validation',
+                         cv_folds_done=folds_done, cv_folds_total=folds_total)
+    if oob:
+        progress('oob-validation')
+        scores = [r2_score(y, model.oob_prediction_, multioutput='raw_values') for model, y in targets]
+    else:
+        scores = [np.mean([f.result() for f in per_target], axis=0) for per_target in fold_scores]
+    cv_tensile, cv_pen = np.concatenate(scores)
+
+    state = {
+        'tensile_model': tensile_model,
+        'penetration_model': pen_model,
+        'joint_model': joint_model,
+        'scaler': scaler,
+        'target_scaler': target_scaler,
+        'trained': True,
+        'training_data': training_data,
+        'cube': None,  # a retrain always invalidates the prediction cube
+        'version': model_version(training_data, model_mode=model_mode),
+        'flat': None
+    }
+    if engine == 'flat':
+        progress('compiling')
+        state['flat'] = compile_models(state)
+    cv_scores = {
+        'tensile_mean': float(cv_tensile),
+        'pen_mean': float(cv_pen),
+        'method': validation
+    }
+    return state, cv_scores
+
+
+def update_models(models, dataset, n_new, n_trees=INCREMENTAL_TREES, window=INCREMENTAL_WINDOW):
+    """Grow n_trees extra trees per forest on the newest rows of dataset.
+
+    Copies of the live forests are warm-started with the existing scaler, so
+    the models being served are untouched. The new trees see the last
+    max(n_new, window) rows. Returns the new state and a report that includes
+    how well the previous models predicted the n_new appended rows.
+    """
+    dataset = as_dataset(dataset)
+    X_new, t_new, p_new = _prepare(dataset[-n_new:])
+    report = {'trees_added': n_trees}
+    if n_new >= 2:
+        pred_t, pred_p = predict_batch(X_new.to_numpy(dtype=float), models)
+        report['new_data_r2_before'] = {'tensile': float(r2_score(t_new, pred_t)),
+                                        'pen': float(r2_score(p_new, pred_p))}
+
+    X, y_tensile, y_pen = _prepare(dataset[-max(n_new, window):])
+    X_scaled = models['scaler'].transform(X)
+    state = {'training_data': dataset, 'cube': None, 'flat': None,
+             'version': model_version(dataset, base=models['version'], added=len(dataset))}
+    if models['joint_model'] is not None:
+        Y = models['target_scaler'].transform(np.column_stack([y_tensile, y_pen]))
+        targets = [('joint_model', Y)]
+    else:
+        targets = [('tensile_model', y_tensile), ('penetration_model', y_pen)]
+    for key, y in targets:
+        forest = copy.deepcopy(models[key])
+        forest.set_params(warm_start=True, oob_score=False, n_estimators=len(forest.estimators_) + n_trees)
+        forest.fit(X_scaled, y)
+        forest.set_params(warm_start=False)
+        state[key] = forest
+    report['n_trees'] = len(state[targets[0][0]].estimators_)
+
+    state = dict(models, **state)
+    if models['flat'] is not None:
+        state['flat'] = compile_models(state)
+    return state, report
+
+
+def out_of_core_plan(n_rows, memory_mb=OUT_OF_CORE_MEMORY_MB, model_mode=MODEL_MODE,
+                     engine=INFERENCE_ENGINE, n_estimators=100):
+    """Rows per round, rounds and trees per round that fit in memory_mb.
+
+    The ceiling covers one round's rows in flight plus the finished forests
+    (and their flat copies with engine='flat'), which grow with the rows
+    each tree saw.
+    """
+    forests, outputs = (1, 2) if model_mode == 'multi' else (2, 1)
+    node_bytes = forests * (64 + 8 * outputs + (32 + 8 * outputs if engine == 'flat' else 0))
+    per_row = OOC_WORK_BYTES_PER_ROW + n_estimators * OOC_NODES_PER_ROW * node_bytes
+    budget = int(memory_mb * 1e6 // per_row)
+    holdout = min(OOC_HOLDOUT_ROWS, max(n_rows // 10, 2), budget)
+    rows = min(budget, n_rows - holdout)
+    if rows < min(OOC_MIN_ROWS, n_rows - holdout) or rows < 2:
+        raise ValueError(f'memory_mb={memory_mb} leaves {rows} rows per tree; '
+                         f'need {per_row * OOC_MIN_ROWS / 1e6:.1f} MB or more')
+    rounds = min(n_estimators, -(-(n_rows - holdout) // rows))
+    trees = -(-n_estimators // rounds)
+    return {
+        'memory_mb': memory_mb,
+        'rows_per_round': rows,
+        'rounds': -(-n_estimators // trees),
+        'trees_per_round': trees,
+        'holdout_rows': holdout,
+        'estimated_mb': (rows * per_row + holdout * OOC_WORK_BYTES_PER_ROW) / 1e6
+    }
+
+
+def train_out_of_core(dataset, memory_mb=OUT_OF_CORE_MEMORY_MB, engine=INFERENCE_ENGINE,
+                      model_mode=MODEL_MODE, progress=_no_progress, n_estimators=100):
+    """Train on a dataset that need not fit in memory, within memory_mb.
+
+    Open a saved dataset with WeldDataset.load(directory) to have its rows
+    paged in from disk. One streaming pass fits the scalers. Each round then
+    fits a few trees on a fresh random sample of rows, read in file order, and
+    the trees of all rounds are pooled into one forest per target. The plan
+    comes from out_of_core_plan. Returns the state and scores like
+    train_models; scores are R^2 on a holdout sample no round trains on.
+    """
+    if engine not in ('flat', 'sklearn'):
+        raise ValueError(f'Unknown inference engine: {engine}')
+    if model_mode not in ('separate', 'multi'):
+        raise ValueError(f'Unknown model mode: {model_mode}')
+    dataset = as_dataset(dataset)
+    n = len(dataset)
+    plan = out_of_core_plan(n, memory_mb, model_mode, engine, n_estimators)
+    rows = plan['rows_per_round']
+    rng = np.random.default_rng(42)
+    holdout = np.sort(rng.choice(n, plan['holdout_rows'], replace=False, shuffle=False))
+
+    progress('scaling')
+    scaler = StandardScaler()
+    target_scaler = StandardScaler() if model_mode == 'multi' else None
+    for start in range(0, n, rows):
+        X, y_tensile, y_pen = _prepare(dataset[start:start + rows])
+        scaler.partial_fit(X)
+        if target_scaler is not None:
+            target_scaler.partial_fit(np.column_stack([y_tensile, y_pen]))
+
+    forests = {}
+    for r in range(plan['rounds']):
+        progress('fitting', round=r + 1, rounds=plan['rounds'])
+        # Floyd's algorithm below n // 20 samples, so this stays O(rows), not O(n)
+        sample = np.sort(rng.choice(n, rows, replace=False, shuffle=False))
+        sample = sample[~np.isin(sample, holdout)]
+        X, y_tensile, y_pen = _prepare(dataset[sample])
+        X_scaled = scaler.transform(X)
+        if target_scaler is not None:
+            targets = {'joint_model': target_scaler.transform(np.column_stack([y_tensile, y_pen]))}
+        else:
+            targets = {'tensile_model': y_tensile, 'penetration_model': y_pen}
+        trees = min(plan['trees_per_round'], n_estimators - r * plan['trees_per_round'])
+        for key, y in targets.items():
+            forest = RandomForestRegressor(n_estimators=trees, random_state=42 + r).fit(X_scaled, y)
+            if key in forests:
+                forests[key].estimators_ += forest.estimators_
+            else:
+                forests[key] = forest
+    for forest in forests.values():
+        forest.n_estimators = len(forest.estimators_)
+
+    state = {key: forests.get(key) for key in FOREST_KEYS}
+    state.update({
+        'scaler': scaler,
+        'target_scaler': target_scaler,
+        'trained': True,
+        'training_data': dataset,
+        'cube': None,
+        'version': model_version(dataset, model_mode=model_mode, out_of_core=memory_mb),
+        'flat': None
+    })
+    if engine == 'flat':
+        progress('compiling')
+        state['flat'] = compile_models(state)
+    progress('holdout-validation')
+    X, y_tensile, y_pen = _prepare(dataset[holdout])
+    pred_t, pred_p = predict_batch(X.to_numpy(dtype=float), state)
+    cv_scores = {
+        'tensile_mean': float(r2_score(y_tensile, pred_t)),
+        'pen_mean': float(r2_score(y_pen, pred_p)),
+        'method': 'holdout'
+    }
+    return state, cv_scores
+
+
+def model_version(training_data, **options):
+    """Short content hash identifying models trained on this data with these options.
+
+    Training is seeded, so equal data and options give identical models.
+    """
+    blob = as_dataset(training_data).digest() + json.dumps(options, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()[:12]
+
+
+def predict_batch(features, models=None):
+    """Scale a (n, 6) feature matrix once and score it with both forests.
+
+    Returns (tensile, penetration) as float64 arrays of length n. Uses the
+    compiled flat forests when present; the numbers are the same either way.
+    A joint multi-output model answers both targets from one traversal.
+    """
+    models = active_models(models)
+    flat = models.get('flat')
+    if flat is not None and len(features) <= FLAT_MAX_ROWS:
+        features_scaled = (np.asarray(features, dtype=float) - flat['mean']) / flat['scale']
+        if 'joint' not in flat:
+            return flat['tensile'].predict(features_scaled), flat['penetration'].predict(features_scaled)
+        both = flat['joint'].predict(features_scaled)
+    else:
+        features_scaled = models['scaler'].transform(features)
+        if models.get('joint_model') is None:
+            tensile = models['tensile_model'].predict(features_scaled)
+            pen = models['penetration_model'].predict(features_scaled)
+            return tensile, pen
+        both = models['joint_model'].predict(features_scaled)
+    both = both * models['target_scaler'].scale_ + models['target_scaler'].mean_
+    return both[:, 0], both[:, 1]
+
+# ============================================
+# FLAT FOREST INFERENCE
+# ============================================
+FLAT_BLOCK = 1024  # rows traversed together; memory is rows x trees node ids
+# Above this many rows sklearn's compiled traversal beats the NumPy one, so
+# predict_batch hands larger batches back to the sklearn forests.
+FLAT_MAX_ROWS = 256
+
+
+class FlatForest:
+    """A fitted forest flattened into contiguous node arrays.
+
+    All trees share one set of arrays, indexed from each tree's root offset;
+    children[2 * node] is the left child and children[2 * node + 1] the right.
+    Leaves point at themselves. Matches sklearn bit for bit: features are
+    compared as float32 and per-tree predictions are summed in estimator
+    order before dividing.
+    """
+
+    def __init__(self, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+        feature, threshold, children, value = [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            leaf = tree.children_left == -1
+            nodes = np.arange(tree.node_count) + offset
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(np.where(leaf, np.inf, tree.threshold))
+            children.append(np.column_stack([np.where(leaf, nodes, tree.children_left + offset),
+                                             np.where(leaf, nodes, tree.children_right + offset)]))
+            value.append(tree.value[:, :, 0])
+
+        self.roots = offsets.astype(np.intp)
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold)
+        self.children = np.concatenate(children).ravel().astype(np.intp)
+        self.value = np.concatenate(value)
+        self.depth = max(tree.max_depth for tree in trees)
+        self.n_outputs = self.value.shape[1]
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild from vars() of a FlatForest, e.g. memory-mapped from the model store."""
+        flat = cls.__new__(cls)
+        flat.__dict__.update(arrays)
+        return flat
+
+    def _leaves(self, X):
+        """Leaf node of every (row, tree) pair, shaped (n, trees).
+
+        Walks one level per step, dropping pairs as they reach a leaf.
+        """
+        n, n_features = X.shape
+        n_trees = len(self.roots)
+        leaves = np.tile(self.roots, n)
+        pairs = np.arange(n * n_trees)
+        node = leaves.copy()
+        row_base = np.repeat(np.arange(n) * n_features, n_trees)
+        values = X.ravel()
+        for _ in range(self.depth):
+            go_right = ~(values[row_base + self.feature[node]] <= self.threshold[node])
+            child = self.children[2 * node + go_right]
+            leaves[pairs] = child
+            moving = child != node
+            pairs, node, row_base = pairs[moving], child[moving], row_base[moving]
+            if not len(pairs):
+                break
+        return leaves.reshape(n, n_trees)
+
+    def predict(self, X, block=FLAT_BLOCK):
+        """Mean tree prediction, shaped (n,) or (n, n_outputs) like sklearn."""
+        X = np.asarray(X, dtype=np.float32)
+        out = np.empty((len(X), self.n_outputs))
+        for start in range(0, len(X), block):
+            leaf_values = self.value[self._leaves(X[start:start + block])]
+            # cumsum adds trees left to right, as sklearn's accumulation does
+            out[start:start + block] = np.cumsum(leaf_values, axis=1)[:, -1] / len(self.roots)
+        return out[:, 0] if self.n_outputs == 1 else out
+
+
+def compile_models(state):
+    """Flat-array copies of the fitted scaler and forests."""
+    flat = {'mean': state['scaler'].mean_, 'scale': state['scaler'].scale_}
+    if state.get('joint_model') is not None:
+        flat['joint'] = FlatForest(state['joint_model'])
+    else:
+        flat['tensile'] = FlatForest(state['tensile_model'])
+        flat['penetration'] = FlatForest(state['penetration_model'])
+    return flat
+
+# ============================================
+# OPTIMIZER ENGINE
+# ============================================
+MIN_PENETRATION_MM = 3.0  # Hard requirement "Full Penetration (>3mm)"
+TOP_K = 5
+DEFAULT_CHUNK_SIZE = 50000  # grid rows per block in chunked mode
+SHARDS_PER_WORKER = 4  # smaller shards even out workers that hit more feasible rows
+MAX_WORKERS = os.cpu_count() or 1  # cap on a request's 'workers': each is a process
+ADAPTIVE_COARSE_POINTS = 8  # coarse-grid intervals per axis in adaptive mode
+ADAPTIVE_REGIONS = 32  # best points refined per adaptive level
+# Differential evolution (mode='evolution')
+DE_POPULATION = 40
+DE_GENERATIONS = 60
+DE_MUTATION = 0.7
+DE_CROSSOVER = 0.9
+DE_TOLERANCE = 1e-3  # stop once every free axis spans < 0.1% of its range
+DE_DECIMALS = 1  # reported settings are rounded to what a welding set can dial in
+
+# Grid axes in flat-index order. The first three reproduce the original
+# (current, speed, filler) loop nesting; the rest are singletons unless swept.
+GRID_AXES = ('currents', 'speeds', 'fillers', 'voltages', 'interpasses', 'efficiencies')
+# Pinned-input key, default and default sweep step for the optional sweep axes
+SWEEP_INPUTS = {
+    'voltages': ('voltage', 22, 1),
+    'interpasses': ('interpass_temp', 25, 5),
+    'efficiencies': ('efficiency', 0.6, 0.05)
+}
+SWEEP_COLUMNS = {'voltages': 'Voltage_V', 'interpasses': 'Interpass_Temp_C', 'efficiencies': 'Efficiency'}
+
+
+def grid_axis(lo, hi, step):
+    """Inclusive axis lo, lo + step, ... <= hi.
+
+    Integer bounds reproduce `range(lo, hi + 1, step)` exactly; any float
+    bound switches to a float axis rounded to kill accumulation noise.
+    """
+    if step <= 0:
+        raise ValueError('Grid step must be positive')
+    if all(isinstance(v, int) for v in (lo, hi, step)):
+        return np.arange(lo, hi + 1, step)
+    n = int(np.floor((hi - lo) / step + 1e-9)) + 1
+    return np.round(lo + step * np.arange(max(n, 0)), 9)
+
+
+def _sweep_axis(data, key, default, step):
+    """Single pinned value, or a swept axis when `<key>_min`/`<key>_max` are given."""
+    prefix = key.replace('_temp', '')  # interpass_temp -> interpass_min/_max/_step
+    pinned = data.get(key, default)
+    if f'{prefix}_min' not in data and f'{prefix}_max' not in data:
+        return np.array([pinned])
+    return grid_axis(data.get(f'{prefix}_min', pinned), data.get(f'{prefix}_max', pinned),
+                     data.get(f'{prefix}_step', step))
+
+
+def parse_optimize_request(data):
+    """Normalise an /api/optimize body into search parameters."""
+    filler_pref = data.get('filler_preference', 'both')
+    fillers = []
+    if filler_pref in ['both', 'ER309L']: fillers.append('ER309L')
+    if filler_pref in ['both', 'ER316L']: fillers.append('ER316L')
+
+    # Per-axis steps fall back to the shared 'step'
+    step = data.get('step', 5)
+
+    params = {
+        'max_hi': float(data.get('max_heat_input', 1.2)),
+        'target_pen': float(data.get('plate_thickness', 3.0)),  # Usually target >= thickness
+        'currents': grid_axis(data.get('current_min', 80), data.get('current_max', 150),
+                              data.get('current_step', step)),
+        'speeds': grid_axis(data.get('speed_min', 80), data.get('speed_max', 200),
+                            data.get('speed_step', step)),
+        'fillers': fillers,
+        'chunk_size': int(data.get('chunk_size', DEFAULT_CHUNK_SIZE)),
+        'workers': min(int(data.get('workers', MAX_WORKERS)), MAX_WORKERS),
+        'coarse_points': int(data.get('coarse_points', ADAPTIVE_COARSE_POINTS)),
+        'regions': int(data.get('regions', ADAPTIVE_REGIONS)),
+        'compare_exhaustive': bool(data.get('compare_exhaustive', False)),
+        'population': int(data.get('population', DE_POPULATION)),
+        'generations': int(data.get('generations', DE_GENERATIONS)),
+        'mutation': float(data.get('mutation', DE_MUTATION)),
+        'crossover': float(data.get('crossover', DE_CROSSOVER)),
+        'decimals': int(data.get('decimals', DE_DECIMALS)),
+        'seed': int(data.get('seed', 42))
+    }
+    for axis, (key, default, sweep_step) in SWEEP_INPUTS.items():
+        params[axis] = _sweep_axis(data, key, default, sweep_step)
+    return params
+
+
+def grid_shape(params):
+    return tuple(len(params[axis]) for axis in GRID_AXES)
+
+
+def _candidate(point, hi, pred_t, pred_p, params):
+    """Result row for one grid point given as a tuple of axis values."""
+    curr, spd, fil, volt, temp, eff = point
+    candidate = {
+        'Current_A': curr,
+        'Speed_mm_min': spd,
+        'Filler_Type': fil
+    }
+    # Swept inputs are reported; pinned ones are already in the request
+    for axis, value in zip(('voltages', 'interpasses', 'efficiencies'), (volt, temp, eff)):
+        if len(params[axis]) > 1:
+            candidate[SWEEP_COLUMNS[axis]] = value
+    candidate.update({
+        'Heat_Input_kJ_mm': hi,
+        'Pred_Tensile_MPa': pred_t,
+        'Pred_Penetration_mm': pred_p,
+        'Safety_Margin_HI': params['max_hi'] - hi
+    })
+    return candidate
+
+
+def _optimize_response(top, total_scanned, valid_count, rejected_hi, rejected_pen):
+    statistics = {
+        'total_scanned': total_scanned,
+        'valid_count': valid_count,
+        'rejected_hi': rejected_hi,
+        'rejected_pen': rejected_pen
+    }
+    if not top:
+        return {
+            'success': False,
+            'error': 'No solution found satisfying all constraints. Try relaxing Heat Input limits or Speed ranges.',
+            'statistics': statistics
+        }
+    return {
+        'success': True,
+        'optimal': top[0],
+        'top5': top[:TOP_K],
+        'statistics': statistics
+    }
+
+
+def optimize_loop(params, models=None):
+    """Reference optimizer: one scaler/predict round trip per grid point.
+
+    Kept as the baseline the vectorized engine is checked and benchmarked against.
+    """
+    models = active_models(models)
+    max_hi = params['max_hi']
+
+    candidates = []
+    total_scanned = 0
+    rejected_hi = 0
+    rejected_pen = 0
+
+    for point in itertools.product(*(list(params[axis]) if axis == 'fillers' else params[axis].tolist()
+                                     for axis in GRID_AXES)):
+        curr, spd, fil, voltage, interpass, efficiency = point
+        total_scanned += 1
+
+        hi = (voltage * curr * efficiency) / spd
+
+        # Constraint 1: Heat Input
+        if hi > max_hi:
+            rejected_hi += 1
+            continue
+
+        f_code = FILLERS.index(fil)
+        feats = np.array([[curr, voltage, spd, f_code, interpass, hi]])
+        pred_t, pred_p = predict_batch(feats, models)
+        pred_t, pred_p = float(pred_t[0]), float(pred_p[0])
+
+        # Constraint 2: Penetration
+        if pred_p < MIN_PENETRATION_MM:
+            rejected_pen += 1
+            continue
+
+        candidates.append(_candidate(point, hi, pred_t, pred_p, params))
+
+    # Sort by Tensile Strength (Desc)
+    candidates.sort(key=lambda x: x['Pred_Tensile_MPa'], reverse=True)
+
+    return _optimize_response(candidates[:TOP_K], total_scanned, len(candidates),
+                              rejected_hi, rejected_pen)
+
+
+def select_top_k(tensile, order_key, k=TOP_K):
+    """Positions of the k best rows: tensile descending, ties by `order_key` ascending.
+
+    `order_key` is the flat grid index, which reproduces the stable sort of
+    the loop optimizer. `argpartition` prunes to the k-th value first so
+    only the boundary rows are fully sorted.
+    """
+    if len(tensile) > k:
+        kth = -np.partition(-tensile, k - 1)[k - 1]
+        pool = np.flatnonzero(tensile >= kth)
+    else:
+        pool = np.arange(len(tensile))
+    return pool[np.lexsort((order_key[pool], -tensile[pool]))[:k]]
+
+
+def _empty_top():
+    return {'index': np.empty(0, dtype=np.int64), 'hi': np.empty(0),
+            'tensile': np.empty(0), 'pen': np.empty(0)}
+
+
+def merge_top(parts, k=TOP_K):
+    """Merge partial top-k dicts (from blocks or shards) into one top-k."""
+    merged = {key: np.concatenate([part[key] for part in parts]) for key in _empty_top()}
+    keep = select_top_k(merged['tensile'], merged['index'], k)
+    return {key: values[keep] for key, values in merged.items()}
+
+
+def grid_heat_input(params, flat):
+    """Heat input of the grid points at flat indices `flat` (no model call)."""
+    ci, si, _, vi, _, ei = np.unravel_index(flat, grid_shape(params))
+    return (params['voltages'][vi] * params['currents'][ci] * params['efficiencies'][ei]) / params['speeds'][si]
+
+
+def evaluate_points(params, flat, models=None):
+    """Apply the heat-input limit to grid points `flat` and score the survivors.
+
+    Returns a dict of index, hi, tensile and pen for the points that passed
+    the heat-input mask, each scored by one batched transform+predict per model.
+    """
+    models = active_models(models)
+    ci, si, fi, vi, ti, ei = np.unravel_index(flat, grid_shape(params))
+    curr = params['currents'][ci]
+    spd = params['speeds'][si]
+    volt = params['voltages'][vi]
+    eff = params['efficiencies'][ei]
+
+    # Constraint 1: Heat Input (analytic, no model call)
+    hi = (volt * curr * eff) / spd
+    feasible = hi <= params['max_hi']
+    if not feasible.any():
+        return _empty_top()
+
+    codes = np.array([FILLERS.index(f) for f in params['fillers']], dtype=int)
+    X = np.empty((int(feasible.sum()), len(FEATURES)))
+    X[:, 0] = curr[feasible]
+    X[:, 1] = volt[feasible]
+    X[:, 2] = spd[feasible]
+    X[:, 3] = codes[fi[feasible]]
+    X[:, 4] = params['interpasses'][ti[feasible]]
+    X[:, 5] = hi[feasible]
+
+    pred_t, pred_p = predict_batch(X, models)
+    return {'index': flat[feasible], 'hi': hi[feasible], 'tensile': pred_t, 'pen': pred_p}
+
+
+def scan_grid(params, models=None, chunk_size=None, start=0, stop=None):
+    """Stream grid points [start, stop) through the models block by block.
+
+    Each block is a contiguous run of flat grid indices (C order == loop
+    order). Heat input is masked before any model call, each block gets one
+    batched transform+predict per model, and only a running top-k survives
+    between blocks, so peak memory is bounded by `chunk_size` instead of the
+    grid size. `chunk_size=None` scores the whole range as one block.
+
+    Returns (top, counters): `top` holds flat index, HI and predictions of
+    the best rows; `counters` the scanned/valid/rejected tallies.
+    """
+    models = active_models(models)
+    stop = int(np.prod(grid_shape(params))) if stop is None else stop
+    chunk_size = max(stop - start if chunk_size is None else int(chunk_size), 1)
+
+    top = _empty_top()
+    counters = {'total_scanned': max(stop - start, 0), 'valid_count': 0,
+                'rejected_hi': 0, 'rejected_pen': 0}
+
+    for block_start in range(start, stop, chunk_size):
+        flat = np.arange(block_start, min(block_start + chunk_size, stop), dtype=np.int64)
+        scored = evaluate_points(params, flat, models)
+        counters['rejected_hi'] += len(flat) - len(scored['index'])
+
+        # Constraint 2: Penetration
+        valid = scored['pen'] >= MIN_PENETRATION_MM
+        n_valid = int(valid.sum())
+        counters['valid_count'] += n_valid
+        counters['rejected_pen'] += len(scored['index']) - n_valid
+        if not n_valid:
+            continue
+
+        # Merge the block's survivors into the running top-k
+        top = merge_top([top, {key: values[valid] for key, values in scored.items()}])
+
+    return top, counters
+
+
+def grid_candidates(params, rows):
+    """Result rows for scored grid points (dict of index, hi, tensile, pen arrays)."""
+    idx = np.unravel_index(rows['index'], grid_shape(params))
+    values = [[params[axis][i] for i in ix] if axis == 'fillers' else params[axis][ix].tolist()
+              for axis, ix in zip(GRID_AXES, idx)]
+    return [_candidate(point, hi, t, p, params)
+            for point, hi, t, p in zip(zip(*values), rows['hi'].tolist(),
+                                       rows['tensile'].tolist(), rows['pen'].tolist())]
+
+
+def grid_columns(params, rows):
+    """Like `grid_candidates`, but one array per field instead of a dict per point."""
+    idx = np.unravel_index(rows['index'], grid_shape(params))
+    axes = dict(zip(GRID_AXES, idx))
+    columns = {
+        'Current_A': params['currents'][axes['currents']],
+        'Speed_mm_min': params['speeds'][axes['speeds']],
+        'Filler_Type': [params['fillers'][i] for i in axes['fillers'].tolist()]
+    }
+    for axis, column in SWEEP_COLUMNS.items():
+        if len(params[axis]) > 1:
+            columns[column] = params[axis][axes[axis]]
+    columns.update({
+        'Heat_Input_kJ_mm': rows['hi'],
+        'Pred_Tensile_MPa': rows['tensile'],
+        'Pred_Penetration_mm': rows['pen'],
+        'Safety_Margin_HI': params['max_hi'] - rows['hi']
+    })
+    return columns
+
+
+def records_to_columns(records):
+    """{field: [value per record]} for a list of same-keyed dicts."""
+    return {key: [record[key] for record in records] for key in (records[0] if records else {})}
+
+
+def _grid_response(params, top, counters):
+    return _optimize_response(grid_candidates(params, top), counters['total_scanned'],
+                              counters['valid_count'], counters['rejected_hi'], counters['rejected_pen'])
+
+
+def optimize_vectorized(params, models=None):
+    """Score the whole feasible grid with one batched transform+predict per model."""
+    models = active_models(models)
+    top, counters = scan_grid(params, models)
+    return _grid_response(params, top, counters)
+
+
+def optimize_chunked(params, models=None):
+    """Like `optimize_vectorized`, but in fixed-size blocks with flat peak memory."""
+    models = active_models(models)
+    top, counters = scan_grid(params, models, chunk_size=params['chunk_size'])
+    return _grid_response(params, top, counters)
+
+# Process pool for mode='parallel'. Workers get the models once, through the
+# pool initializer, and keep them for every shard until the models change.
+# A replaced pool is shut down only once the requests still using it are done.
+_POOL = {'executor': None, 'workers': 0, 'version': None, 'users': {}}
+_POOL_LOCK = threading.Lock()
+_WORKER_MODELS = {}
+
+
+def _init_worker(models_blob):
+    _WORKER_MODELS.update(pickle.loads(models_blob))
+
+
+def _scan_shard(params, start, stop):
+    return scan_grid(params, _WORKER_MODELS, chunk_size=params['chunk_size'], start=start, stop=stop)
+
+
+def _retire_pool(executor):
+    """Shut executor down if no request is using it. Needs _POOL_LOCK."""
+    if executor is not None and executor is not _POOL['executor'] and not _POOL['users'].get(executor):
+        _POOL['users'].pop(executor, None)
+        executor.shutdown(wait=False)
+
+
+@contextlib.contextmanager
+def _pooled(models, workers):
+    """A process pool holding models with at least `workers` workers, for one request.
+
+    The pool is reused while the model version is unchanged and it has
+    enough workers; a request asking for fewer runs on it as is, so
+    alternating worker counts do not rebuild it. Workers start from a fork
+    server: forking the threaded server itself would copy whatever locks its
+    other threads hold at that moment.
+    """
+    with _POOL_LOCK:
+        same_models = _POOL['version'] == models['version']
+        if _POOL['executor'] is None or not same_models or _POOL['workers'] < workers:
+            old = _POOL['executor']
+            # Pickle once here; each worker unpickles once at start-up
+            blob = pickle.dumps({key: models[key] for key in
+                                 ('tensile_model', 'penetration_model', 'joint_model',
+                                  'scaler', 'target_scaler')})
+            workers = max(workers, _POOL['workers'] if same_models else 0)
+            _POOL['executor'] = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                    initargs=(blob,),
+                                                    mp_context=multiprocessing.get_context('forkserver'))
+            _POOL['workers'] = workers
+            _POOL['version'] = models['version']
+            _retire_pool(old)
+        executor = _POOL['executor']
+        _POOL['users'][executor] = _POOL['users'].get(executor, 0) + 1
+    try:
+        yield executor
+    finally:
+        with _POOL_LOCK:
+            _POOL['users'][executor] -= 1
+            _retire_pool(executor)
+
+
+def optimize_parallel(params, models=None):
+    """Shard the flat grid across a process pool and merge the partial top-k.
+
+    Each shard is scanned in chunks by `scan_grid` inside a worker; only the
+    shard's top-k and rejection counters travel back to the parent.
+    """
+    models = active_models(models)
+    total = int(np.prod(grid_shape(params)))
+    workers = max(min(params['workers'], MAX_WORKERS, total), 1)
+    n_shards = min(workers * SHARDS_PER_WORKER, total) or 1
+    bounds = np.linspace(0, total, n_shards + 1).astype(np.int64)
+
+    with _pooled(models, workers) as executor:
+        futures = [executor.submit(_scan_shard, params, int(lo), int(hi))
+                   for lo, hi in zip(bounds[:-1], bounds[1:])]
+        results = [future.result() for future in futures]
+
+    top = merge_top([part for part, _ in results])
+    counters = {key: sum(c[key] for _, c in results) for key in results[0][1]}
+    return _grid_response(params, top, counters)
+
+
+def count_heat_feasible(params):
+    """Grid points passing the heat-input limit, i.e. the exhaustive scan's model rows.
+
+    HI ignores filler and interpass, so only the (current, speed, voltage,
+    efficiency) sub-grid is evaluated, one current at a time.
+    """
+    spd = params['speeds'][:, None, None]
+    volt = params['voltages'][None, :, None]
+    eff = params['efficiencies'][None, None, :]
+    count = sum(int(((volt * curr * eff) / spd <= params['max_hi']).sum())
+                for curr in params['currents'])
+    return count * len(params['fillers']) * len(params['interpasses'])
+
+
+def _coarse_stride(n, coarse_points):
+    """Largest power-of-two stride leaving at least `coarse_points` intervals."""
+    if n - 1 < 2 * coarse_points:
+        return 1
+    return 1 << int(np.log2((n - 1) / coarse_points))
+
+
+def _region_scores(scored):
+    """Rank scored points for refinement: valid by tensile, then near-misses on penetration."""
+    return np.where(scored['pen'] >= MIN_PENETRATION_MM, scored['tensile'],
+                    scored['pen'] - 1e6)
+
+
+def _pick_regions(ranked, shape, strides, n_regions):
+    """Best-first region centres, skipping any inside an already picked cell.
+
+    Without the spacing rule the picks pile up on one stretch of the
+    tensile ridge and the rest of it is never refined.
+    """
+    picked = []
+    for flat in ranked:
+        point = np.array(np.unravel_index(flat, shape))
+        if all((np.abs(point - other) >= strides).any() for other in picked):
+            picked.append(point)
+            if len(picked) == n_regions:
+                break
+    return np.ravel_multi_index(np.array(picked).T, shape) if picked else ranked[:0]
+
+
+def optimize_adaptive(params, models=None):
+    """Coarse-to-fine search over the requested grid.
+
+    Evaluates every `stride`-th point per axis, keeps the best `regions`
+    points, then halves the strides and evaluates the sub-grid within one
+    old stride of each, recursing until the strides reach the requested
+    resolution. Stride-1 passes then repeat until the best regions stop
+    moving. Each level is one batched predict; points already scored are
+    never re-evaluated.
+    """
+    models = active_models(models)
+    shape = grid_shape(params)
+    strides = np.array([_coarse_stride(n, params['coarse_points']) for n in shape])
+
+    # Level 0: strided grid, always including each axis' last point
+    axes = [np.unique(np.r_[np.arange(0, n, s), n - 1]) if n else np.arange(0)
+            for n, s in zip(shape, strides)]
+    flat = np.ravel_multi_index(np.meshgrid(*axes, indexing='ij'), shape).ravel()
+
+    seen = np.empty(0, dtype=np.int64)
+    scored = _empty_top()
+    centers = None
+    levels = 0
+    while len(flat):
+        seen = np.union1d(seen, flat)
+        scored = merge_top([scored, evaluate_points(params, flat, models)], k=len(seen))
+        levels += 1
+        if not len(scored['index']):
+            break
+
+        # At full resolution, keep hill-climbing until the best regions settle
+        scores = _region_scores(scored)
+        previous = centers
+        centers = _pick_regions(scored['index'][np.lexsort((scored['index'], -scores))],
+                                shape, strides, params['regions'])
+        if (strides == 1).all() and previous is not None and np.array_equal(np.sort(centers), np.sort(previous)):
+            break
+
+        # Refine around the best regions at half the stride
+        fine = np.maximum(strides // 2, 1)
+        neighbourhood = [np.arange(-s, s + 1, f) for s, f in zip(strides, fine)]
+        offsets = np.stack([o.ravel() for o in np.meshgrid(*neighbourhood, indexing='ij')], axis=1)
+        cells = np.array(np.unravel_index(centers, shape)).T[:, None, :] + offsets[None, :, :]
+        cells = cells.reshape(-1, len(shape))
+        cells = cells[((cells >= 0) & (cells < np.array(shape))).all(axis=1)]
+        flat = np.setdiff1d(np.ravel_multi_index(cells.T, shape), seen)
+        strides = fine
+
+    valid = scored['pen'] >= MIN_PENETRATION_MM
+    top = merge_top([{key: values[valid] for key, values in scored.items()}])
+    counters = {
+        'total_scanned': len(seen),
+        'valid_count': int(valid.sum()),
+        'rejected_hi': len(seen) - len(scored['index']),
+        'rejected_pen': int((~valid).sum())
+    }
+    response = _grid_response(params, top, counters)
+
+    exhaustive = count_heat_feasible(params)
+    response['statistics'].update({
+        'grid_points': int(np.prod(shape)),
+        'levels': levels,
+        'model_evaluations': len(scored['index']),
+        'exhaustive_model_evaluations': exhaustive,
+        'evaluations_saved': exhaustive - len(scored['index'])
+    })
+
+    if params['compare_exhaustive']:
+        reference = optimize_chunked(params, models)
+        response['exhaustive_check'] = {
+            'optimal': reference.get('optimal'),
+            'optimal_matches': reference.get('optimal') == response.get('optimal'),
+            'top5_matches': reference.get('top5') == response.get('top5'),
+            'tensile_gap_MPa': (reference['optimal']['Pred_Tensile_MPa'] - response['optimal']['Pred_Tensile_MPa']
+                                if reference['success'] and response['success'] else None)
+        }
+    return response
+
+
+def _repair_heat_input(params, pop, lower, upper):
+    """Pull heat-input violators back onto the limit: speed up first, then drop current.
+
+    The 1e-12 nudges keep rounding from leaving a repaired point one ulp over.
+    """
+    curr, spd, _, volt, _, eff = pop.T
+    over = (volt * curr * eff) / spd > params['max_hi']
+    spd[over] = np.minimum((volt * curr * eff)[over] / params['max_hi'] * (1 + 1e-12), upper[1])
+    over = (volt * curr * eff) / spd > params['max_hi']
+    curr[over] = np.maximum((params['max_hi'] * spd / (volt * eff))[over] * (1 - 1e-12), lower[0])
+    return pop
+
+
+def _round_settings(params, pop, lower, upper):
+    """Round the searched axes to `decimals` and repair heat input on that grid.
+
+    Speed is rounded up and current down, just far enough to meet the limit,
+    so the values later scored are exactly the values reported. Pinned axes
+    keep their requested value. Rows still over the limit stay over; the
+    caller drops them.
+    """
+    scale = 10.0 ** params['decimals']
+    free = upper > lower
+    lo = np.where(free, np.ceil(lower * scale) / scale, lower)
+    hi = np.where(free, np.floor(upper * scale) / scale, upper)
+    pop = pop.copy()
+    pop[:, free] = np.clip(np.round(pop[:, free] * scale) / scale, lo[free], hi[free])
+    curr, spd, _, volt, _, eff = pop.T
+    over = (volt * curr * eff) / spd > params['max_hi']
+    spd[over] = np.minimum(np.ceil((volt * curr * eff)[over] / params['max_hi'] * scale) / scale, hi[1])
+    over = (volt * curr * eff) / spd > params['max_hi']
+    curr[over] = np.maximum(np.floor((params['max_hi'] * spd / (volt * eff))[over] * scale) / scale, lo[0])
+    return pop
+
+
+def _evaluate_population(params, pop, models):
+    """Score a whole population with one batched predict.
+
+    Fitness follows feasibility-first ranking: feasible members score their
+    tensile strength, infeasible ones a large negative penalty scaled by how
+    far they miss the heat-input and penetration limits.
+    """
+    curr, spd, fil, volt, temp, eff = pop.T
+    codes = np.array([FILLERS.index(f) for f in params['fillers']], dtype=int)
+    hi = (volt * curr * eff) / spd
+    X = np.column_stack([curr, volt, spd, codes[fil.astype(int)], temp, hi])
+    pred_t, pred_p = predict_batch(X, models)
+
+    over_hi = np.maximum(hi - params['max_hi'], 0)
+    under_pen = np.maximum(MIN_PENETRATION_MM - pred_p, 0)
+    feasible = (over_hi == 0) & (under_pen == 0)
+    fitness = np.where(feasible, pred_t, -1e6 - 1e3 * over_hi - under_pen)
+    return {'fitness': fitness, 'hi': hi, 'tensile': pred_t, 'pen': pred_p,
+            'valid_count': int(feasible.sum()),
+            'rejected_hi': int((over_hi > 0).sum()),
+            'rejected_pen': int(((over_hi == 0) & (under_pen > 0)).sum())}
+
+
+def optimize_evolution(params, models=None):
+    """Differential evolution (DE/rand/1/bin) over the continuous parameter box.
+
+    Each axis is searched continuously between its requested min and max
+    (filler is a rounded categorical gene), so the optimum is not limited
+    to grid points. Every generation is scored with one batched predict;
+    heat-input violations are repaired by raising speed or lowering
+    current, penetration shortfalls are penalised. The final population is
+    rounded to `decimals` (_round_settings) and re-scored, so reported
+    predictions belong to exactly the reported settings.
+    """
+    models = active_models(models)
+    if not params['fillers'] or not all(len(params[axis]) for axis in GRID_AXES):
+        return _optimize_response([], 0, 0, 0, 0)
+
+    rng = np.random.default_rng(params['seed'])
+    lower = np.array([0.0 if axis == 'fillers' else float(params[axis][0]) for axis in GRID_AXES])
+    upper = np.array([len(params['fillers']) - 1.0 if axis == 'fillers' else float(params[axis][-1])
+                      for axis in GRID_AXES])
+    free = np.flatnonzero(upper > lower)
+    n = max(params['population'], 4)
+
+    def decode(pop):
+        pop = np.clip(pop, lower, upper)
+        pop[:, 2] = np.rint(pop[:, 2])
+        return _repair_heat_input(params, pop, lower, upper)
+
+    pop = decode(lower + rng.random((n, len(GRID_AXES))) * (upper - lower))
+    scored = _evaluate_population(params, pop, models)
+    counters = {'total_scanned': 0, 'valid_count': 0, 'rejected_hi': 0, 'rejected_pen': 0}
+
+    def tally(evaluated, count):
+        counters['total_scanned'] += count
+        for key in ('valid_count', 'rejected_hi', 'rejected_pen'):
+            counters[key] += evaluated[key]
+
+    tally(scored, n)
+
+    generations = 0
+    for _ in range(params['generations']):
+        # Forest outputs are piecewise constant, so equal fitness is not
+        # convergence; stop once the population has collapsed in space
+        spread = np.ptp(pop[:, free], axis=0) / (upper - lower)[free]
+        if not len(free) or (spread < DE_TOLERANCE).all():
+            break
+        generations += 1
+
+        # Three distinct donors per member, none equal to the member itself
+        donors = rng.random((n, n - 1)).argsort(axis=1)[:, :3]
+        donors += donors >= np.arange(n)[:, None]
+        a, b, c = pop[donors[:, 0]], pop[donors[:, 1]], pop[donors[:, 2]]
+        mutant = a + params['mutation'] * (b - c)
+        # Bounce out-of-box genes to midway between parent and bound; clipping
+        # would stack them on one corner, which the HI repair then merges
+        mutant = np.where(mutant < lower, (pop + lower) / 2, mutant)
+        mutant = np.where(mutant > upper, (pop + upper) / 2, mutant)
+
+        cross = np.zeros_like(pop, dtype=bool)
+        cross[:, free] = rng.random((n, len(free))) < params['crossover']
+        cross[np.arange(n), rng.choice(free, n)] = True
+        trial = decode(np.where(cross, mutant, pop))
+
+        trial_scored = _evaluate_population(params, trial, models)
+        tally(trial_scored, n)
+
+        better = trial_scored['fitness'] >= scored['fitness']
+        pop[better] = trial[better]
+        scored = {key: np.where(better, trial_scored[key], scored[key]) if np.ndim(value) else value
+                  for key, value in scored.items()}
+
+    # Report machine-settable values: round, dedupe, re-score once; rows the
+    # rounded repair could not bring under the HI limit fail feasibility here
+    final = np.unique(_round_settings(params, pop, lower, upper), axis=0)
+    final_scored = _evaluate_population(params, final, models)
+    tally(final_scored, len(final))
+    valid = np.flatnonzero(final_scored['fitness'] > -1e6)
+
+    order = valid[select_top_k(final_scored['tensile'][valid], valid)]
+    top = []
+    for i in order:
+        point = tuple(params['fillers'][int(v)] if axis == 'fillers' else float(v)
+                      for axis, v in zip(GRID_AXES, final[i]))
+        top.append(_candidate(point, final_scored['hi'][i], final_scored['tensile'][i],
+                              final_scored['pen'][i], params))
+
+    response = _optimize_response(top, counters['total_scanned'], counters['valid_count'],
+                                  counters['rejected_hi'], counters['rejected_pen'])
+    response['statistics'].update({
+        'model_evaluations': counters['total_scanned'],
+        'generations': generations,
+        'population': n
+    })
+    return response
+
+OPTIMIZERS = {
+    'vectorized': optimize_vectorized,
+    'chunked': optimize_chunked,
+    'parallel': optimize_parallel,
+    'adaptive': optimize_adaptive,
+    'evolution': optimize_evolution,
+    'loop': optimize_loop
+}
+
+
+def run_optimizer(data, models=None):
+    """Dispatch an /api/optimize body to the requested optimizer mode.
+
+    Exhaustive requests that fall inside a precomputed prediction cube are
+    answered from the cube without touching the forests.
+    """
+    models = active_models(models)
+    mode = data.get('mode', 'vectorized')
+    if mode not in OPTIMIZERS:
+        return {'success': False, 'error': f'Unknown optimizer mode: {mode}'}
+    params = parse_optimize_request(data)
+    if models.get('cube') is not None and mode in CUBE_MODES and data.get('use_cube', True):
+        response = optimize_from_cube(params, models['cube'])
+        if response is not None:
+            return response
+    return OPTIMIZERS[mode](params, models)
+
+# ============================================
+# PARETO FRONT
+# ============================================
+PARETO_BLOCK = 2048  # rows per vectorised sweep step in pareto_front
+PEN_WINDOW_MM = 1.0  # default width of the penetration target window
+
+
+def _staircase(col_1, col_2):
+    """2-D maxima of (col_1, col_2): col_1 ascending, col_2 strictly descending."""
+    idx = np.lexsort((-col_2, -col_1))
+    col_1, col_2 = col_1[idx], col_2[idx]
+    on_stair = col_2 > np.maximum.accumulate(np.concatenate([[-np.inf], col_2[:-1]]))
+    return col_1[on_stair][::-1], col_2[on_stair][::-1]
+
+
+def _under_staircase(stair_1, stair_2, col_1, col_2):
+    """Rows weakly dominated in (col_1, col_2) by some staircase step.
+
+    The first step at or right of a row's col_1 has the largest col_2 of
+    all steps that qualify, so one `searchsorted` answers every row.
+    """
+    pos = np.searchsorted(stair_1, col_1, side='left')
+    under = pos < len(stair_1)
+    under[under] = stair_2[pos[under]] >= col_2[under]
+    return under
+
+
+def _sorted_front(obj, block=PARETO_BLOCK):
+    """Exact non-dominated positions of `obj` (n, 3), every column maximised.
+
+    Rows are sorted lexicographically best-first, so no row can be dominated
+    by a later one, then swept in blocks against the staircase of the front
+    so far; each block's survivors are checked against each other pairwise.
+    Exact duplicates keep their first position.
+    """
+    order = np.lexsort((np.arange(len(obj)), -obj[:, 2], -obj[:, 1], -obj[:, 0]))
+    o = obj[order]
+    duplicate = np.zeros(len(o), dtype=bool)
+    duplicate[1:] = (o[1:] == o[:-1]).all(axis=1)
+    order, o = order[~duplicate], o[~duplicate]
+
+    stair_1 = np.empty(0)
+    stair_2 = np.empty(0)
+    front = []
+    for start in range(0, len(o), block):
+        chunk = o[start:start + block]
+        cand = np.flatnonzero(~_under_staircase(stair_1, stair_2, chunk[:, 1], chunk[:, 2]))
+
+        c = chunk[cand]
+        beats = (c[:, None, 1] >= c[None, :, 1]) & (c[:, None, 2] >= c[None, :, 2])
+        beats &= np.triu(np.ones((len(c), len(c)), dtype=bool), 1)
+        survivors = cand[~beats.any(axis=0)]
+        front.append(start + survivors)
+
+        stair_1, stair_2 = _staircase(np.concatenate([stair_1, chunk[survivors, 1]]),
+                                      np.concatenate([stair_2, chunk[survivors, 2]]))
+
+    return order[np.concatenate(front)] if front else order
+
+
+def pareto_front(objectives, block=PARETO_BLOCK):
+    """Indices of the non-dominated rows of an (n, 3) array, every column maximised.
+
+    Rows are ordered by column 0 only (a plain quicksort) and cut into
+    blocks that never split a run of equal column-0 values, so every row
+    in an earlier block is strictly better on column 0. A row is then
+    dominated by an earlier block exactly when the 2-D staircase of the
+    earlier fronts covers it, which one `searchsorted` per block answers.
+    Only each block's survivors get the full lexicographic treatment.
+    """
+    obj = np.asarray(objectives, dtype=float)
+    order = np.argsort(-obj[:, 0])
+    key = -obj[order, 0]
+    ends = np.unique(np.searchsorted(key, key[np.minimum(np.arange(block, len(key) + block, block),
+                                                         len(key)) - 1], side='right'))
+
+    stair_1 = np.empty(0)
+    stair_2 = np.empty(0)
+    front = []
+    start = 0
+    for end in ends:
+        rows = order[start:end]
+        rows = rows[~_under_staircase(stair_1, stair_2, obj[rows, 1], obj[rows, 2])]
+        rows = rows[_sorted_front(obj[rows], block)]
+        front.append(rows)
+        stair_1, stair_2 = _staircase(np.concatenate([stair_1, obj[rows, 1]]),
+                                      np.concatenate([stair_2, obj[rows, 2]]))
+        start = end
+
+    return np.sort(np.concatenate(front)) if front else order
+
+
+def collect_grid(params, models=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Every heat-input-feasible grid point with its predictions, scored in blocks."""
+    models = active_models(models)
+    total = int(np.prod(grid_shape(params)))
+    parts = [_empty_top()]
+    for start in range(0, total, chunk_size):
+        flat = np.arange(start, min(start + chunk_size, total), dtype=np.int64)
+        parts.append(evaluate_points(params, flat, models))
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def run_pareto(data, models=None):
+    """Non-dominated grid points over tensile, penetration window and HI margin.
+
+    Takes the /api/optimize grid parameters plus `pen_min`/`pen_max` (default
+    plate thickness to thickness + 1 mm). Penetration is scored as distance
+    outside the window, so every point inside it ties on that objective.
+    With `columnar`, the front is one array per field (grid_columns).
+    """
+    models = active_models(models)
+    params = parse_optimize_request(data)
+    pen_min = float(data.get('pen_min', params['target_pen']))
+    pen_max = float(data.get('pen_max', pen_min + PEN_WINDOW_MM))
+    total = int(np.prod(grid_shape(params)))
+
+    scored = collect_grid(params, models, params['chunk_size'])
+    deviation = np.maximum(pen_min - scored['pen'], 0) + np.maximum(scored['pen'] - pen_max, 0)
+    margin = params['max_hi'] - scored['hi']
+
+    t0 = time.perf_counter()
+    front = pareto_front(np.column_stack([scored['tensile'], -deviation, margin]))
+    sort_ms = (time.perf_counter() - t0) * 1000
+    front = front[np.lexsort((scored['index'][front], -scored['tensile'][front]))]
+
+    rows = {key: values[front] for key, values in scored.items()}
+    if data.get('columnar'):
+        points = dict(grid_columns(params, rows), Pen_Deviation_mm=deviation[front])
+    else:
+        points = grid_candidates(params, rows)
+        for point, dev in zip(points, deviation[front].tolist()):
+            point['Pen_Deviation_mm'] = dev
+
+    statistics = {
+        'total_scanned': total,
+        'evaluated': len(scored['index']),
+        'rejected_hi': total - len(scored['index']),
+        'front_size': len(front),
+        'sort_ms': sort_ms
+    }
+    if not len(front):
+        return {'success': False, 'error': 'No parameters satisfy the Heat Input limit.',
+                'statistics': statistics}
+    return {
+        'success': True,
+        'front': points,
+        'window': {'pen_min': pen_min, 'pen_max': pen_max},
+        'statistics': statistics
+    }
+
+# ============================================
+# PREDICTION CUBE
+# ============================================
+# Default cube: the UI's optimizer ranges at 1 A / 1 mm/min, both fillers,
+# a few voltage and interpass levels, at the UI's fixed arc efficiency.
+CUBE_SPEC = {
+    'current_min': 50, 'current_max': 200, 'current_step': 1,
+    'speed_min': 50, 'speed_max': 300, 'speed_step': 1,
+    'voltage_min': 20, 'voltage_max': 26, 'voltage_step': 2,
+    'interpass_min': 25, 'interpass_max': 75, 'interpass_step': 25,
+    'efficiency': 0.6
+}
+CUBE_MODES = ('vectorized', 'chunked', 'parallel')  # exhaustive modes the cube can answer
+
+
+def build_prediction_cube(models, spec=None):
+    """Predict every point of the cube grid once, as float32 arrays in GRID_AXES order.
+
+    The heat-input limit is per request, so nothing is masked here.
+    """
+    params = parse_optimize_request(dict(CUBE_SPEC, **(spec or {}),
+                                         filler_preference='both', max_heat_input=np.inf))
+    shape = grid_shape(params)
+    scored = collect_grid(params, models)
+    return {
+        'spec': spec,
+        'axes': {axis: params[axis] for axis in GRID_AXES},
+        'tensile': scored['tensile'].astype(np.float32).reshape(shape),
+        'pen': scored['pen'].astype(np.float32).reshape(shape)
+    }
+
+
+def cube_summary(cube):
+    return {
+        'shape': list(cube['tensile'].shape),
+        'points': int(cube['tensile'].size),
+        'bytes': int(cube['tensile'].nbytes + cube['pen'].nbytes)
+    }
+
+
+def _cube_positions(cube_axis, values):
+    """Cube index of every requested axis value, or None if any is off the cube."""
+    if not len(cube_axis):
+        return None
+    pos = np.minimum(np.searchsorted(cube_axis, values), len(cube_axis) - 1)
+    if not np.allclose(cube_axis[pos], values, rtol=0, atol=1e-9):
+        return None
+    return pos
+
+
+def optimize_from_cube(params, cube):
+    """Answer a grid request by slicing the cube, or None when it is not covered.
+
+    Heat input is recomputed analytically on the request grid, the
+    penetration limit is a mask on the stored predictions, and ranking uses
+    the same (tensile, grid index) order as the model-backed scan. Reported
+    predictions are the cube's float32 values.
+    """
+    index = []
+    for axis in GRID_AXES:
+        if axis == 'fillers':
+            names = cube['axes']['fillers']
+            if not set(params['fillers']) <= set(names):
+                return None
+            index.append(np.array([names.index(f) for f in params['fillers']], dtype=int))
+        else:
+            pos = _cube_positions(cube['axes'][axis], params[axis])
+            if pos is None:
+                return None
+            index.append(pos)
+
+    shape = grid_shape(params)
+    block = np.ix_(*index)
+    tensile = cube['tensile'][block].ravel()
+    pen = cube['pen'][block].ravel()
+
+    curr, spd, _, volt, _, eff = np.ix_(*(np.zeros(len(params[axis])) if axis == 'fillers'
+                                          else params[axis] for axis in GRID_AXES))
+    hi = np.broadcast_to((volt * curr * eff) / spd, shape).ravel()
+
+    hi_ok = hi <= params['max_hi']
+    valid = hi_ok & (pen >= MIN_PENETRATION_MM)
+    idx = np.flatnonzero(valid)
+    idx = idx[select_top_k(tensile[idx].astype(float), idx)]
+
+    rows = {'index': idx, 'hi': hi[idx], 'tensile': tensile[idx].astype(float), 'pen': pen[idx].astype(float)}
+    counters = {
+        'total_scanned': int(tensile.size),
+        'valid_count': int(valid.sum()),
+        'rejected_hi': int((~hi_ok).sum()),
+        'rejected_pen': int((hi_ok & ~valid).sum())
+    }
+    response = _grid_response(params, rows, counters)
+    response['source'] = 'cube'
+    return response
+
+# ============================================
+# BATCH PREDICTION
+# ============================================
+# /api/predict input -> (training-data column accepted as an alias, default)
+BATCH_INPUTS = {
+    'current': ('Current_A', 120.0),
+    'voltage': ('Voltage_V', 22.0),
+    'speed': ('Travel_Speed_mm_min', 110.0),
+    'filler': ('Filler_Type', 'ER309L'),
+    'interpass': ('Interpass_Temp_C', 25.0),
+    'efficiency': ('Efficiency', 0.6)
+}
+MAX_BATCH_ROWS = 200000
+
+
+def parse_batch(body, content_type=''):
+    """Read a /api/predict-batch body into a DataFrame of parameter sets.
+
+    Accepts CSV (text/csv), a JSON array of /api/predict objects, or a JSON
+    object holding that array under 'rows' or one array per input.
+    """
+    if 'csv' in content_type:
+        df = pd.read_csv(io.BytesIO(body), skipinitialspace=True)
+    else:
+        data = json.loads(body.decode('utf-8'))
+        if isinstance(data, dict) and 'rows' in data:
+            data = data['rows']
+        elif isinstance(data, dict) and not any(isinstance(v, list) for v in data.values()):
+            data = [data]  # a single /api/predict body
+        df = pd.DataFrame(data)
+    if len(df) > MAX_BATCH_ROWS:
+        raise ValueError(f'Batch too large: {len(df)} rows (max {MAX_BATCH_ROWS})')
+    return df
+
+
+def predict_rows(df, models=None):
+    """Heat input and predictions for every row, as columnar arrays.
+
+    Missing inputs take the /api/predict defaults; each row gives exactly
+    the numbers /api/predict would for the same parameters.
+    """
+    models = active_models(models)
+    inputs = {}
+    for name, (alias, default) in BATCH_INPUTS.items():
+        column = name if name in df else alias
+        values = df[column].fillna(default) if column in df else pd.Series(default, index=df.index)
+        inputs[name] = values.to_numpy(dtype=str if name == 'filler' else float)
+
+    hi = (inputs['voltage'] * inputs['current'] * inputs['efficiency']) / inputs['speed']
+    filler_code = (inputs['filler'] == 'ER316L').astype(float)
+    features = np.column_stack([inputs['current'], inputs['voltage'], inputs['speed'],
+                                filler_code, inputs['interpass'], hi])
+    tensile, pen = predict_batch(features, models)
+    return {
+        'count': len(df),
+        'heat_input': hi,
+        'tensile': tensile,
+        'penetration': pen
+    }
+
+# ============================================
+# CSV UPLOAD
+# ============================================
+# Rows parsed per chunk; bounds the parser's working set whatever the file size
+CSV_CHUNK_ROWS = 50000
+# Number columns are left to type inference: a chunk parses as floats at full
+# speed, and a column holding a bad value comes back as text, which from_frame
+# checks row by row so the error names the row
+CSV_DTYPES = {'Filler_Type': str}
+
+
+class BodyReader(io.RawIOBase):
+    """Read-only file over exactly length bytes of a request body."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)[:self.remaining]
+        n = self.stream.readinto(view) if len(view) else 0
+        if len(view) and not n:
+            raise ValueError(f'Upload ended {self.remaining} bytes early')
+        self.remaining -= n
+        return n
+
+    def drain(self):
+        """Discard the unread rest, so the client sees the response."""
+        buffer = bytearray(io.DEFAULT_BUFFER_SIZE)
+        try:
+            while self.readinto(buffer):
+                pass
+        except (OSError, ValueError):
+            pass
+
+
+def read_csv_dataset(stream, chunk_rows=CSV_CHUNK_ROWS, path=None):
+    """Parse a weld-record CSV from a binary stream; returns (dataset, rows read).
+
+    The stream is read and converted chunk_rows at a time, so only one chunk of
+    parsed text is alive at once. Without a path the float32 columns are the
+    only thing that grows with the file; with one, each chunk goes straight to
+    column files in that directory and the dataset comes back memory-mapped.
+    Duplicate rows are dropped from the dataset.
+    """
+    reader = pd.read_csv(stream, chunksize=chunk_rows, dtype=CSV_DTYPES, skipinitialspace=True)
+    if path is not None:
+        WeldDataset().save(path)
+        files = DatasetFiles(path)
+        rows = 0
+        with reader:
+            for chunk in reader:
+                rows = files.write(WeldDataset.from_frame(chunk, first_row=rows), rows)
+        files.commit(files.drop_duplicates(0, rows))
+        return WeldDataset.load(path), rows
+    parts = []
+    with reader:
+        for chunk in reader:
+            parts.append(WeldDataset.from_frame(chunk, first_row=sum(len(part) for part in parts)))
+    rows = WeldDataset.concat(parts)
+    parts.clear()
+    return rows.unique(), len(rows)
+
+# ============================================
+# RESULT CACHE
+# ============================================
+CACHE_SIZE = 256  # cached predict/optimize responses
+CACHE_TTL_S = 300.0
+
+
+class ResultCache:
+    """Bounded LRU of endpoint responses with a time-to-live.
+
+    Keys start with the model version, so an entry can never be served
+    against models other than the ones that produced it.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL_S):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        """Cached value for key, or None on a miss or an expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_s': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def cache_key(endpoint, version, data):
+    """Hashable key for a request body; 100 and 100.0 normalise to the same key."""
+    def normalise(value):
+        if isinstance(value, dict):
+            return tuple(sorted((k, normalise(v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(normalise(v) for v in value)
+        if isinstance(value, bool) or value is None:
+            return value
+        if isinstance(value, (int, float)):
+            return float(value)
+        return str(value)
+    return (endpoint, version, normalise(data))
+
+
+RESULT_CACHE = ResultCache()
+
+# ============================================
+# MODEL REGISTRY & TRAINING JOBS
+# ============================================
+MAX_VERSIONS = 5  # inactive versions kept in memory; older ones reload from the store
+ROLLBACK_DEPTH = 5  # versions rollback can step back through; the store keeps only these and the active one
+MAX_FINISHED_JOBS = 50  # finished jobs kept for /api/jobs/<id>
+# Server-side weld records: /api/train-model replaces them, /api/append-data
+# extends them. They can run ahead of the active models' training_data until a retrain.
+DATASET = {'current': WeldDataset()}
+DATASET_LOCK = threading.Lock()
+
+
+class ModelRegistry:
+    """Trained model sets by version, and the one being served.
+
+    Registered states are frozen into read-only mappings. Switching versions
+    is one assignment to `active`, so a request that read `active` once keeps
+    that version to the end, and no request ever sees a mix of two sets.
+    """
+
+    def __init__(self, initial, keep=MAX_VERSIONS):
+        self.active = MappingProxyType(dict(initial))
+        self.keep = keep
+        self._versions = OrderedDict()
+        self._history = []  # previously active versions, newest last (see _load_history)
+        # Serialises writers; readers never wait. Writers that also need the
+        # store take store_lock() first, as swap_models does around a promote.
+        self._lock = threading.Lock()
+
+    def register(self, state):
+        """Freeze and remember a state; returns the frozen mapping."""
+        frozen = MappingProxyType(dict(state))
+        with self._lock:
+            self._versions[frozen['version']] = frozen
+            self._versions.move_to_end(frozen['version'])
+            inactive = [v for v in self._versions if v != self.active['version']]
+            for version in inactive[:max(0, len(inactive) - self.keep)]:
+                del self._versions[version]
+        return frozen
+
+    def _get(self, version):
+        if version in self._versions:
+            return self._versions[version]
+        state = None
+        if STORE['dir'] is not None and os.path.isfile(os.path.join(STORE['dir'], str(version), 'meta.json')):
+            state = load_models(STORE['dir'], version)
+        if state is None:
+            raise ValueError(f'Unknown model version: {version}')
+        self._versions[version] = MappingProxyType(state)
+        return self._versions[version]
+
+    def _activate(self, state, publish=True):
+        self.active = state
+        if publish and STORE['dir'] is not None:
+            _write_atomic(os.path.join(STORE['dir'], 'LATEST'), state['version'])
+
+    def _load_history(self):
+        """Versions to roll back to, newest last.
+
+        With a model store the history is kept there beside LATEST, so every
+        worker process rolls back through the same versions.
+        """
+        if STORE['dir'] is not None:
+            try:
+                with open(os.path.join(STORE['dir'], 'HISTORY')) as f:
+                    self._history = f.read().split()
+            except FileNotFoundError:
+                self._history = []
+        return self._history
+
+    def _save_history(self, history):
+        self._history = history[-ROLLBACK_DEPTH:]
+        if STORE['dir'] is not None:
+            _write_atomic(os.path.join(STORE['dir'], 'HISTORY'), '\n'.join(self._history))
+
+    def promote(self, version, publish=True):
+        """Serve `version`; returns the previously active version id.
+
+        publish=False serves it in this process only, leaving LATEST and the
+        rollback history alone: for a version that could not be saved.
+        """
+        with store_lock(), self._lock:
+            state = self._get(version)
+            previous = self.active['version']
+            if publish and previous is not None and previous != version:
+                self._save_history(self._load_history() + [previous])
+            self._activate(state, publish)
+            return previous
+
+    def retained(self):
+        """Versions the store must keep: the active one and the rollback history."""
+        with self._lock:
+            return {self.active['version'], *self._load_history()}
+
+    def forget(self, versions):
+        """Drop versions removed from the store, so they are not promoted half-loaded."""
+        with self._lock:
+            for version in versions:
+                if version != self.active['version']:
+                    self._versions.pop(version, None)
+
+    def follow(self, version):
+        """Serve `version` because another process made it LATEST.
+
+        Unlike promote, this neither rewrites LATEST nor records history.
+        """
+        with self._lock:
+            if self.active['version'] != version:
+                self._activate(self._get(version), publish=False)
+
+    def rollback(self):
+        """Go back to the version that was active before the last promote."""
+        with store_lock(), self._lock:
+            history = self._load_history()
+            if not history:
+                raise ValueError('No earlier version to roll back to')
+            previous = self.active['version']
+            self._activate(self._get(history[-1]))
+            self._save_history(history[:-1])
+            return previous
+
+    def versions(self):
+        """Known versions, in memory or in the model store, oldest first."""
+        with self._lock:
+            listed = {version: {'version': version, 'n_samples': len(state['training_data']),
+                                'in_memory': True}
+                      for version, state in self._versions.items()}
+        if STORE['dir'] is not None and os.path.isdir(STORE['dir']):
+            for name in sorted(os.listdir(STORE['dir'])):
+                meta_path = os.path.join(STORE['dir'], name, 'meta.json')
+                if not name.startswith('.') and os.path.isfile(meta_path):
+                    with open(meta_path) as f:
+                        meta = json.load(f)
+                    entry = listed.setdefault(name, {'version': name, 'n_samples': meta['n_samples'],
+                                                     'in_memory': False})
+                    entry['saved_at'] = meta['saved_at']
+        active = self.active['version']
+        for entry in listed.values():
+            entry['active'] = entry['version'] == active
+        return sorted(listed.values(), key=lambda e: e.get('saved_at', float('inf')))
+
+
+REGISTRY = ModelRegistry(MODELS)
+
+
+def current_models():
+    """The active model set, pinned for the rest of the request."""
+    return REGISTRY.active
+
+
+def active_models(models):
+    """models, or the active set if None; read once, so a swap cannot mix two sets."""
+    return REGISTRY.active if models is None else models
+
+
+def swap_models(state, info=None):
+    """Register a newly trained state, save it, make it active and drop cached results.
+
+    With a model store configured the state is saved before it goes live,
+    with info (the training response) as its metadata, and stored versions
+    outside the rollback history are deleted. A state that fails to save is
+    served by this process but not published.
+    """
+    REGISTRY.register(state)
+    if STORE['dir'] is None:
+        REGISTRY.promote(state['version'])
+    else:
+        # Save, publish and prune as one step, so no other worker prunes a
+        # version between its save and its promote
+        with store_lock():
+            try:
+                save_models(state, STORE['dir'], info)
+                saved = True
+            except OSError as e:
+                print(f"Could not save models to {STORE['dir']}: {e}; serving them from memory only")
+                saved = False
+            REGISTRY.promote(state['version'], publish=saved)
+            if saved:
+                REGISTRY.forget(prune_store(STORE['dir'], REGISTRY.retained()))
+    RESULT_CACHE.clear()
+
+
+def train_from_request(data, progress=_no_progress):
+    """Train from an /api/train-model body. Returns (state, response).
+
+    Wall time is attributed to whichever progress phase was current, so the
+    response's timings_s has one entry per phase actually run.
+    """
+    timings = {}
+    clock = {'phase': 'preparing', 'since': time.perf_counter()}
+
+    def timed_progress(phase, **info):
+        now = time.perf_counter()
+        if phase != clock['phase']:
+            timings[clock['phase']] = timings.get(clock['phase'], 0.0) + now - clock['since']
+            clock.update(phase=phase, since=now)
+        progress(phase, **info)
+
+    training_data = as_dataset(data['data'])
+    model_mode = data.get('model_mode', MODEL_MODE)
+    n_jobs = min(int(data.get('n_jobs', TRAINING_CORES)), TRAINING_CORES)
+    engine = data.get('engine', INFERENCE_ENGINE)
+    t0 = time.perf_counter()
+    if data.get('out_of_core'):
+        memory_mb = float(data.get('memory_mb', OUT_OF_CORE_MEMORY_MB))
+        state, cv_scores = train_out_of_core(training_data, memory_mb, engine, model_mode, timed_progress)
+    else:
+        state, cv_scores = train_models(training_data, engine, model_mode,
+                                        timed_progress, n_jobs, data.get('validation', VALIDATION))
+    response = {
+        'success': True,
+        'n_samples': len(training_data),
+        'cv_scores': cv_scores,
+        'validation': cv_scores['method'],
+        'engine': 'flat' if state['flat'] is not None else 'sklearn',
+        'model_mode': model_mode,
+        'n_jobs': n_jobs
+    }
+    if data.get('out_of_core'):
+        response['out_of_core'] = out_of_core_plan(len(training_data), memory_mb, model_mode, engine)
+
+    # Optional dense prediction cube for instant optimize requests
+    cube_spec = data.get('precompute_cube')
+    if cube_spec:
+        timed_progress('building cube')
+        state['cube'] = build_prediction_cube(state, cube_spec if isinstance(cube_spec, dict) else None)
+        response['cube'] = cube_summary(state['cube'])
+        state['version'] = model_version(training_data, base=state['version'], cube=cube_spec)
+    timed_progress('trained')
+    response['timings_s'] = timings
+    response['train_s'] = time.perf_counter() - t0
+    return state, response
+
+
+def replace_dataset(data, staged=None):
+    """Make data (records or a WeldDataset) the server-side dataset; returns it.
+
+    With a model store the dataset is written to it and served from there
+    memory-mapped, so it survives restarts and need not fit in RAM. staged
+    is a directory in the store already holding data's columns; it is moved
+    into place rather than written again.
+    """
+    dataset = as_dataset(data)
+    with DATASET_LOCK, store_lock():
+        if dataset is not DATASET['current'] and STORE['dir'] is not None:
+            dataset = store_dataset(dataset, STORE['dir'], staged=staged)
+        DATASET['current'] = dataset
+    return dataset
+
+
+def append_dataset(data):
+    """Validate and append weld records or a dataset; returns (dataset size, rows added).
+
+    Rows already in the dataset are dropped, so rows added can be fewer
+    than were sent. With a model store the rows are appended to the stored
+    column files (DatasetFiles), a chunk at a time.
+    """
+    new = as_dataset(data)
+    with DATASET_LOCK, store_lock():
+        _follow_dataset()  # another worker may have appended since this one last looked
+        if STORE['dir'] is None:
+            dataset, added = DATASET['current'].append(new)
+            DATASET['current'] = dataset
+            return len(dataset), added
+        # Grow the stored columns in place; the dataset never has to fit in memory
+        path = os.path.join(STORE['dir'], 'dataset')
+        if not os.path.isdir(path):
+            store_dataset(DATASET['current'], STORE['dir'])
+        added = DatasetFiles(path).append(new)
+        DATASET['current'] = WeldDataset.load(path)
+        _FOLLOWED['dataset'] = _dataset_key(path)
+        return len(DATASET['current']), added
+
+
+def retrain_dataset(data, n_new, progress=_no_progress):
+    """Fold the last n_new appended rows into the models. Returns (state, response).
+
+    retrain='incremental' warm-starts extra trees, unless there are no models
+    yet or the forests would pass MAX_TREES; then, or with retrain='full',
+    everything is retrained on the whole dataset with the body's options.
+    """
+    with DATASET_LOCK:
+        dataset = DATASET['current']
+    models = current_models()
+    forest = models['joint_model'] or models['tensile_model']
+    if (data.get('retrain', 'incremental') == 'incremental' and models['trained']
+            and len(forest.estimators_) + INCREMENTAL_TREES <= MAX_TREES):
+        progress('growing trees')
+        t0 = time.perf_counter()
+        state, report = update_models(models, dataset, n_new)
+        if models['cube'] is not None:
+            progress('building cube')
+            state['cube'] = build_prediction_cube(state, models['cube']['spec'])
+        response = dict(report, success=True, retrain='incremental', n_samples=len(dataset),
+                        train_s=time.perf_counter() - t0)
+        return state, response
+    state, response = train_from_request(dict(data, data=dataset), progress)
+    response['retrain'] = 'full'
+    return state, response
+
+
+# One training at a time; later submissions wait in the executor's queue.
+# The old models keep serving until swap_models installs the new ones.
+TRAINING_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='training')
+JOBS = OrderedDict()
+JOBS_LOCK = threading.Lock()
+
+
+def _update_job(job, **fields):
+    with JOBS_LOCK:
+        job.update(fields)
+        if STORE['shared']:
+            _publish_job(job)
+
+
+def _run_training_job(job, task):
+    _update_job(job, status='running', phase='preparing', started=time.time())
+
+    def progress(phase, **info):
+        _update_job(job, phase=phase, progress=dict(job['progress'], **info))
+
+    try:
+        state, response = task(progress)
+        progress('swapping')
+        swap_models(state, response)
+        _update_job(job, status='done', phase='done', result=response, finished=time.time())
+    except Exception as e:
+        _update_job(job, status='failed', phase='failed', error=str(e), finished=time.time())
+
+
+def run_training(task):
+    """Run task(progress) -> (state, response) on the training thread and wait.
+
+    Training and swapping happen only there, one job at a time, so the request
+    threads never write models themselves. Returns the response.
+    """
+    def train_and_swap():
+        state, response = task(_no_progress)
+        swap_models(state, response)
+        return response
+    return TRAINING_EXECUTOR.submit(train_and_swap).result()
+
+
+def submit_training_job(task):
+    """Queue task(progress) -> (state, response) and return its job id straight away."""
+    job = {
+        'id': uuid.uuid4().hex[:12],
+        'status': 'queued',
+        'phase': 'queued',
+        'progress': {},
+        'submitted': time.time(),
+        'started': None,
+        'finished': None,
+        'result': None,
+        'error': None
+    }
+    with JOBS_LOCK:
+        JOBS[job['id']] = job
+        finished = [job_id for job_id, j in JOBS.items() if j['finished'] is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del JOBS[job_id]
+        if STORE['shared']:
+            _publish_job(job)
+    TRAINING_EXECUTOR.submit(_run_training_job, job, task)
+    return job['id']
+
+
+def job_status(job_id):
+    """Snapshot of a job with its elapsed time, or None if unknown."""
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        if job is not None:
+            job = dict(job, progress=dict(job['progress']))
+    if job is None and STORE['shared']:
+        job = _read_job(job_id)  # queued on another worker
+    if job is None:
+        return None
+    job['elapsed_s'] = (job['finished'] or time.time()) - job['submitted']
+    return job
+
+# ============================================
+# MODEL STORE
+# ============================================
+# <MODEL_DIR>/<version>/ holds one trained state; LATEST names the active one.
+# Arrays (flat engine, cube) load memory-mapped; the sklearn forests, which
+# unpickle slowly when large, load on first use.
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+FOREST_KEYS = ('tensile_model', 'penetration_model', 'joint_model')
+STORE = {
+    'dir': None,  # set by run_server; None keeps models in memory only
+    'shared': False  # pre-fork workers: several processes use the store at once
+}
+# Stored datasets are scanned this many rows at a time (see DatasetFiles)
+DATASET_SCAN_ROWS = 250000
+DEDUP_MEMORY_MB = 64  # per duplicate-detection partition when appending on disk
+DEDUP_BYTES_PER_ROW = 40  # hash, position and sort scratch per appended row
+# What this process last loaded from a shared store
+_FOLLOWED = {'dataset': None}
+_STORE_LOCK_HELD = threading.local()
+
+
+class LazyModel:
+    """A stored sklearn forest that is unpickled on first attribute access.
+
+    Pickling or deep-copying the placeholder yields the real forest.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._model is None:
+                self._model = joblib.load(self._path)
+            return self._model
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __reduce_ex__(self, protocol):
+        return _unwrap, (self.load(),)
+
+
+def _unwrap(model):
+    return model
+
+
+def _flat_arrays(flat):
+    """Flat engine as plain dicts of arrays, so files do not depend on module paths."""
+    return {key: vars(value) if isinstance(value, FlatForest) else value for key, value in flat.items()}
+
+
+def _write_atomic(path, text):
+    tmp = f'{path}.tmp-{uuid.uuid4().hex[:8]}'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class DatasetFiles:
+    """A stored dataset's column files, grown in place.
+
+    New rows are written past the committed end of every column, duplicates
+    among them are removed (drop_duplicates), and commit then rewrites the
+    .npy headers with the new length. Until then readers see only the old
+    rows, and a process that mapped the files keeps its view throughout.
+    Every step works DATASET_SCAN_ROWS at a time, so none needs the dataset
+    in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.layout = {}  # column -> (header text offset, data offset, dtype)
+        lengths = []
+        for name in os.listdir(path):
+            if not name.endswith('.npy'):
+                continue
+            with open(os.path.join(path, name), 'rb') as f:
+                version = np.lib.format.read_magic(f)
+                text = f.tell() + (2 if version == (1, 0) else 4)
+                read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                               else np.lib.format.read_array_header_2_0)
+                shape, _, dtype = read_header(f)
+                self.layout[name[:-len('.npy')]] = (text, f.tell(), dtype)
+            lengths.append(shape[0])
+        self.rows = min(lengths)  # see WeldDataset.load
+
+    def _file(self, column):
+        return os.path.join(self.path, f'{column}.npy')
+
+    def view(self, start, stop):
+        """Rows [start, stop), committed or not, memory-mapped."""
+        columns = {}
+        for column, (_, offset, dtype) in self.layout.items():
+            if stop > start:
+                columns[column] = np.memmap(self._file(column), dtype=dtype, mode='r',
+                                            offset=offset + start * dtype.itemsize, shape=(stop - start,))
+            else:
+                columns[column] = np.empty(0, dtype=dtype)
+        return WeldDataset(columns)
+
+    def write(self, dataset, at):
+        """Write dataset's rows from row `at` on; returns the row after the last written."""
+        for start in range(0, len(dataset), DATASET_SCAN_ROWS):
+            part = dataset[start:start + DATASET_SCAN_ROWS]
+            for column, (_, offset, dtype) in self.layout.items():
+                with open(self._file(column), 'r+b') as f:
+                    f.seek(offset + (at + start) * dtype.itemsize)
+                    f.write(np.ascontiguousarray(part.columns[column], dtype=dtype).data)
+        return at + len(dataset)
+
+    def drop_duplicates(self, start, stop, memory_mb=DEDUP_MEMORY_MB):
+        """Remove rows in [start, stop) equal to an earlier row; returns the new end.
+
+        Rows before start must already be unique. The new rows are split by
+        hash into partitions that fit memory_mb; each partition is checked
+        against itself and against the older rows, which are hashed a chunk
+        at a time. Kept rows then move down over the dropped ones.
+        """
+        n_new = stop - start
+        if not n_new:
+            return stop
+        scratch = os.path.join(self.path, f'.dedup-{uuid.uuid4().hex[:8]}')
+        try:
+            hashes = np.memmap(f'{scratch}.hash', dtype=np.uint64, mode='w+', shape=(n_new,))
+            drop = np.memmap(f'{scratch}.drop', dtype=bool, mode='w+', shape=(n_new,))
+            new = self.view(start, stop)
+            for lo in range(0, n_new, DATASET_SCAN_ROWS):
+                hashes[lo:lo + DATASET_SCAN_ROWS] = new[lo:lo + DATASET_SCAN_ROWS].row_hashes()
+            parts = max(1, int(np.ceil(n_new * DEDUP_BYTES_PER_ROW / (memory_mb * 2 ** 20))))
+            for part in range(parts):
+                # This partition's new rows, by hash; a stable sort keeps file order within a hash
+                idx = np.concatenate([np.flatnonzero(hashes[lo:lo + DATASET_SCAN_ROWS] % parts == part) + lo
+                                      for lo in range(0, n_new, DATASET_SCAN_ROWS)])
+                order = np.argsort(hashes[idx], kind='stable')
+                idx = idx[order]
+                h = np.asarray(hashes[idx])
+
+                # Repeats within the new rows: compare rows that share a hash
+                shared = np.zeros(len(h), dtype=bool)
+                shared[1:] |= h[1:] == h[:-1]
+                shared[:-1] |= h[1:] == h[:-1]
+                candidates = np.sort(idx[shared])
+                if len(candidates):
+                    _, first = np.unique(new[candidates]._row_keys(), return_index=True)
+                    repeat = np.ones(len(candidates), dtype=bool)
+                    repeat[first] = False
+                    drop[candidates[repeat]] = True
+
+                # Rows already present before start
+                for lo in range(0, start, DATASET_SCAN_ROWS):
+                    older = self.view(lo, min(lo + DATASET_SCAN_ROWS, start))
+                    older_hashes = older.row_hashes()
+                    matched = np.isin(older_hashes, h)
+                    if not matched.any():
+                        continue
+                    candidates = idx[np.isin(h, older_hashes[matched])]
+                    present = np.isin(new[candidates]._row_keys(), older[np.flatnonzero(matched)]._row_keys())
+                    drop[candidates[present]] = True
+
+            end = start
+            for lo in range(0, n_new, DATASET_SCAN_ROWS):
+                keep = ~np.asarray(drop[lo:lo + DATASET_SCAN_ROWS])
+                end = self.write(new[lo:lo + DATASET_SCAN_ROWS][np.flatnonzero(keep)], end)
+            del hashes, drop, new
+            return end
+        finally:
+            for suffix in ('.hash', '.drop'):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(scratch + suffix)
+
+    def commit(self, rows):
+        """Make rows the dataset's length: trim the files, then rewrite the headers."""
+        for column, (text, offset, dtype) in self.layout.items():
+            header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                           'shape': (rows,)})
+            if len(header) + 1 > offset - text:
+                raise ValueError(f'{self._file(column)}: header has no room for {rows} rows')
+            with open(self._file(column), 'r+b') as f:
+                f.truncate(offset + rows * dtype.itemsize)
+                f.seek(text)
+                f.write((header.ljust(offset - text - 1) + '\n').encode('latin-1'))
+        self.rows = rows
+
+    def append(self, dataset):
+        """Append dataset's rows that are not present yet; returns rows added."""
+        start = self.rows
+        end = self.drop_duplicates(start, self.write(dataset, start))
+        self.commit(end)
+        return end - start
+
+
+def _dataset_key(path):
+    """Changes whenever the stored dataset is replaced or grows."""
+    return os.stat(path).st_ino, os.stat(os.path.join(path, 'Filler_Code.npy')).st_size
+
+
+def store_dataset(dataset, model_dir, staged=None):
+    """Write the server-side dataset to model_dir/dataset/; returns it memory-mapped.
+
+    The new columns are written beside the old ones and swapped in by
+    renames; readers still mapping the old files keep a valid view. If
+    staged names a directory in model_dir that already holds the columns,
+    it is renamed in instead.
+    """
+    target = os.path.join(model_dir, 'dataset')
+    suffix = uuid.uuid4().hex[:8]
+    tmp, old = staged or f'{target}.tmp-{suffix}', f'{target}.old-{suffix}'
+    if staged is None:
+        dataset.save(tmp)
+    if os.path.isdir(target):
+        os.replace(target, old)
+    os.replace(tmp, target)
+    shutil.rmtree(old, ignore_errors=True)
+    _FOLLOWED['dataset'] = _dataset_key(target)
+    return WeldDataset.load(target)
+
+
+def store_lock():
+    """Exclusive lock on the store across processes; a no-op unless shared.
+
+    Re-entrant within a thread: a second flock on a new descriptor of the
+    same file would wait for the first.
+    """
+    if not STORE['shared'] or getattr(_STORE_LOCK_HELD, 'depth', 0):
+        return contextlib.nullcontext()
+    import fcntl  # pre-fork serving is POSIX-only anyway
+
+    @contextlib.contextmanager
+    def locked():
+        with open(os.path.join(STORE['dir'], '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            _STORE_LOCK_HELD.depth = 1
+            try:
+                yield
+            finally:
+                _STORE_LOCK_HELD.depth = 0
+    return locked()
+
+
+def _follow_dataset():
+    """Reload the stored dataset if another process replaced it. Needs DATASET_LOCK."""
+    if not STORE['shared']:
+        return
+    path = os.path.join(STORE['dir'], 'dataset')
+    try:
+        if _dataset_key(path) == _FOLLOWED['dataset']:
+            return
+        with store_lock():  # not while another worker is part-way through an append
+            DATASET['current'] = WeldDataset.load(path)
+            _FOLLOWED['dataset'] = _dataset_key(path)
+    except FileNotFoundError:
+        return
+
+
+def follow_store():
+    """Pick up models and data another worker process published to the store.
+
+    Called before each request in pre-fork workers; costs two small file reads
+    when nothing changed.
+    """
+    if not STORE['shared']:
+        return
+    try:
+        try:
+            with open(os.path.join(STORE['dir'], 'LATEST')) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            version = None  # nothing trained yet
+        if version and version != REGISTRY.active['version']:
+            REGISTRY.follow(version)
+        with DATASET_LOCK:
+            _follow_dataset()
+    except (OSError, ValueError) as e:
+        print(f'Could not follow the model store: {e}')  # keep serving what we have
+
+
+def _publish_job(job):
+    jobs_dir = os.path.join(STORE['dir'], 'jobs')
+    os.makedirs(jobs_dir, exist_ok=True)
+    _write_atomic(os.path.join(jobs_dir, f"{job['id']}.json"), json.dumps(job, default=float))
+    if job['finished'] is not None:
+        # Running jobs rewrite their file on every progress step, so the
+        # oldest files are finished jobs
+        paths = [entry.path for entry in os.scandir(jobs_dir) if entry.name.endswith('.json')]
+        paths.sort(key=lambda path: os.stat(path).st_mtime)
+        for path in paths[:max(0, len(paths) - MAX_FINISHED_JOBS)]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+
+def _read_job(job_id):
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(STORE['dir'], 'jobs', f'{job_id}.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_models(state, model_dir, info=None):
+    """Write a trained state under model_dir/<version>/; promoting it updates LATEST.
+
+    The directory is assembled under a temporary name and renamed into
+    place, so a crash never leaves a half-written version behind.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    version = state['version']
+    tmp = os.path.join(model_dir, f'.{version}.tmp-{uuid.uuid4().hex[:8]}')
+    os.makedirs(tmp)
+    for key in FOREST_KEYS:
+        if state[key] is not None:
+            joblib.dump(state[key], os.path.join(tmp, f'{key}.joblib'))
+    arrays = {
+        'scaler': state['scaler'],
+        'target_scaler': state['target_scaler'],
+        'flat': _flat_arrays(state['flat']) if state['flat'] is not None else None,
+        'cube': state['cube']
+    }
+    joblib.dump(arrays, os.path.join(tmp, 'arrays.joblib'))  # uncompressed, so it can be mmapped
+    state['training_data'].save(os.path.join(tmp, 'training_data'))
+    meta = {'version': version, 'saved_at': time.time(), 'n_samples': len(state['training_data']),
+            'forests': [key for key in FOREST_KEYS if state[key] is not None], 'training': info}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, default=float)
+
+    target = os.path.join(model_dir, version)
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    os.replace(tmp, target)
+    return target
+
+
+def prune_store(model_dir, keep):
+    """Delete stored versions not in keep; returns the deleted version ids.
+
+    Processes still serving a deleted version keep their memory-mapped
+    arrays; only forests not yet loaded are lost with it.
+    """
+    removed = []
+    for entry in os.scandir(model_dir):
+        if (entry.is_dir() and not entry.name.startswith('.') and entry.name not in keep
+                and os.path.isfile(os.path.join(entry.path, 'meta.json'))):
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed.append(entry.name)
+    return removed
+
+
+def load_models(model_dir, version=None):
+    """State for a stored version (default: LATEST), or None if there is none."""
+    if version is None:
+        try:
+            with open(os.path.join(model_dir, 'LATEST')) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        if not os.path.isfile(os.path.join(model_dir, version, 'meta.json')):
+            print(f'LATEST names {version}, which is not in {model_dir}; starting untrained')
+            return None
+    path = os.path.join(model_dir, version)
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    arrays = joblib.load(os.path.join(path, 'arrays.joblib'), mmap_mode='r')
+    flat = arrays['flat']
+    if flat is not None:
+        flat = {key: FlatForest.from_arrays(value) if isinstance(value, dict) else value
+                for key, value in flat.items()}
+    if os.path.isdir(os.path.join(path, 'training_data')):
+        training_data = WeldDataset.load(os.path.join(path, 'training_data'))
+    elif os.path.isfile(os.path.join(path, 'training_data.npz')):
+        training_data = WeldDataset.load(os.path.join(path, 'training_data.npz'))
+    else:
+        with open(os.path.join(path, 'training_data.json')) as f:
+            training_data = WeldDataset.from_records(json.load(f))
+    state = {key: LazyModel(os.path.join(path, f'{key}.joblib')) if key in meta['forests'] else None
+             for key in FOREST_KEYS}
+    state.update({
+        'scaler': arrays['scaler'],
+        'target_scaler': arrays['target_scaler'],
+        'flat': flat,
+        'cube': arrays['cube'],
+        'trained': True,
+        'training_data': training_data,
+        'version': meta['version']
+    })
+    return state
+
+# ============================================
+# JSON ENCODING
+# ============================================
+# Responses may hold NumPy arrays and scalars as they are; the encoder turns
+# them into JSON. orjson does so natively and is used when installed.
+def _json_default(obj):
+    """Plain Python values for what an encoder cannot serialize itself."""
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == np.float32:
+            obj = obj.astype(str).astype(float)  # shortest float32 repr, not 100.09999847
+        return obj.tolist()
+    if isinstance(obj, np.float32):
+        return float(str(obj))
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _stdlib_dumps(data):
+    return json.dumps(data, default=_json_default, separators=(',', ':')).encode('utf-8')
+
+
+def _orjson_dumps(data):
+    return orjson.dumps(data, default=_json_default,
+                        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+JSON_ENCODERS = {'json': _stdlib_dumps}
+if orjson is not None:
+    JSON_ENCODERS['orjson'] = _orjson_dumps
+JSON_ENCODER = {'name': 'orjson' if orjson is not None else 'json'}
+
+
+def use_json_encoder(name):
+    """Encode responses with JSON_ENCODERS[name]; returns the previous name."""
+    if name not in JSON_ENCODERS:
+        raise ValueError(f"Unknown JSON encoder: {name} (available: {', '.join(JSON_ENCODERS)})")
+    previous, JSON_ENCODER['name'] = JSON_ENCODER['name'], name
+    return previous
+
+
+def encode_json(data):
+    """UTF-8 JSON bytes for a response body."""
+    return JSON_ENCODERS[JSON_ENCODER['name']](data)
+
+# ============================================
+# HTTP REQUEST HANDLER
+# ============================================
+REQUEST_TIMEOUT_S = 5.0  # threaded servers: a connection that sends no request in time is closed
+class RequestHandler(BaseHTTPRequestHandler):
+    # The threaded servers answer one request per connection (HTTP/1.0): an
+    # idle keep-alive connection would hold a pool thread. Persistent
+    # connections are the asyncio server's job (serve_async). Every response
+    # still carries Content-Length.
+    timeout = REQUEST_TIMEOUT_S
+    # Headers and body go out in separate writes; with Nagle on, the body can
+    # wait for the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        """Handle GET requests."""
+        follow_store()
+        if self.path == '/' or self.path == '/index.html':
+            self.send_page(UI_PAGE)
+        elif self.path == '/api/check-model':
+            models = current_models()
+            self.send_json({
+                'trained': models['trained'],
+                'n_samples': len(models['training_data']) if models['training_data'] else 0,
+                'cube': cube_summary(models['cube']) if models['cube'] is not None else None,
+                'cache': RESULT_CACHE.stats(),
+                'memory': {
+                    'training_data': models['training_data'].memory() if models['training_data'] else None,
+                    'dataset': DATASET['current'].memory()
+                },
+                'model_version': models['version']
+            })
+        elif self.path == '/api/models':
+            self.send_json({'success': True, 'active': current_models()['version'],
+                            'versions': REGISTRY.versions()})
+        elif self.path.startswith('/api/jobs/'):
+            job = job_status(self.path[len('/api/jobs/'):])
+            if job is None:
+                self.send_json({'success': False, 'error': 'Unknown job'})
+            else:
+                self.send_json({'success': True, 'job': job})
+        else:
+            self.send_error(404)
+    
+    def do_POST(self):
+        """Handle POST requests."""
+        follow_store()
+        # Uploads are streamed from the socket, so the body is left unread here
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/api/upload-csv':
+            self.handle_upload_csv(urllib.parse.parse_qs(url.query))
+            return
+        
+        if 'chunked' in self.headers.get('Transfer-Encoding', ''):
+            self.send_error(411)  # the body's length is unknown, so the connection cannot be reused
+            return
+        content_length = int(self.headers.get('Content-Length', 0))
+        post_data = self.rfile.read(content_length)
+        
+        # Batch bodies may be CSV, so they are parsed by the handler
+        if self.path == '/api/predict-batch':
+            self.handle_predict_batch(post_data)
+            return
+        
+        try:
+            data = json.loads(post_data.decode('utf-8'))
+        except:
+            data = {}
+        
+        if self.path == '/api/generate-demo':
+            self.handle_generate_demo(data)
+        elif self.path == '/api/train-model':
+            self.handle_train_model(data)
+        elif self.path == '/api/append-data':
+            self.handle_append_data(data)
+        elif self.path == '/api/predict':
+            self.handle_predict(data)
+        elif self.path == '/api/optimize':
+            self.handle_optimize(data)
+        elif self.path == '/api/pareto':
+            self.handle_pareto(data)
+        elif self.path == '/api/models/promote':
+            self.handle_promote(data)
+        elif self.path == '/api/models/rollback':
+            self.handle_rollback(data)
+        else:
+            self.send_error(404)
+    
+    def send_page(self, page):
+        """Send a pre-encoded page (encode_page), or 304 if the client's copy is current."""
+        coding = pick_encoding(self.headers.get('Accept-Encoding', ''), page)
+        body, etag = page[coding]
+        known = [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]
+        fresh = etag in known or f'W/{etag}' in known or '*' in known
+        self.send_response(304 if fresh else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')  # always revalidate; a 304 is cheap
+        self.send_header('Vary', 'Accept-Encoding')
+        if not fresh:
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            if coding != 'identity':
+                self.send_header('Content-Encoding', coding)
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not fresh:
+            self.wfile.write(body)
+    
+    def send_json(self, data):
+        body = encode_json(data)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def handle_generate_demo(self, data):
+        """Generate synthetic welding data."""
+        samples = generate_demo_data(data.get('voltage', 22), data.get('efficiency', 0.6))
+        if data.get('columnar'):
+            self.send_json({'success': True, 'columns': records_to_columns(samples), 'count': len(samples)})
+            return
+        self.send_json({'success': True, 'data': samples, 'count': len(samples)})
+    
+    def handle_upload_csv(self, query):
+        """Stream a weld-record CSV body into the server-side dataset."""
+        if 'Content-Length' not in self.headers:
+            self.close_connection = True  # the unread body would be taken for the next request
+            self.send_json({'success': False, 'error': 'Content-Length required'})
+            return
+        body = BodyReader(self.rfile, int(self.headers['Content-Length']))
+        mode = query.get('mode', ['replace'])[0]
+        # With a store the upload is parsed straight to column files beside
+        # the dataset, so it never has to fit in memory
+        staged = None
+        if STORE['dir'] is not None:
+            staged = os.path.join(STORE['dir'], f'dataset.upload-{uuid.uuid4().hex[:8]}')
+        try:
+            if mode not in ('replace', 'append'):
+                raise ValueError(f'Unknown upload mode: {mode}')
+            t0 = time.perf_counter()
+            uploaded, rows = read_csv_dataset(io.BufferedReader(body), path=staged)
+            if mode == 'append':
+                n_samples, added = append_dataset(uploaded)
+            else:
+                n_samples = added = len(replace_dataset(uploaded, staged=staged))
+                staged = None  # now the stored dataset
+            with DATASET_LOCK:
+                dataset = DATASET['current']
+            self.send_json({
+                'success': True,
+                'mode': mode,
+                'rows': rows,
+                'added': added,
+                'duplicates': rows - added,
+                'n_samples': n_samples,
+                'preview': dataset[:10].records(),
+                'memory': dataset.memory(),
+                'parse_s': time.perf_counter() - t0
+            })
+        except Exception as e:
+            body.drain()
+            self.send_json({'success': False, 'error': str(e)})
+        finally:
+            if staged is not None:
+                shutil.rmtree(staged, ignore_errors=True)
+
+    def handle_train_model(self, data):
+        """Train Random Forest models, inline or as a background job.
+
+        With use_dataset, trains on the server-side dataset (an uploaded CSV)
+        instead of the records in the body.
+        """
+        if data.get('use_dataset'):
+            with DATASET_LOCK:
+                training_data = DATASET['current']
+        else:
+            training_data = data.get('data', [])
+        
+        if len(training_data) < 5:
+            self.send_json({'success': False, 'error': 'Need at least 5 samples'})
+            return
+        
+        try:
+            dataset = as_dataset(training_data)
+            if len(dataset) < 5:
+                raise ValueError('Need at least 5 distinct samples')
+            replace_dataset(dataset)
+            data = dict(data, data=dataset)
+            duplicates = len(training_data) - len(dataset)
+            
+            if data.get('background'):
+                job_id = submit_training_job(lambda progress: train_from_request(data, progress))
+                self.send_json({'success': True, 'job_id': job_id, 'status_url': f'/api/jobs/{job_id}',
+                                'duplicates': duplicates})
+                return
+            
+            response = run_training(lambda progress: train_from_request(data, progress))
+            self.send_json(dict(response, duplicates=duplicates))
+        except Exception as e:
+            self.send_json({'success': False, 'error': str(e)})
+
+    def handle_append_data(self, data):
+        """Append weld records to the server-side dataset and fold them in."""
+        records = data.get('data', [])
+        try:
+            retrain = data.get('retrain', 'incremental')
+            if retrain not in ('incremental', 'full', 'none'):
+                raise ValueError(f'Unknown retrain mode: {retrain}')
+            n_samples, added = append_dataset(records)
+            response = {'success': True, 'appended': added, 'duplicates': len(records) - added,
+                        'n_samples': n_samples}
+            if retrain == 'none' or not added:
+                self.send_json(dict(response, retrain='none'))
+                return
+            if n_samples < 5:
+                self.send_json(dict(response, retrain='none', note='Need at least 5 samples to train'))
+                return
+            
+            task = lambda progress: retrain_dataset(data, added, progress)
+            if data.get('background'):
+                job_id = submit_training_job(task)
+                self.send_json(dict(response, job_id=job_id, status_url=f'/api/jobs/{job_id}'))
+                return
+            
+            result = run_training(task)
+            self.send_json(dict(result, appended=added, duplicates=len(records) - added))
+        except Exception as e:
+            self.send_json({'success': False, 'error': str(e)})
+
+    def handle_predict(self, data):
+        """Predict outcomes based on parameters."""
+        models = current_models()
+        if not models['trained']:
+            self.send_json({'success': False, 'error': 'No trained model found'})
+            return
+
+        try:
+            # Extract inputs
+            current = float(data.get('current', 120))
+            voltage = float(data.get('voltage', 22))
+            speed = float(data.get('speed', 110))
+            filler = data.get('filler', 'ER309L')
+            interpass = float(data.get('interpass', 25))
+            efficiency = float(data.get('efficiency', 0.6))
+            
+            key = cache_key('predict', models['version'], (current, voltage, speed, filler, interpass, efficiency))
+            cached = RESULT_CACHE.get(key)
+            if cached is not None:
+                self.send_json(cached)
+                return
+            
+            # Calculate Heat Input
+            hi = (voltage * current * efficiency) / speed
+            
+            # Prepare feature vector
+            filler_code = 1 if filler == 'ER316L' else 0
+            features = np.array([[current, voltage, speed, filler_code, interpass, hi]])
+            
+            # Scale and predict
+            tensile, pen = predict_batch(features, models)
+            
+            response = {
+                'success': True,
+                'prediction': {
+                    'tensile': tensile[0],
+                    'penetration': pen[0]
+                },
+                'heat_input': hi,
+                'model_version': models['version']
+            }
+            RESULT_CACHE.put(key, response)
+            self.send_json(response)
+        except Exception as e:
+            self.send_json({'success': False, 'error': str(e)})
+
+    def handle_predict_batch(self, body):
+        """Predict outcomes for many parameter sets in one pass."""
+        models = current_models()
+        if not models['trained']:
+            self.send_json({'success': False, 'error': 'No trained model found'})
+            return
+
+        try:
+            df = parse_batch(body, self.headers.get('Content-Type', ''))
+            self.send_json(dict(predict_rows(df, models), success=True, model_version=models['version']))
+        except Exception as e:
+            self.send_json({'success': False, 'error': str(e)})
+
+    def handle_optimize(self, data):
+        """Find optimal parameters."""
+        models = current_models()
+        if not models['trained']:
+            self.send_json({'success': False, 'error': 'No trained model found'})
+            return
+
+        try:
+            # Every mode is deterministic (evolution seeds its RNG, default 42)
+            key = cache_key('optimize', models['version'], data)
+            response = RESULT_CACHE.get(key)
+            if response is None:
+                response = dict(run_optimizer(data, models), model_version=models['version'])
+                if response.get('success'):
+                    RESULT_CACHE.put(key, response)
+            if data.get('columnar') and response.get('success'):
+                response = dict(response, top5=records_to_columns(response['top5']))
+            self.send_json(response)
+        except Exception as e:
+            self.send_json({'success': False, 'error': str(e)})
+
+    def handle_pareto(self, data):
+        """Trade-off front over tensile, penetration window and HI margin."""
+        models = current_models()
+        if not models['trained']:
+            self.send_json({'success': False, 'error': 'No trained model found'})
+            return
+
+        try:
+            self.send_json(dict(run_pareto(data, models), model_version=models['version']))
+        except Exception as e:
+            self.send_json({'success': False, 'error': str(e)})
+
+    def handle_promote(self, data):
+        """Serve a registered or stored model version."""
+        try:
+            previous = REGISTRY.promote(data.get('version'))
+            self.send_json({'success': True, 'active': current_models()['version'], 'previous': previous})
+        except Exception as e:
+            self.send_json({'success': False, 'error': str(e)})
+
+    def handle_rollback(self, data):
+        """Return to the version that was serving before the last promote."""
+        try:
+            previous = REGISTRY.rollback()
+            self.send_json({'success': True, 'active': current_models()['version'], 'previous': previous})
+        except Exception as e:
+            self.send_json({'success': False, 'error': str(e)})
+
+# ============================================
+# CONCURRENT SERVER
+# ============================================
+# Each request reads one immutable model snapshot (current_models) and all
+# training and swapping runs on TRAINING_EXECUTOR, so request threads only
+# ever read models. SERVER_QUEUE accepted connections may wait for a thread;
+# past that the server answers 503 at once.
+SERVER_THREADS = 8
+SERVER_QUEUE = 64
+REJECT_LINGER_S = 1.0  # how long a turned-away client may keep sending before its socket is closed
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that serves connections on a fixed pool of threads."""
+
+    request_queue_size = SERVER_QUEUE  # listen backlog
+
+    def __init__(self, server_address, handler_class, threads=SERVER_THREADS, queue_size=SERVER_QUEUE,
+                 bind_and_activate=True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.rejected = 0
+        self.turned_away = queue.SimpleQueue()  # answered sockets for _reap to close
+        self.workers = [threading.Thread(target=self._serve, name=f'http-{i}', daemon=True)
+                        for i in range(threads)]
+        self.workers.append(threading.Thread(target=self._reap, name='http-reaper', daemon=True))
+        for worker in self.workers:
+            worker.start()
+
+    def process_request(self, request, client_address):
+        try:
+            self.pending.put_nowait((request, client_address))
+        except queue.Full:
+            self.rejected += 1
+            self._reject(request)
+
+    def _reject(self, request):
+        """Answer 503 without blocking the accepting thread.
+
+        The response fits an empty send buffer, so a non-blocking send writes
+        it whole. Closing while the client's request is still unread would
+        reset the connection before it reads the 503, so _reap closes the
+        socket once the client has finished sending.
+        """
+        body = json.dumps({'success': False, 'error': 'Server busy, retry shortly'}).encode('utf-8')
+        try:
+            request.setblocking(False)
+            request.send(b'HTTP/1.0 503 Service Unavailable\r\nContent-Type: application/json\r\n'
+                         b'Retry-After: 1\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+            request.shutdown(socket.SHUT_WR)
+        except OSError:
+            request.close()
+            return
+        self.turned_away.put(request)
+
+    def _reap(self):
+        """Drain and close rejected sockets, all from one thread.
+
+        A socket is closed when its client closes or after REJECT_LINGER_S.
+        """
+        deadlines = {}
+        with selectors.DefaultSelector() as selector:
+            while True:
+                while True:
+                    try:
+                        request = self.turned_away.get(block=not deadlines)
+                    except queue.Empty:
+                        break
+                    if request is None:
+                        for request in deadlines:
+                            request.close()
+                        return
+                    selector.register(request, selectors.EVENT_READ)
+                    deadlines[request] = time.monotonic() + REJECT_LINGER_S
+                done = []
+                for key, _ in selector.select(timeout=0.01):
+                    try:
+                        if key.fileobj.recv(65536):
+                            continue
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        pass
+                    done.append(key.fileobj)
+                now = time.monotonic()
+                done.extend(request for request, deadline in deadlines.items() if deadline <= now)
+                for request in set(done):
+                    selector.unregister(request)
+                    del deadlines[request]
+                    request.close()
+
+    def _serve(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        for _ in self.workers[:-1]:
+            self.pending.put(None)
+        self.turned_away.put(None)
+        for worker in self.workers:
+            worker.join()
+
+
+def _serve_on(listener, threads):
+    """A server for this process that accepts on listener's already-bound socket."""
+    if threads:
+        server = PooledHTTPServer(listener.server_address, RequestHandler, threads, bind_and_activate=False)
+    else:
+        server = HTTPServer(listener.server_address, RequestHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = listener.socket
+    server.server_name, server.server_port = listener.server_name, listener.server_port
+    return server
+
+
+def serve_forked(listener, processes, threads=SERVER_THREADS):
+    """Pre-fork `processes` workers that all accept on listener, and keep them running.
+
+    Call after the models are loaded. Forests are unpickled first and the heap
+    frozen, so workers share them copy-on-write; stored arrays are memory-mapped
+    and shared through the page cache. Workers follow LATEST and the stored
+    dataset (follow_store), so a retrain in one reaches all. POSIX only.
+    """
+    for key in FOREST_KEYS:
+        if isinstance(current_models()[key], LazyModel):
+            current_models()[key].load()
+    STORE['shared'] = True
+    gc.freeze()
+    workers = {}
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            code = 0
+            try:
+                _serve_on(listener, threads).serve_forever()
+            except (KeyboardInterrupt, SystemExit):
+                pass
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)  # never run the parent's cleanup in a child
+        workers[pid] = time.monotonic()
+
+    for _ in range(processes):
+        spawn()
+    try:
+        while True:
+            pid, status = os.wait()
+            started = workers.pop(pid, None)
+            if started is not None:
+                print(f'Worker {pid} exited (status {status}); starting a new one')
+                if time.monotonic() - started < 1:
+                    time.sleep(1)  # do not spin on a worker that dies at start-up
+                spawn()
+    except KeyboardInterrupt:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in workers:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        listener.server_close()
+
+
+# ============================================
+# ASYNCIO SERVER
+# ============================================
+# One event loop holds every connection; an idle keep-alive connection costs a
+# coroutine and its buffers, not a thread. The UI page is served on the loop;
+# every API route (predict, optimize, training, /api/models reading the store,
+# ...) runs on ASYNC_EXECUTOR, so file reads never stall the loop.
+ASYNC_WORKERS = SERVER_THREADS
+ASYNC_IDLE_TIMEOUT_S = 300.0  # keep-alive connections idle this long are closed
+ASYNC_MAX_BODY = 64 * 1024 * 1024  # request bodies are read whole here
+ASYNC_EXECUTOR = ThreadPoolExecutor(max_workers=ASYNC_WORKERS, thread_name_prefix='async-handler')
+
+
+class AsyncExchange(RequestHandler):
+    """One request run through RequestHandler's routes, without a socket.
+
+    The response is collected instead of written, so the asyncio server can
+    send it; status codes, headers and JSON bodies are the threaded server's.
+    """
+
+    def __init__(self, command, path, headers, body):
+        self.command, self.path, self.headers = command, path, headers
+        self.rfile = io.BytesIO(body)
+        self.wfile = io.BytesIO()
+        self.status = 200
+        self.response_headers = []
+        self.close_connection = False
+
+    def send_response(self, code, message=None):
+        self.status = code
+
+    def send_header(self, keyword, value):
+        self.response_headers.append((keyword, value))
+
+    def end_headers(self):
+        pass
+
+    def send_error(self, code, message=None, explain=None):
+        self.status = code
+        self.response_headers = [('Content-Type', 'text/plain')]
+        self.wfile = io.BytesIO(f'{code} {message or HTTPStatus(code).phrase}'.encode('utf-8'))
+
+
+def _http_response(status, headers, body, keep_alive):
+    head = [f'HTTP/1.1 {status} {HTTPStatus(status).phrase}']
+    head += [f'{keyword}: {value}' for keyword, value in headers
+             if keyword.lower() not in ('content-length', 'connection')]
+    if status != 304:
+        head.append(f'Content-Length: {len(body)}')
+    head.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+
+async def handle_connection(reader, writer):
+    """Serve HTTP/1.1 requests on one connection until it closes or idles out."""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), ASYNC_IDLE_TIMEOUT_S)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                return  # idle, or the client went away between requests
+            except asyncio.LimitOverrunError:
+                writer.write(_http_response(431, [], b'', False))
+                return
+            request_line, _, header_block = head.partition(b'\r\n')
+            try:
+                command, path, version = request_line.decode('latin-1').split()
+            except ValueError:
+                writer.write(_http_response(400, [], b'', False))
+                return
+            headers = http.client.parse_headers(io.BytesIO(header_block))
+            connection = headers.get('Connection', '').lower()
+            keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+            if 'chunked' in headers.get('Transfer-Encoding', ''):
+                writer.write(_http_response(411, [], b'', False))
+                return
+            try:
+                length = int(headers.get('Content-Length', 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                writer.write(_http_response(400, [], b'', False))
+                return
+            if length > ASYNC_MAX_BODY:
+                writer.write(_http_response(413, [], b'', False))
+                return
+            body = await reader.readexactly(length)
+
+            exchange = AsyncExchange(command, path, headers, body)
+            try:
+                if command == 'GET' and urllib.parse.urlsplit(path).path in ('/', '/index.html'):
+                    exchange.do_GET()  # pre-encoded page: no I/O
+                elif command in ('GET', 'POST'):
+                    handler = exchange.do_GET if command == 'GET' else exchange.do_POST
+                    await loop.run_in_executor(ASYNC_EXECUTOR, handler)
+                else:
+                    exchange.send_error(501)
+            except Exception:
+                traceback.print_exc()
+                exchange.send_error(500)
+            keep_alive = keep_alive and not exchange.close_connection
+            writer.write(_http_response(exchange.status, exchange.response_headers,
+                                        exchange.wfile.getvalue(), keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                return
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_async(host='', port=8000):
+    """Start the asyncio server; returns the asyncio.Server (already listening)."""
+    return await asyncio.start_server(handle_connection, host or None, port, backlog=1024)
+
+
+def _open_store(model_dir):
+    """Load the active models and the dataset from model_dir and keep saving there."""
+    os.makedirs(model_dir, exist_ok=True)  # store_lock needs it before the first save
+    # Pick up the last trained models: arrays are mmapped, forests load lazily
+    t0 = time.perf_counter()
+    state = load_models(model_dir)
+    if state is not None:
+        swap_models(state)
+        replace_dataset(state['training_data'])
+        print(f"Loaded models {state['version']} ({len(state['training_data'])} samples) "
+              f'in {time.perf_counter() - t0:.2f}s')
+    if os.path.isdir(os.path.join(model_dir, 'dataset')):
+        replace_dataset(WeldDataset.load(os.path.join(model_dir, 'dataset')))
+        print(f"Opened dataset ({len(DATASET['current'])} samples)")
+    STORE['dir'] = model_dir
+
+
+def run_async_server(port=8000, model_dir=MODEL_DIR, open_browser=True):
+    """Serve the app from one asyncio event loop (serve_async)."""
+    _open_store(model_dir)
+
+    async def main():
+        server = await serve_async('', port)
+        print(f'Starting MIG Optimizer Server (asyncio) on port {port}...')
+        print(f'Open http://localhost:{port} in your browser')
+        if open_browser:
+            webbrowser.open(f'http://localhost:{port}')
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print('\\nServer stopped.')
+
+
+def run_server(port=8000, model_dir=MODEL_DIR, threads=SERVER_THREADS, processes=1, open_browser=True):
+    """Serve the app; threads=0 handles one request at a time per process.
+
+    processes > 1 pre-forks that many worker processes on one listening
+    socket (serve_forked).
+    """
+    _open_store(model_dir)
+    
+    server_address = ('', port)
+    if processes > 1:
+        httpd = HTTPServer(server_address, RequestHandler)  # binds; only the workers accept
+    elif threads:
+        httpd = PooledHTTPServer(server_address, RequestHandler, threads)
+    else:
+        httpd = HTTPServer(server_address, RequestHandler)
+    print(f'Starting MIG Optimizer Server on port {port} '
+          f'({processes} processes x {threads or 1} request threads)...')
+    print(f'Open http://localhost:{port} in your browser')
+    
+    # Auto-open browser
+    if open_browser:
+        webbrowser.open(f'http://localhost:{port}')
+    
+    if processes > 1:
+        serve_forked(httpd, processes, threads)
+        print('\\nServer stopped.')
+        return
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
@@ -1742,4 +4994,14 @@ def run_server(port=8000):
         httpd.server_close()
 
 if __name__ == '__main__':
-    run_server()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='MIG Welding Optimizer server')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='request threads per process')
+    parser.add_argument('--processes', type=int, default=1, help='pre-forked worker processes (POSIX)')
+    parser.add_argument('--asyncio', action='store_true', help='serve from one asyncio event loop')
+    args = parser.parse_args()
+    if args.asyncio:
+        run_async_server(args.port)
+    else:
+        run_server(args.port, threads=args.threads, processes=args.processes)
\ No newline at end of file